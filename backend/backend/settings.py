@@ -189,4 +189,9 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),  # or as needed
-}
\ No newline at end of file
+}
+# Pharmacy carts: how long cart lines hold stock, and when untouched carts are reaped
+CART_RESERVATION_TTL = timedelta(minutes=30)
+CART_STALE_AFTER = timedelta(hours=24)
+# Lab analyzers drop ASTM / HL7 result files here for `manage.py ingest_lab_results`
+LAB_INSTRUMENT_DROP_DIR = os.environ.get('LAB_INSTRUMENT_DROP_DIR', os.path.join(BASE_DIR, 'instrument_drop'))
@@ -0,0 +1,148 @@
+import csv
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+from django.db import transaction
+from django.db.models import Q, Sum
+from .models import Invoice, InvoiceItem, ClaimBatch
+
+CHUNK_SIZE = 2000
+
+CLAIM_COLUMNS = [
+    'batch_number', 'insurance_provider', 'invoice_number', 'invoice_date',
+    'patient_mrn', 'patient_first_name', 'patient_last_name', 'insurance_number',
+    'service_code', 'description', 'quantity', 'unit_price', 'discount', 'total_price',
+]
+
+
+def unclaimed_invoices(period_start, period_end, provider=None):
+    """Insurance invoices in the period that have not been put in a claim batch yet"""
+    invoices = Invoice.objects.filter(
+        invoice_date__date__gte=period_start,
+        invoice_date__date__lte=period_end,
+        insurance_provider__isnull=False,
+        claim_batch__isnull=True,
+    ).exclude(
+        insurance_provider=''
+    ).exclude(
+        status__in=['Draft', 'Cancelled', 'Refunded']
+    ).filter(
+        Q(insurance_claim_id__isnull=True) | Q(insurance_claim_id='')
+    )
+    if provider:
+        invoices = invoices.filter(insurance_provider=provider)
+    return invoices
+
+
+def build_claim_batches(period_start, period_end, provider=None, user=None):
+    """
+    Create one ClaimBatch per provider for the period and mark its invoices
+    as claimed with a single UPDATE per provider. Returns the new batches.
+    """
+    invoices = unclaimed_invoices(period_start, period_end, provider)
+    batches = []
+    with transaction.atomic():
+        providers = invoices.order_by('insurance_provider').values_list(
+            'insurance_provider', flat=True
+        ).distinct()
+        for insurance_provider in list(providers):
+            batch = ClaimBatch.objects.create(
+                insurance_provider=insurance_provider,
+                period_start=period_start,
+                period_end=period_end,
+                created_by=user,
+            )
+            batch.invoice_count = invoices.filter(insurance_provider=insurance_provider).update(
+                claim_batch=batch,
+                insurance_claim_id=batch.batch_number,
+            )
+            batch.total_amount = Invoice.objects.filter(claim_batch=batch).aggregate(
+                total=Sum('total_amount')
+            )['total'] or Decimal('0.00')
+            batch.line_count = InvoiceItem.objects.filter(invoice__claim_batch=batch).count()
+            batch.save(update_fields=['invoice_count', 'line_count', 'total_amount'])
+            batches.append(batch)
+    return batches
+
+
+def claim_lines(batch):
+    """Stream line-level claim rows for a batch without loading it into memory"""
+    rows = InvoiceItem.objects.filter(invoice__claim_batch=batch).order_by(
+        'invoice__invoice_date', 'invoice_id', 'id'
+    ).values_list(
+        'invoice__invoice_number', 'invoice__invoice_date',
+        'invoice__patient__mrn', 'invoice__patient__first_name',
+        'invoice__patient__last_name', 'invoice__patient__insurance_number',
+        'service_item__code', 'description', 'quantity', 'unit_price',
+        'discount', 'total_price',
+    )
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        (invoice_number, invoice_date, mrn, first_name, last_name, insurance_number,
+         code, description, quantity, unit_price, discount, total_price) = row
+        yield {
+            'batch_number': batch.batch_number,
+            'insurance_provider': batch.insurance_provider,
+            'invoice_number': invoice_number,
+            'invoice_date': invoice_date.date().isoformat(),
+            'patient_mrn': mrn or '',
+            'patient_first_name': first_name or '',
+            'patient_last_name': last_name or '',
+            'insurance_number': insurance_number or '',
+            'service_code': code or '',
+            'description': description,
+            'quantity': str(quantity),
+            'unit_price': str(unit_price),
+            'discount': str(discount),
+            'total_price': str(total_price),
+        }
+
+
+class _Echo:
+    """File-like object whose write() hands the row back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def stream_claim_csv(batch):
+    writer = csv.DictWriter(_Echo(), fieldnames=CLAIM_COLUMNS)
+    yield writer.writerow(dict(zip(CLAIM_COLUMNS, CLAIM_COLUMNS)))
+    for line in claim_lines(batch):
+        yield writer.writerow(line)
+
+
+def stream_claim_xml(batch):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield (
+        f'<ClaimBatch number={quoteattr(batch.batch_number)} '
+        f'provider={quoteattr(batch.insurance_provider)} '
+        f'periodStart="{batch.period_start.isoformat()}" periodEnd="{batch.period_end.isoformat()}" '
+        f'invoiceCount="{batch.invoice_count}" lineCount="{batch.line_count}" '
+        f'totalAmount="{batch.total_amount}">\n'
+    )
+    current_invoice = None
+    for line in claim_lines(batch):
+        if line['invoice_number'] != current_invoice:
+            if current_invoice is not None:
+                yield '  </Claim>\n'
+            current_invoice = line['invoice_number']
+            patient_name = f"{line['patient_first_name']} {line['patient_last_name']}".strip()
+            yield (
+                f'  <Claim invoice={quoteattr(line["invoice_number"])} date="{line["invoice_date"]}">\n'
+                f'    <Patient mrn={quoteattr(line["patient_mrn"])} '
+                f'memberNumber={quoteattr(line["insurance_number"])}>'
+                f'{escape(patient_name)}</Patient>\n'
+            )
+        yield (
+            f'    <Line code={quoteattr(line["service_code"])} quantity="{line["quantity"]}" '
+            f'unitPrice="{line["unit_price"]}" discount="{line["discount"]}" '
+            f'total="{line["total_price"]}">{escape(line["description"])}</Line>\n'
+        )
+    if current_invoice is not None:
+        yield '  </Claim>\n'
+    yield '</ClaimBatch>\n'
+
+
+CLAIM_EXPORTERS = {
+    'csv': ('text/csv', stream_claim_csv),
+    'xml': ('application/xml', stream_claim_xml),
+}
@@ -0,0 +1,49 @@
+"""
+Management command to batch unclaimed insurance invoices and write claim files
+Usage: python manage.py build_insurance_claims --start 2026-01-01 --end 2026-01-31 [--provider NHIS] [--output-dir claims/] [--format csv]
+"""
+import os
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from billing.claims import build_claim_batches, CLAIM_EXPORTERS
+
+
+class Command(BaseCommand):
+    help = 'Batch unclaimed insurance invoices per provider and export claim files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Period start (YYYY-MM-DD). Defaults to the first of last month')
+        parser.add_argument('--end', help='Period end (YYYY-MM-DD). Defaults to the end of last month')
+        parser.add_argument('--provider', help='Only batch this insurance provider')
+        parser.add_argument('--output-dir', help='Write claim files to this directory')
+        parser.add_argument('--format', dest='file_format', choices=sorted(CLAIM_EXPORTERS), default='csv')
+
+    def handle(self, *args, **options):
+        this_month = date.today().replace(day=1)
+        default_end = date.fromordinal(this_month.toordinal() - 1)
+        period_start = parse_date(options['start']) if options['start'] else default_end.replace(day=1)
+        period_end = parse_date(options['end']) if options['end'] else default_end
+        if not period_start or not period_end or period_end < period_start:
+            raise CommandError('Invalid claim period')
+
+        batches = build_claim_batches(period_start, period_end, provider=options['provider'])
+        if not batches:
+            self.stdout.write('No unclaimed insurance invoices in this period')
+            return
+
+        for batch in batches:
+            self.stdout.write(
+                f"{batch.batch_number}: {batch.insurance_provider} - {batch.invoice_count} invoices, "
+                f"{batch.line_count} lines, ₵{batch.total_amount}"
+            )
+            if options['output_dir']:
+                os.makedirs(options['output_dir'], exist_ok=True)
+                _, exporter = CLAIM_EXPORTERS[options['file_format']]
+                path = os.path.join(options['output_dir'], f"{batch.batch_number}.{options['file_format']}")
+                with open(path, 'w', encoding='utf-8', newline='') as handle:
+                    for chunk in exporter(batch):
+                        handle.write(chunk)
+                self.stdout.write(f"  wrote {path}")
+
+        self.stdout.write(self.style.SUCCESS(f'Created {len(batches)} claim batch(es)'))
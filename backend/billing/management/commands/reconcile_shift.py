@@ -0,0 +1,41 @@
+"""
+Management command to print or close a cashier shift reconciliation
+Usage: python manage.py reconcile_shift [--start 2026-01-31T08:00] [--end 2026-01-31T20:00] [--close]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from billing.reconciliation import parse_shift_window, shift_report, close_shift
+
+
+class Command(BaseCommand):
+    help = 'Summarise payments per cashier and payment method for a shift, optionally closing it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Shift start (ISO date or datetime). Defaults to today 00:00')
+        parser.add_argument('--end', help='Shift end (ISO date or datetime). Defaults to now')
+        parser.add_argument('--close', action='store_true', help='Snapshot the shift so it is never recomputed')
+
+    def handle(self, *args, **options):
+        try:
+            start, end = parse_shift_window(options['start'], options['end'])
+            if options['close']:
+                close_shift(start, end)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        report = shift_report(start, end)
+        status = 'CLOSED' if report['closed'] else 'OPEN'
+        self.stdout.write(f"Shift {report['shift_start']} -> {report['shift_end']} [{status}]")
+        for cashier in report['cashiers']:
+            self.stdout.write(
+                f"  {cashier['cashier_name']}: {cashier['payment_count']} payments, "
+                f"₵{cashier['total_amount']:.2f}, {cashier['receipts_issued']} receipts, "
+                f"{cashier['reprint_count']} reprints"
+            )
+            for method in cashier['methods']:
+                self.stdout.write(
+                    f"    {method['payment_method']}: {method['payment_count']} x ₵{method['total_amount']:.2f}"
+                )
+        totals = report['totals']
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {totals['payment_count']} payments, ₵{totals['total_amount']:.2f}"
+        ))
@@ -0,0 +1,38 @@
+# Link invoice lines to inventory so stock is deducted by key, not by name
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_pharmacy_lines(apps, schema_editor):
+    """Backfill inventory_item for existing lines whose description matches a pharmacy item"""
+    Inventory = apps.get_model('inventory', 'Inventory')
+    InvoiceItem = apps.get_model('billing', 'InvoiceItem')
+
+    inventory_by_name = {}
+    for pk, name in Inventory.objects.filter(department='PHARMACY').order_by('-id').values_list('id', 'name'):
+        inventory_by_name[name] = pk
+
+    for description, inventory_pk in inventory_by_name.items():
+        InvoiceItem.objects.filter(
+            description=description,
+            service_item__isnull=True,
+            inventory_item__isnull=True
+        ).update(inventory_item_id=inventory_pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_add_walkin_support'),
+        ('inventory', '0004_inventoryadjustment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='inventory_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoice_items', to='inventory.inventory'),
+        ),
+        migrations.RunPython(link_pharmacy_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_invoiceitem_inventory_item'),
+        ('patients', '0001_initial'),
+        ('visits', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['invoice_date', 'id'], name='billing_inv_invoice_8d624e_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_invoice_date_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shift_start', models.DateTimeField()),
+                ('shift_end', models.DateTimeField()),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-shift_start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShiftReconciliationLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cashier_name', models.CharField(max_length=300)),
+                ('payment_method', models.CharField(choices=[('Cash', 'Cash'), ('Mobile Money', 'Mobile Money'), ('Card', 'Credit/Debit Card'), ('Insurance', 'Insurance'), ('Bank Transfer', 'Bank Transfer'), ('Other', 'Other')], max_length=50)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('receipts_issued', models.IntegerField(default=0)),
+                ('reprint_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['cashier_name', 'payment_method'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date', 'received_by'], name='billing_pay_payment_618a6d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['issued_date', 'cashier'], name='billing_rec_issued__f5433a_idx'),
+        ),
+        migrations.AddField(
+            model_name='shiftreconciliation',
+            name='closed_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='closed_shifts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shiftreconciliationline',
+            name='cashier',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shift_reconciliation_lines', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shiftreconciliationline',
+            name='reconciliation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lines', to='billing.shiftreconciliation'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='shiftreconciliation',
+            unique_together={('shift_start', 'shift_end')},
+        ),
+    ]
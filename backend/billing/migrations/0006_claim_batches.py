@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_shift_reconciliation'),
+        ('patients', '0001_initial'),
+        ('visits', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_number', models.CharField(editable=False, max_length=50, unique=True)),
+                ('insurance_provider', models.CharField(max_length=100)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('line_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_claim_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='claim_batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='billing.claimbatch'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['insurance_provider', 'claim_batch', 'invoice_date'], name='billing_inv_insuran_0fa763_idx'),
+        ),
+    ]
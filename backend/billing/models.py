@@ -6,6 +6,7 @@ from visits.models import Visit
 from django.utils import timezone
 from decimal import Decimal
 import random
+import uuid
 
 def generate_invoice_number():
     """Generate unique invoice number: INV-YYYYMM-XXXX"""
@@ -81,6 +82,7 @@ class Invoice(models.Model):
     payment_method = models.CharField(max_length=50, choices=PAYMENT_METHOD_CHOICES, blank=True, null=True)
     insurance_provider = models.CharField(max_length=100, blank=True, null=True)
     insurance_claim_id = models.CharField(max_length=100, blank=True, null=True)
+    claim_batch = models.ForeignKey('ClaimBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
     
     # Dates
     invoice_date = models.DateTimeField(default=timezone.now)
@@ -121,14 +123,41 @@ class Invoice(models.Model):
         ordering = ['-invoice_date']
         indexes = [
             models.Index(fields=['invoice_number']),
+            models.Index(fields=['invoice_date', 'id']),
+            models.Index(fields=['insurance_provider', 'claim_batch', 'invoice_date']),
             models.Index(fields=['status', 'invoice_date']),
             models.Index(fields=['patient', 'invoice_date']),
         ]
 
+class ClaimBatch(models.Model):
+    """Insurance claim submission covering one provider's invoices for a period"""
+    batch_number = models.CharField(max_length=50, unique=True, editable=False)
+    insurance_provider = models.CharField(max_length=100)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    invoice_count = models.IntegerField(default=0)
+    line_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_claim_batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def save(self, *args, **kwargs):
+        if not self.batch_number:
+            provider = ''.join(ch for ch in self.insurance_provider.upper() if ch.isalnum())[:10] or 'INS'
+            self.batch_number = f"CLM-{provider}-{self.period_end.strftime('%Y%m')}-{uuid.uuid4().hex[:8].upper()}"
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.batch_number} ({self.insurance_provider})"
+    
+    class Meta:
+        ordering = ['-created_at']
+
 class InvoiceItem(models.Model):
     """Line items on an invoice"""
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
     service_item = models.ForeignKey(ServiceItem, on_delete=models.PROTECT, related_name='invoice_items', null=True, blank=True)
+    inventory_item = models.ForeignKey('inventory.Inventory', on_delete=models.SET_NULL, related_name='invoice_items', null=True, blank=True)
     description = models.CharField(max_length=500)
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default=1)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -176,6 +205,11 @@ class Payment(models.Model):
     
     def __str__(self):
         return f"Payment of {self.amount} for {self.invoice.invoice_number}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_date', 'received_by']),
+        ]
 
 class Receipt(models.Model):
     """Receipts for payments"""
@@ -196,4 +230,55 @@ class Receipt(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"Receipt {self.receipt_number} for {self.invoice.invoice_number}"
\ No newline at end of file
+        return f"Receipt {self.receipt_number} for {self.invoice.invoice_number}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['issued_date', 'cashier']),
+        ]
+
+class ShiftReconciliation(models.Model):
+    """Immutable end-of-day settlement snapshot for a closed cashier shift window"""
+    shift_start = models.DateTimeField()
+    shift_end = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    payment_count = models.IntegerField(default=0)
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='closed_shifts')
+    closed_at = models.DateTimeField(auto_now_add=True)
+    
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Closed shift reconciliations cannot be changed")
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError("Closed shift reconciliations cannot be deleted")
+    
+    def __str__(self):
+        return f"Shift {self.shift_start:%Y-%m-%d %H:%M} - {self.shift_end:%Y-%m-%d %H:%M}"
+    
+    class Meta:
+        ordering = ['-shift_start']
+        unique_together = ['shift_start', 'shift_end']
+
+class ShiftReconciliationLine(models.Model):
+    """Per cashier, per payment method totals within a closed shift"""
+    reconciliation = models.ForeignKey(ShiftReconciliation, on_delete=models.PROTECT, related_name='lines')
+    cashier = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='shift_reconciliation_lines')
+    cashier_name = models.CharField(max_length=300)
+    payment_method = models.CharField(max_length=50, choices=Invoice.PAYMENT_METHOD_CHOICES)
+    payment_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    receipts_issued = models.IntegerField(default=0)
+    reprint_count = models.IntegerField(default=0)
+    
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Closed shift reconciliations cannot be changed")
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.cashier_name} - {self.payment_method}: {self.total_amount}"
+    
+    class Meta:
+        ordering = ['cashier_name', 'payment_method']
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class InvoiceCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (invoice_date, id), so deep pages cost the same as
+    the first one. Only applied when the client asks for it with ?page_size=
+    or ?cursor=, so callers expecting a plain list keep working.
+    """
+    ordering = ('-invoice_date', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,149 @@
+import hashlib
+from html import escape
+from django.core.cache import cache
+from django.utils import timezone
+
+CLINIC_NAME = 'UrbanVital Health Consult'
+RECEIPT_WIDTH = 42  # characters per line on an 80mm thermal roll
+RECEIPT_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECEIPT_CONTENT_TYPES = {
+    'text': 'text/plain; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def receipt_cache_key(receipt, output_format):
+    """Cache key that changes whenever the receipt's invoice is updated (to the microsecond)"""
+    version = receipt.invoice.updated_at.isoformat()
+    return f"receipt:{receipt.receipt_number}:{output_format}:{version}"
+
+
+def _money(amount):
+    return f"GHS {amount:,.2f}"
+
+
+def _two_columns(left, right, width=RECEIPT_WIDTH):
+    left = left[:width - len(right) - 1]
+    return f"{left}{' ' * (width - len(left) - len(right))}{right}"
+
+
+def receipt_lines(receipt):
+    """Receipt laid out as fixed-width lines, shared by every output format"""
+    invoice = receipt.invoice
+    rule = '-' * RECEIPT_WIDTH
+    issued = timezone.localtime(receipt.issued_date).strftime('%d/%m/%Y %H:%M')
+    if receipt.cashier:
+        cashier = receipt.cashier.get_full_name() or receipt.cashier.username
+    else:
+        cashier = 'Unknown'
+    if invoice.patient:
+        customer = f"{invoice.patient.name} ({invoice.patient.mrn})"
+    elif invoice.walkin_id:
+        customer = f"Walk-in ({invoice.walkin_id})"
+    else:
+        customer = 'Walk-in Customer'
+
+    lines = [
+        CLINIC_NAME.center(RECEIPT_WIDTH),
+        'OFFICIAL RECEIPT'.center(RECEIPT_WIDTH),
+        rule,
+        f"Receipt:  {receipt.receipt_number}",
+        f"Invoice:  {invoice.invoice_number}",
+        f"Date:     {issued}",
+        f"Cashier:  {cashier}"[:RECEIPT_WIDTH],
+        f"Customer: {customer}"[:RECEIPT_WIDTH],
+        rule,
+        _two_columns('Item', 'Qty      Amount'),
+    ]
+    for item in invoice.items.all():
+        quantity = f"{item.quantity:g}"
+        lines.append(_two_columns(item.description, f"{quantity:>3} {item.total_price:>11,.2f}"))
+    lines += [
+        rule,
+        _two_columns('TOTAL', _money(invoice.total_amount)),
+        _two_columns(f"PAID ({receipt.payment_method})", _money(receipt.amount)),
+        _two_columns('BALANCE', _money(invoice.balance)),
+        rule,
+    ]
+    if receipt.notes:
+        lines.append(receipt.notes[:RECEIPT_WIDTH])
+    lines.append('Thank you. Get well soon.'.center(RECEIPT_WIDTH))
+    return lines
+
+
+def render_text(lines):
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def render_html(lines):
+    body = escape('\n'.join(lines))
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Receipt</title>'
+        '<style>body{margin:0}pre{font:12px/1.3 monospace;width:42ch;margin:8px}</style>'
+        f'</head><body><pre>{body}</pre></body></html>'
+    ).encode('utf-8')
+
+
+def render_pdf(lines):
+    """Single-page PDF in Courier sized to an 80mm roll; needs no PDF library"""
+    font_size, leading, margin = 8, 10, 12
+    width = 227  # 80mm in points
+    height = margin * 2 + leading * len(lines)
+
+    def pdf_string(text):
+        text = text.encode('latin-1', 'replace').decode('latin-1')
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    stream = [f"BT /F1 {font_size} Tf {leading} TL {margin} {height - margin - font_size} Td"]
+    stream += [f"({pdf_string(line)}) Tj T*" for line in lines]
+    stream.append('ET')
+    content = '\n'.join(stream).encode('latin-1')
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+        f"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>".encode('latin-1'),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>",
+        f"<< /Length {len(content)} >>\nstream\n".encode('latin-1') + content + b"\nendstream",
+    ]
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode('latin-1') + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode('latin-1')
+    output += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode('latin-1')
+    return bytes(output)
+
+
+RENDERERS = {
+    'text': render_text,
+    'html': render_html,
+    'pdf': render_pdf,
+}
+
+
+def get_rendered_receipt(receipt, output_format):
+    """
+    Rendered receipt bytes and their strong ETag, cached per receipt/format
+    until the invoice changes. Only a cache miss touches the invoice lines.
+    """
+    key = receipt_cache_key(receipt, output_format)
+    rendered = cache.get(key)
+    if rendered is None:
+        content = RENDERERS[output_format](receipt_lines(receipt))
+        rendered = {
+            'content': content,
+            'etag': f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        }
+        cache.set(key, rendered, RECEIPT_CACHE_TIMEOUT)
+    return rendered
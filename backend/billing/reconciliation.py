@@ -0,0 +1,190 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Sum, Case, When, F, Value, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Payment, Receipt, ShiftReconciliation, ShiftReconciliationLine
+
+
+def parse_shift_window(start_value=None, end_value=None):
+    """
+    Resolve a [start, end) shift window from ISO datetimes or dates.
+    A bare end date covers that whole day; defaults to today so far.
+    """
+    def parse(value, end_of_day=False):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"Invalid date or datetime: {value}")
+            if end_of_day:
+                day += timedelta(days=1)
+            parsed = datetime.combine(day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    now = timezone.now()
+    start = parse(start_value) if start_value else timezone.localtime(now).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    end = parse(end_value, end_of_day=True) if end_value else now
+    if end <= start:
+        raise ValueError("Shift end must be after shift start")
+    return start, end
+
+
+def _receipt_subquery(start, end, aggregate):
+    receipts = Receipt.objects.filter(
+        cashier=OuterRef('received_by'),
+        payment_method=OuterRef('payment_method'),
+        issued_date__gte=start,
+        issued_date__lt=end
+    ).order_by().values('cashier', 'payment_method').annotate(value=aggregate).values('value')
+    return Coalesce(Subquery(receipts, output_field=IntegerField()), Value(0))
+
+
+def compute_shift_lines(start, end, cashier_id=None):
+    """
+    Per cashier, per payment method counts and totals for [start, end),
+    with receipts issued and reprints folded in as correlated subqueries
+    so the whole report is a single grouped query.
+    """
+    payments = Payment.objects.filter(payment_date__gte=start, payment_date__lt=end)
+    if cashier_id:
+        payments = payments.filter(received_by_id=cashier_id)
+
+    reprints = Sum(Case(
+        When(print_count__gt=1, then=F('print_count') - 1),
+        default=Value(0),
+        output_field=IntegerField()
+    ))
+    rows = payments.order_by().values(
+        'received_by', 'received_by__username', 'received_by__first_name',
+        'received_by__last_name', 'payment_method'
+    ).annotate(
+        payment_count=Count('id'),
+        total_amount=Sum('amount'),
+        receipts_issued=_receipt_subquery(start, end, Count('id')),
+        reprint_count=_receipt_subquery(start, end, reprints),
+    ).order_by('received_by__username', 'payment_method')
+
+    lines = []
+    for row in rows:
+        full_name = f"{row['received_by__first_name'] or ''} {row['received_by__last_name'] or ''}".strip()
+        lines.append({
+            'cashier': row['received_by'],
+            'cashier_name': full_name or row['received_by__username'] or 'Unknown',
+            'payment_method': row['payment_method'],
+            'payment_count': row['payment_count'],
+            'total_amount': row['total_amount'] or Decimal('0.00'),
+            'receipts_issued': row['receipts_issued'],
+            'reprint_count': row['reprint_count'],
+        })
+    return lines
+
+
+def build_report(start, end, lines, reconciliation=None):
+    """Group flat lines by cashier and add shift totals"""
+    cashiers = {}
+    for line in lines:
+        entry = cashiers.setdefault(line['cashier'], {
+            'cashier': line['cashier'],
+            'cashier_name': line['cashier_name'],
+            'payment_count': 0,
+            'total_amount': Decimal('0.00'),
+            'receipts_issued': 0,
+            'reprint_count': 0,
+            'methods': [],
+        })
+        for key in ('payment_count', 'total_amount', 'receipts_issued', 'reprint_count'):
+            entry[key] += line[key]
+        entry['methods'].append({
+            'payment_method': line['payment_method'],
+            'payment_count': line['payment_count'],
+            'total_amount': float(line['total_amount']),
+            'receipts_issued': line['receipts_issued'],
+            'reprint_count': line['reprint_count'],
+        })
+
+    for entry in cashiers.values():
+        entry['total_amount'] = float(entry['total_amount'])
+
+    by_method = {}
+    for line in lines:
+        by_method[line['payment_method']] = by_method.get(line['payment_method'], 0) + float(line['total_amount'])
+
+    return {
+        'shift_start': start.isoformat(),
+        'shift_end': end.isoformat(),
+        'closed': reconciliation is not None,
+        'closed_at': reconciliation.closed_at.isoformat() if reconciliation else None,
+        'closed_by': reconciliation.closed_by.username if reconciliation and reconciliation.closed_by else None,
+        'cashiers': list(cashiers.values()),
+        'by_payment_method': by_method,
+        'totals': {
+            'payment_count': sum(line['payment_count'] for line in lines),
+            'total_amount': float(sum((line['total_amount'] for line in lines), Decimal('0.00'))),
+            'receipts_issued': sum(line['receipts_issued'] for line in lines),
+            'reprint_count': sum(line['reprint_count'] for line in lines),
+        },
+    }
+
+
+def covering_shift(start, end):
+    """The closed shift whose window contains [start, end), if any"""
+    return ShiftReconciliation.objects.select_related('closed_by').filter(
+        shift_start__lte=start, shift_end__gte=end
+    ).order_by('-shift_start').first()
+
+
+def shift_report(start, end, cashier_id=None):
+    """
+    Serve a window inside a closed shift from that shift's snapshot (reported
+    with the closed shift's own start and end), otherwise compute it live
+    """
+    reconciliation = covering_shift(start, end)
+    if reconciliation is None:
+        return build_report(start, end, compute_shift_lines(start, end, cashier_id))
+
+    snapshot = reconciliation.lines.all()
+    if cashier_id:
+        snapshot = snapshot.filter(cashier_id=cashier_id)
+    lines = list(snapshot.values(
+        'cashier', 'cashier_name', 'payment_method', 'payment_count',
+        'total_amount', 'receipts_issued', 'reprint_count'
+    ))
+    return build_report(reconciliation.shift_start, reconciliation.shift_end, lines, reconciliation)
+
+
+def close_shift(start, end, user=None):
+    """
+    Snapshot the shift window; raises ValueError if it overlaps a shift that
+    is already closed, so no payment is ever settled twice
+    """
+    with transaction.atomic():
+        overlapping = ShiftReconciliation.objects.select_for_update().filter(
+            shift_start__lt=end, shift_end__gt=start
+        ).order_by('shift_start').first()
+        if overlapping is not None:
+            raise ValueError(
+                f"This shift overlaps the closed shift {overlapping.shift_start.isoformat()} - "
+                f"{overlapping.shift_end.isoformat()}"
+            )
+        lines = compute_shift_lines(start, end)
+        reconciliation = ShiftReconciliation.objects.create(
+            shift_start=start,
+            shift_end=end,
+            total_amount=sum((line['total_amount'] for line in lines), Decimal('0.00')),
+            payment_count=sum(line['payment_count'] for line in lines),
+            closed_by=user,
+        )
+        ShiftReconciliationLine.objects.bulk_create([
+            ShiftReconciliationLine(reconciliation=reconciliation, cashier_id=line['cashier'], **{
+                key: value for key, value in line.items() if key != 'cashier'
+            })
+            for line in lines
+        ])
+    return reconciliation
@@ -1,6 +1,6 @@
 # billing/serializers.py
 from rest_framework import serializers
-from .models import ServiceItem, Invoice, InvoiceItem, Payment, Receipt
+from .models import ServiceItem, Invoice, InvoiceItem, Payment, Receipt, ClaimBatch
 from patients.serializers import PatientSerializer
 
 class ServiceItemSerializer(serializers.ModelSerializer):
@@ -11,16 +11,26 @@ class ServiceItemSerializer(serializers.ModelSerializer):
 class InvoiceItemSerializer(serializers.ModelSerializer):
     service_item_name = serializers.CharField(source='service_item.name', read_only=True)
     service_item_code = serializers.CharField(source='service_item.code', read_only=True)
+    inventory_item_code = serializers.CharField(source='inventory_item.item_id', read_only=True)
     
     class Meta:
         model = InvoiceItem
         fields = '__all__'
         read_only_fields = ['total_price']
         extra_kwargs = {
-            'service_item': {'required': False, 'allow_null': True}  # Make service_item optional
+            'service_item': {'required': False, 'allow_null': True},  # Make service_item optional
+            'inventory_item': {'required': False, 'allow_null': True}  # Set for stock-tracked items
         }
     
     def create(self, validated_data):
+        # Older clients send pharmacy lines by name only; link them to stock once here
+        if not validated_data.get('inventory_item') and not validated_data.get('service_item'):
+            from inventory.models import Inventory
+            validated_data['inventory_item'] = Inventory.objects.filter(
+                name=validated_data.get('description'),
+                department='PHARMACY'
+            ).order_by('id').first()
+        
         # Calculate total_price if not provided
         if 'total_price' not in validated_data:
             quantity = validated_data.get('quantity', 1)
@@ -56,6 +66,17 @@ class InvoiceSerializer(serializers.ModelSerializer):
             validated_data['status'] = 'Pending'
         return super().create(validated_data)
 
+class ClaimBatchSerializer(serializers.ModelSerializer):
+    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    
+    class Meta:
+        model = ClaimBatch
+        fields = '__all__'
+        read_only_fields = [
+            'batch_number', 'invoice_count', 'line_count', 'total_amount',
+            'created_by', 'created_at'
+        ]
+
 class PaymentSerializer(serializers.ModelSerializer):
     received_by_name = serializers.CharField(source='received_by.username', read_only=True)
     invoice_number = serializers.CharField(source='invoice.invoice_number', read_only=True)
@@ -92,7 +113,7 @@ class ReceiptSerializer(serializers.ModelSerializer):
 class InvoiceListSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.name', read_only=True)
     patient_mrn = serializers.CharField(source='patient.mrn', read_only=True)
-    items_count = serializers.IntegerField(source='items.count', read_only=True)
+    items_count = serializers.SerializerMethodField()
     items = InvoiceItemSerializer(many=True, read_only=True)
     balance = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
@@ -106,4 +127,17 @@ class InvoiceListSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'patient': {'required': False, 'allow_null': True},  # Patient can be null
             'walkin_id': {'required': False, 'allow_null': True}  # Walk-in ID is optional
-        }
\ No newline at end of file
+        }
+    
+    def get_items_count(self, obj):
+        # List views annotate the count; freshly created invoices fall back to a query
+        if hasattr(obj, 'items_count'):
+            return obj.items_count
+        return obj.items.count()
+
+class InvoiceSummarySerializer(InvoiceListSerializer):
+    """Invoice list rows without line items (?include_items=false)"""
+    class Meta(InvoiceListSerializer.Meta):
+        fields = [
+            field for field in InvoiceListSerializer.Meta.fields if field != 'items'
+        ]
\ No newline at end of file
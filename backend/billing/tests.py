@@ -1,3 +1,334 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from inventory.models import Inventory
+from patients.models import Patient
+from .models import ServiceItem, Invoice, InvoiceItem, Payment, Receipt, ShiftReconciliation
+from .claims import build_claim_batches
 
-# Create your tests here.
+
+class ProcessPaymentStockTestCase(APITestCase):
+    """Stock deduction when an invoice is fully paid"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.paracetamol = Inventory.objects.create(
+            name='Paracetamol 500mg', department='PHARMACY',
+            current_stock=10, selling_price=2
+        )
+        self.amoxicillin = Inventory.objects.create(
+            name='Amoxicillin 250mg', department='PHARMACY',
+            current_stock=1, selling_price=5
+        )
+        self.invoice = Invoice.objects.create(walkin_id='WALK-1', created_by=self.user)
+        self.invoice.refresh_from_db()
+
+    def add_line(self, item, quantity):
+        InvoiceItem.objects.create(
+            invoice=self.invoice, inventory_item=item, description=item.name,
+            quantity=quantity, unit_price=item.selling_price
+        )
+
+    def pay(self):
+        self.invoice.refresh_from_db()
+        return self.client.post(
+            f'/api/billing/invoices/{self.invoice.id}/pay/',
+            {'amount': str(self.invoice.balance), 'payment_method': 'Cash'}
+        )
+
+    def test_full_payment_deducts_linked_stock(self):
+        self.add_line(self.paracetamol, 4)
+        self.add_line(self.amoxicillin, 1)
+        response = self.pay()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.paracetamol.refresh_from_db()
+        self.amoxicillin.refresh_from_db()
+        self.assertEqual(self.paracetamol.current_stock, 6)
+        self.assertEqual(self.amoxicillin.current_stock, 0)
+
+    def test_renamed_item_is_still_deducted(self):
+        self.add_line(self.paracetamol, 2)
+        Inventory.objects.filter(pk=self.paracetamol.pk).update(name='Paracetamol 500mg Tabs')
+        self.assertEqual(self.pay().status_code, status.HTTP_201_CREATED)
+        self.paracetamol.refresh_from_db()
+        self.assertEqual(self.paracetamol.current_stock, 8)
+
+    def test_insufficient_stock_rolls_back_payment(self):
+        self.add_line(self.paracetamol, 4)
+        self.add_line(self.amoxicillin, 3)
+        response = self.pay()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(len(response.data['conflicts']), 1)
+        conflict = response.data['conflicts'][0]
+        self.assertEqual(conflict['inventory_item'], self.amoxicillin.id)
+        self.assertEqual(conflict['available'], 1)
+        self.assertEqual(Payment.objects.count(), 0)
+        self.paracetamol.refresh_from_db()
+        self.assertEqual(self.paracetamol.current_stock, 10)
+
+
+class InvoiceListQueryTestCase(APITestCase):
+    """Invoice list pages run a fixed number of queries"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='billing', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.service = ServiceItem.objects.create(
+            code='CONS-001', name='General Consultation', category='Consultation', price=100
+        )
+
+    def create_invoices(self, count):
+        for _ in range(count):
+            invoice = Invoice.objects.create(walkin_id='WALK', created_by=self.user)
+            invoice.refresh_from_db()
+            for _ in range(2):
+                InvoiceItem.objects.create(
+                    invoice=invoice, service_item=self.service,
+                    description=self.service.name, unit_price=self.service.price
+                )
+
+    def list_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_query_count_independent_of_page_size(self):
+        self.create_invoices(2)
+        _, small = self.list_queries('/api/billing/invoices/')
+        self.create_invoices(8)
+        response, large = self.list_queries('/api/billing/invoices/')
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(response.data[0]['items_count'], 2)
+        self.assertEqual(response.data[0]['items'][0]['service_item_code'], 'CONS-001')
+
+    def test_summary_mode_and_keyset_pages(self):
+        self.create_invoices(5)
+        response, _ = self.list_queries('/api/billing/invoices/?include_items=false&page_size=3')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertNotIn('items', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['items_count'], 2)
+
+        response, _ = self.list_queries(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+
+class ShiftReconciliationTestCase(APITestCase):
+    """Cashier settlement report and closed shift snapshots"""
+
+    def setUp(self):
+        self.cashier = User.objects.create_user(username='cashier1', password='testpass123', first_name='Ama')
+        self.other = User.objects.create_user(username='cashier2', password='testpass123')
+        self.admin = User.objects.create_superuser(username='manager', password='testpass123')
+        self.client.force_authenticate(user=self.cashier)
+
+    def sell(self, cashier, amount, method):
+        invoice = Invoice.objects.create(
+            walkin_id='WALK', created_by=cashier, total_amount=amount, amount_paid=Decimal('0.00')
+        )
+        Payment.objects.create(invoice=invoice, amount=amount, payment_method=method, received_by=cashier)
+        return Receipt.objects.create(invoice=invoice, amount=amount, payment_method=method, cashier=cashier)
+
+    def test_report_groups_by_cashier_and_method(self):
+        self.sell(self.cashier, Decimal('50.00'), 'Cash')
+        receipt = self.sell(self.cashier, Decimal('20.00'), 'Cash')
+        Receipt.objects.filter(pk=receipt.pk).update(print_count=3)
+        self.sell(self.cashier, Decimal('30.00'), 'Mobile Money')
+        self.sell(self.other, Decimal('10.00'), 'Cash')
+
+        response = self.client.get('/api/billing/reconciliation/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['closed'])
+        self.assertEqual(response.data['totals']['total_amount'], 110.0)
+        ama = next(c for c in response.data['cashiers'] if c['cashier'] == self.cashier.id)
+        self.assertEqual(ama['cashier_name'], 'Ama')
+        self.assertEqual(ama['payment_count'], 3)
+        self.assertEqual(ama['receipts_issued'], 3)
+        self.assertEqual(ama['reprint_count'], 2)
+        cash = next(m for m in ama['methods'] if m['payment_method'] == 'Cash')
+        self.assertEqual(cash['total_amount'], 70.0)
+
+    def close(self, start, end=None):
+        data = {'start': start, **({'end': end} if end else {})}
+        return self.client.post('/api/billing/reconciliation/close/', data)
+
+    def test_closed_shift_is_served_from_snapshot(self):
+        self.sell(self.cashier, Decimal('40.00'), 'Cash')
+        end = (timezone.now() + timedelta(minutes=1)).isoformat()
+        start = (timezone.now() - timedelta(hours=8)).isoformat()
+        self.assertEqual(self.close(start, end).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.close(start, end)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['closed'])
+
+        # Later activity inside the window does not change the closed report
+        self.sell(self.cashier, Decimal('15.00'), 'Cash')
+        response = self.client.get('/api/billing/reconciliation/', {'start': start, 'end': end})
+        self.assertEqual(response.data['totals']['total_amount'], 40.0)
+
+        self.assertEqual(self.close(start, end).status_code, status.HTTP_400_BAD_REQUEST)
+        with self.assertRaises(ValueError):
+            ShiftReconciliation.objects.get().save()
+
+    def test_default_end_shift_resolves_and_blocks_overlaps(self):
+        self.client.force_authenticate(user=self.admin)
+        self.sell(self.cashier, Decimal('25.00'), 'Cash')
+        start = (timezone.now() - timedelta(hours=8)).replace(microsecond=0)
+        response = self.close(start.isoformat())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        closed_end = ShiftReconciliation.objects.get().shift_end
+
+        # The same shift asked for to the second is served from its snapshot
+        self.sell(self.cashier, Decimal('15.00'), 'Cash')
+        response = self.client.get('/api/billing/reconciliation/', {
+            'start': start.isoformat(), 'end': closed_end.replace(microsecond=0).isoformat()
+        })
+        self.assertTrue(response.data['closed'])
+        self.assertEqual(response.data['totals']['total_amount'], 25.0)
+
+        overlapping = self.close((start + timedelta(hours=1)).isoformat())
+        self.assertEqual(overlapping.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ShiftReconciliation.objects.count(), 1)
+        self.assertEqual(self.close(closed_end.isoformat()).status_code, status.HTTP_201_CREATED)
+
+
+class ClaimBatchTestCase(APITestCase):
+    """Insurance claim batching and streamed export"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='claims', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.patient = Patient.objects.create(
+            first_name='Kofi', last_name='Mensah', phone='0240000000', insurance_number='NHIS-123'
+        )
+        self.service = ServiceItem.objects.create(
+            code='LAB-FBC', name='Full Blood Count', category='Laboratory', price=40
+        )
+
+    def bill(self, provider, lines=1):
+        invoice = Invoice.objects.create(
+            patient=self.patient, created_by=self.user, insurance_provider=provider,
+            payment_method='Insurance'
+        )
+        invoice.refresh_from_db()
+        for _ in range(lines):
+            InvoiceItem.objects.create(
+                invoice=invoice, service_item=self.service, description='FBC & film', unit_price=40
+            )
+        return invoice
+
+    def test_batches_group_by_provider_and_mark_claimed(self):
+        self.bill('NHIS', lines=2)
+        self.bill('NHIS')
+        self.bill('Activa')
+        Invoice.objects.create(walkin_id='CASH', created_by=self.user)
+        today = timezone.now().date().isoformat()
+
+        response = self.client.post('/api/billing/claims/batches/', {'period_start': today, 'period_end': today})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        batches = {batch['insurance_provider']: batch for batch in response.data}
+        self.assertEqual(set(batches), {'NHIS', 'Activa'})
+        self.assertEqual(batches['NHIS']['invoice_count'], 2)
+        self.assertEqual(batches['NHIS']['line_count'], 3)
+        self.assertEqual(Decimal(batches['NHIS']['total_amount']), Decimal('120.00'))
+        self.assertEqual(Invoice.objects.filter(claim_batch__isnull=False).count(), 3)
+
+        # Claimed invoices are not batched twice
+        response = self.client.post('/api/billing/claims/batches/', {'period_start': today, 'period_end': today})
+        self.assertEqual(response.data, [])
+
+    def test_batch_numbers_and_invalid_periods(self):
+        self.bill('NHIS')
+        self.bill('NHIS-PREMIUM')
+        numbers = [batch.batch_number for batch in build_claim_batches(timezone.now().date(), timezone.now().date())]
+        self.assertEqual(len(set(numbers)), 2)
+        for number in numbers:
+            self.assertRegex(number, r'^CLM-NHIS\w*-\d{6}-[0-9A-F]{8}$')
+
+        response = self.client.post('/api/billing/claims/batches/',
+                                    {'period_start': '2026-02-01', 'period_end': '2026-02-30'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_streams_line_detail(self):
+        self.bill('NHIS', lines=2)
+        batch = build_claim_batches(timezone.now().date(), timezone.now().date())[0]
+
+        response = self.client.get(f'/api/billing/claims/batches/{batch.id}/export/csv/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertIn('NHIS-123', rows[1])
+        self.assertIn('LAB-FBC', rows[1])
+
+        response = self.client.get(f'/api/billing/claims/batches/{batch.id}/export/xml/')
+        document = b''.join(response.streaming_content).decode()
+        self.assertIn('memberNumber="NHIS-123"', document)
+        self.assertEqual(document.count('<Line '), 2)
+        self.assertIn('FBC &amp; film', document)
+
+
+class ReceiptRenderTestCase(APITestCase):
+    """Server-rendered receipts with ETags and print tracking"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='pos', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        invoice = Invoice.objects.create(walkin_id='WALK-9', created_by=self.user)
+        invoice.refresh_from_db()
+        InvoiceItem.objects.create(invoice=invoice, description='Paracetamol 500mg', quantity=2, unit_price=2)
+        self.receipt = Receipt.objects.create(
+            invoice=invoice, amount=Decimal('4.00'), payment_method='Cash', cashier=self.user
+        )
+        self.url = f'/api/billing/receipts/{self.receipt.receipt_number}'
+
+    def test_text_receipt_and_etag(self):
+        response = self.client.get(f'{self.url}/text/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Paracetamol 500mg', response.content.decode())
+        self.assertIn('GHS 4.00', response.content.decode())
+
+        etag = response['ETag']
+        response = self.client.get(f'{self.url}/text/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_edit_within_the_same_second_changes_etag(self):
+        invoice = self.receipt.invoice
+        second = invoice.updated_at.replace(microsecond=0)
+        Invoice.objects.filter(pk=invoice.pk).update(updated_at=second)
+        etag = self.client.get(f'{self.url}/text/')['ETag']
+
+        # Edited again later within the same second
+        InvoiceItem.objects.create(invoice=invoice, description='Vitamin C', quantity=1, unit_price=3)
+        Invoice.objects.filter(pk=invoice.pk).update(updated_at=second + timedelta(microseconds=500))
+        response = self.client.get(f'{self.url}/text/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Vitamin C', response.content.decode())
+
+    def test_pdf_and_html_formats(self):
+        response = self.client.get(f'{self.url}/pdf/', HTTP_ACCEPT='application/pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF-1.4'))
+        response = self.client.get(f'{self.url}/html/')
+        self.assertIn(b'<pre>', response.content)
+        self.assertEqual(self.client.get(f'{self.url}/docx/').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_print_increments_count(self):
+        self.client.post(f'{self.url}/text/')
+        response = self.client.post(f'{self.url}/text/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.receipt.refresh_from_db()
+        self.assertTrue(self.receipt.printed)
+        self.assertEqual(self.receipt.print_count, 2)
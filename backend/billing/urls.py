@@ -11,6 +11,11 @@ from .views import (
     financial_transactions_view,
     pharmacy_sales_history_view,
     pharmacy_stats_view,
+    shift_reconciliation_view,
+    close_shift_view,
+    ClaimBatchListView,
+    claim_batch_export_view,
+    ReceiptRenderView,
 )
 
 urlpatterns = [
@@ -24,9 +29,18 @@ urlpatterns = [
     path("invoices/<int:invoice_id>/items/", AddInvoiceItemView.as_view(), name="add-invoice-item"),
     path("invoices/<int:invoice_id>/pay/", ProcessPaymentView.as_view(), name="process-payment"),
     
+    # Receipts
+    path("receipts/<str:receipt_number>/<str:output_format>/", ReceiptRenderView.as_view(), name="receipt-render"),
+    
     # Stats and Reports
     path("stats/", BillingStatsView.as_view(), name="billing-stats"),
     path("transactions/", financial_transactions_view, name="financial-transactions"),
+    path("reconciliation/", shift_reconciliation_view, name="shift-reconciliation"),
+    path("reconciliation/close/", close_shift_view, name="close-shift"),
+    
+    # Insurance claims
+    path("claims/batches/", ClaimBatchListView.as_view(), name="claim-batches"),
+    path("claims/batches/<int:id>/export/<str:file_format>/", claim_batch_export_view, name="claim-batch-export"),
     
     # Pharmacy specific
     path("pharmacy-sales/", pharmacy_sales_history_view, name="pharmacy-sales"),
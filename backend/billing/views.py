@@ -3,15 +3,27 @@ from rest_framework import generics, permissions, status, filters
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from django.db.models import Q, Sum
+from django.db import transaction
+from django.db.models import Q, Sum, Count, Prefetch
 from django.utils import timezone
 from datetime import timedelta
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import ServiceItem, Invoice, InvoiceItem, Payment, Receipt
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
+from .models import ServiceItem, Invoice, InvoiceItem, Payment, Receipt, ClaimBatch
 from .serializers import (
     ServiceItemSerializer, InvoiceSerializer, InvoiceListSerializer,
-    InvoiceItemSerializer, PaymentSerializer, ReceiptSerializer
+    InvoiceSummarySerializer, InvoiceItemSerializer, PaymentSerializer, ReceiptSerializer,
+    ClaimBatchSerializer
 )
+from .claims import build_claim_batches, CLAIM_EXPORTERS
+from .receipts import get_rendered_receipt, RECEIPT_CONTENT_TYPES
+from .pagination import InvoiceCursorPagination
+from .reconciliation import parse_shift_window, shift_report, close_shift
+from users.permissions import is_admin
+from inventory.stock import deduct_stock, InsufficientStock
 from decimal import Decimal  
 
 class ServiceItemListView(generics.ListCreateAPIView):
@@ -28,10 +40,22 @@ class ServiceItemListView(generics.ListCreateAPIView):
         from notifications.audit import log_action
         log_action(self.request.user, "create", f"Created service item: {obj.name}", {"service_item_id": obj.id})
 
+def with_list_items(queryset, include_items=True):
+    """Annotate item counts and prefetch lines so list pages run a fixed number of queries"""
+    queryset = queryset.select_related('patient').annotate(items_count=Count('items'))
+    if include_items:
+        queryset = queryset.prefetch_related(
+            Prefetch('items', queryset=InvoiceItem.objects.select_related('service_item', 'inventory_item'))
+        )
+    return queryset
+
 class InvoiceListView(generics.ListCreateAPIView):
-    """GET: List invoices, POST: Create new invoice"""
-    serializer_class = InvoiceListSerializer
+    """
+    GET: List invoices, POST: Create new invoice
+    ?include_items=false drops line items; ?page_size= / ?cursor= enable keyset pagination
+    """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InvoiceCursorPagination
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = [
         'invoice_number', 'patient__name', 'patient__first_name',
@@ -39,8 +63,16 @@ class InvoiceListView(generics.ListCreateAPIView):
     ]
     filterset_fields = ['status', 'payment_method']
     
+    def include_items(self):
+        return self.request.query_params.get('include_items', 'true').lower() != 'false'
+    
+    def get_serializer_class(self):
+        if self.request.method == 'GET' and not self.include_items():
+            return InvoiceSummarySerializer
+        return InvoiceListSerializer
+    
     def get_queryset(self):
-        queryset = Invoice.objects.all().select_related('patient')
+        queryset = with_list_items(Invoice.objects.all(), self.include_items())
         
         # Filter by status
         status_filter = self.request.query_params.get('status', None)
@@ -60,7 +92,7 @@ class InvoiceListView(generics.ListCreateAPIView):
         if patient_id:
             queryset = queryset.filter(patient_id=patient_id)
         
-        return queryset.order_by('-invoice_date')
+        return queryset.order_by('-invoice_date', '-id')
     
     def perform_create(self, serializer):
         obj = serializer.save(created_by=self.request.user)
@@ -89,9 +121,9 @@ class PendingInvoicesView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Invoice.objects.filter(
+        return with_list_items(Invoice.objects.filter(
             status__in=['Pending', 'Partially Paid']
-        ).select_related('patient').order_by('invoice_date')
+        )).order_by('invoice_date')
 
 class AddInvoiceItemView(APIView):
     """POST: Add item to invoice"""
@@ -164,52 +196,49 @@ class ProcessPaymentView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create payment
-        payment = Payment.objects.create(
-            invoice=invoice,
-            amount=amount_decimal,  # Use Decimal
-            payment_method=payment_method,
-            reference=reference,
-            transaction_id=transaction_id,
-            notes=notes,
-            received_by=request.user
-        )
-        
-        # Refresh invoice from database to get updated amount_paid
-        invoice.refresh_from_db()
+        with transaction.atomic():
+            # Create payment
+            payment = Payment.objects.create(
+                invoice=invoice,
+                amount=amount_decimal,  # Use Decimal
+                payment_method=payment_method,
+                reference=reference,
+                transaction_id=transaction_id,
+                notes=notes,
+                received_by=request.user
+            )
+            
+            # Refresh invoice from database to get updated amount_paid
+            invoice.refresh_from_db()
+            
+            # Deduct inventory for stock-linked lines when payment is completed
+            if invoice.balance <= 0:
+                try:
+                    deducted = self.deduct_inventory(invoice, request.user)
+                except InsufficientStock as exc:
+                    # Undo the payment so the sale can be corrected and retried
+                    transaction.set_rollback(True)
+                    return Response(
+                        {
+                            'error': 'Insufficient stock to complete this sale',
+                            'conflicts': exc.conflicts
+                        },
+                        status=status.HTTP_409_CONFLICT
+                    )
         
-        # Deduct inventory for pharmacy items when payment is completed
         if invoice.balance <= 0:  # Payment completed
-            from inventory.models import Inventory
             from notifications.audit import log_action
             
-            for item in invoice.items.all():
-                # Check if this is a pharmacy item by description matching inventory
-                try:
-                    inventory_item = Inventory.objects.get(
-                        name=item.description,
-                        department='PHARMACY'
-                    )
-                    # Deduct quantity from inventory
-                    if inventory_item.current_stock >= item.quantity:
-                        inventory_item.current_stock -= int(item.quantity)
-                        inventory_item.save()
-                        
-                        # Log inventory deduction
-                        log_action(
-                            request.user, 
-                            "inventory_deduction", 
-                            f"Deducted {item.quantity} {item.description} from inventory (Sale: {invoice.invoice_number})",
-                            {
-                                "item_id": inventory_item.item_id,
-                                "quantity_deducted": int(item.quantity),
-                                "remaining_stock": inventory_item.current_stock,
-                                "invoice_number": invoice.invoice_number
-                            }
-                        )
-                except Inventory.DoesNotExist:
-                    # Item not found in inventory, skip deduction
-                    pass
+            if deducted:
+                log_action(
+                    request.user,
+                    "inventory_deduction",
+                    f"Deducted {len(deducted)} item(s) from inventory (Sale: {invoice.invoice_number})",
+                    {
+                        "invoice_number": invoice.invoice_number,
+                        "items": deducted
+                    }
+                )
             
             # Log sale completion
             customer_info = invoice.patient.name if invoice.patient else invoice.notes
@@ -246,6 +275,18 @@ class ProcessPaymentView(APIView):
             'invoice': InvoiceSerializer(invoice).data
         }, status=status.HTTP_201_CREATED)
     
+    def deduct_inventory(self, invoice, user):
+        """Deduct stock for every inventory-linked line with one conditional UPDATE"""
+        lines = invoice.items.filter(
+            inventory_item__isnull=False
+        ).values('inventory_item_id').annotate(quantity=Sum('quantity'))
+        quantities = {line['inventory_item_id']: int(line['quantity']) for line in lines}
+        deduct_stock(quantities, reference=invoice.invoice_number, user=user)
+        return [
+            {"inventory_item": pk, "quantity_deducted": qty}
+            for pk, qty in quantities.items()
+        ]
+
 class BillingStatsView(APIView):
     """GET: Billing statistics"""
     permission_classes = [permissions.IsAuthenticated]
@@ -541,4 +582,162 @@ def pharmacy_stats_view(request):
         'week_revenue': float(week_revenue),
         'total_revenue': float(total_revenue),
         'top_drugs': top_drugs,
-    })
\ No newline at end of file
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def shift_reconciliation_view(request):
+    """
+    GET: End-of-day settlement per cashier and payment method
+    Query params: start, end (ISO date or datetime; default today so far), cashier (user id)
+    Closed shifts are served from their snapshot
+    """
+    try:
+        start, end = parse_shift_window(
+            request.query_params.get('start'),
+            request.query_params.get('end')
+        )
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(shift_report(start, end, request.query_params.get('cashier')))
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def close_shift_view(request):
+    """POST: Close a shift window and snapshot its reconciliation (admins only)"""
+    if not is_admin(request.user):
+        return Response({'error': 'Only administrators can close shifts'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        start, end = parse_shift_window(
+            request.data.get('start'),
+            request.data.get('end')
+        )
+        reconciliation = close_shift(start, end, request.user)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    from notifications.audit import log_action
+    log_action(
+        request.user,
+        "create",
+        f"Closed cashier shift {start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M}",
+        {"reconciliation_id": reconciliation.id, "total_amount": float(reconciliation.total_amount)}
+    )
+    return Response(shift_report(start, end), status=status.HTTP_201_CREATED)
+
+
+
+class ClaimBatchListView(generics.ListAPIView):
+    """
+    GET: List insurance claim batches
+    POST: Batch unclaimed insurance invoices for a period, one batch per provider
+    Body: period_start, period_end (YYYY-MM-DD), insurance_provider (optional)
+    """
+    serializer_class = ClaimBatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['insurance_provider']
+    
+    def get_queryset(self):
+        return ClaimBatch.objects.select_related('created_by')
+    
+    def post(self, request):
+        try:
+            period_start = parse_date(str(request.data.get('period_start', '')))
+            period_end = parse_date(str(request.data.get('period_end', '')))
+        except ValueError:
+            period_start = period_end = None
+        if not period_start or not period_end or period_end < period_start:
+            return Response(
+                {'error': 'Valid period_start and period_end (YYYY-MM-DD) are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        batches = build_claim_batches(
+            period_start, period_end,
+            provider=request.data.get('insurance_provider') or None,
+            user=request.user
+        )
+        
+        from notifications.audit import log_action
+        for batch in batches:
+            log_action(
+                request.user,
+                "create",
+                f"Created claim batch {batch.batch_number}: {batch.invoice_count} invoices for {batch.insurance_provider}",
+                {"claim_batch_id": batch.id, "total_amount": float(batch.total_amount)}
+            )
+        
+        return Response(
+            ClaimBatchSerializer(batches, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def claim_batch_export_view(request, id, file_format):
+    """GET: Stream a claim batch as a CSV or XML claim file with line-level detail"""
+    if file_format not in CLAIM_EXPORTERS:
+        return Response(
+            {'error': f"Unsupported format. Choose one of: {', '.join(CLAIM_EXPORTERS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    batch = get_object_or_404(ClaimBatch, id=id)
+    content_type, exporter = CLAIM_EXPORTERS[file_format]
+    response = StreamingHttpResponse(exporter(batch), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{batch.batch_number}.{file_format}"'
+    return response
+
+
+
+class ReceiptRenderView(APIView):
+    """
+    GET: Rendered receipt (text, html or pdf) by receipt number, with a strong ETag
+    POST: Same, and records a print by incrementing print_count
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def perform_content_negotiation(self, request, force=False):
+        # The body is raw receipt bytes, so any Accept header is fine
+        return super().perform_content_negotiation(request, force=True)
+    
+    def get_receipt(self, receipt_number):
+        return get_object_or_404(
+            Receipt.objects.select_related('invoice__patient', 'cashier'),
+            receipt_number=receipt_number
+        )
+    
+    def render(self, request, receipt, output_format):
+        rendered = get_rendered_receipt(receipt, output_format)
+        if_none_match = request.headers.get('If-None-Match', '')
+        if rendered['etag'] in [tag.strip() for tag in if_none_match.split(',')]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(rendered['content'], content_type=RECEIPT_CONTENT_TYPES[output_format])
+            if output_format == 'pdf':
+                response['Content-Disposition'] = f'inline; filename="{receipt.receipt_number}.pdf"'
+        response['ETag'] = rendered['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    def get(self, request, receipt_number, output_format):
+        if output_format not in RECEIPT_CONTENT_TYPES:
+            return Response(
+                {'error': f"Unsupported format. Choose one of: {', '.join(RECEIPT_CONTENT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.render(request, self.get_receipt(receipt_number), output_format)
+    
+    def post(self, request, receipt_number, output_format):
+        if output_format not in RECEIPT_CONTENT_TYPES:
+            return Response(
+                {'error': f"Unsupported format. Choose one of: {', '.join(RECEIPT_CONTENT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        receipt = self.get_receipt(receipt_number)
+        Receipt.objects.filter(pk=receipt.pk).update(printed=True, print_count=F('print_count') + 1)
+        return self.render(request, receipt, output_format)
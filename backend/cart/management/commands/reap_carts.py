@@ -0,0 +1,23 @@
+"""
+Management command to release lapsed cart reservations and delete abandoned carts
+Usage: python manage.py reap_carts [--stale-hours 24] [--chunk-size 1000]  (run every few minutes)
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from cart.reservations import release_expired_reservations, reap_stale_carts, REAP_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Release expired cart stock reservations and delete stale open carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-hours', type=float, help='Delete open carts untouched this long (default CART_STALE_AFTER)')
+        parser.add_argument('--chunk-size', type=int, default=REAP_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(hours=options['stale_hours']) if options['stale_hours'] else None
+        released = release_expired_reservations(options['chunk_size'])
+        deleted = reap_stale_carts(stale_after, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Released {released} reservation(s), deleted {deleted} stale cart(s)'
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+        ('inventory', '0009_stock_takes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['inventory_item', 'reserved_until'], name='cart_cartit_invento_89e6cd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['reserved_until'], name='cart_cartit_reserve_a88d28_idx'),
+        ),
+    ]
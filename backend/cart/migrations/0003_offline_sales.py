@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_cart_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='client_ref',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='payment_method',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
@@ -1,8 +1,28 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 import uuid
 
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate total and item count in SQL and prefetch the lines with their
+        inventory rows, so any number of carts and lines loads in two queries
+        """
+        line_total = models.ExpressionWrapper(
+            models.F('items__unit_price') * models.F('items__quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        )
+        return self.annotate(
+            computed_total=Coalesce(
+                models.Sum(line_total), models.Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            ),
+            computed_item_count=models.Count('items'),
+        ).prefetch_related(models.Prefetch(
+            'items', queryset=CartItem.objects.select_related('inventory_item').order_by('added_at', 'id')
+        ))
+
 class Cart(models.Model):
     """Simple cart model for pharmacy"""
     
@@ -18,12 +38,18 @@ class Cart(models.Model):
     # Status
     is_active = models.BooleanField(default=True)
     is_checked_out = models.BooleanField(default=False)
+    payment_method = models.CharField(max_length=20, blank=True)
+    
+    # Terminal-generated id of a sale made offline; makes batch sync idempotent
+    client_ref = models.CharField(max_length=64, unique=True, null=True, blank=True)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     checked_out_at = models.DateTimeField(null=True, blank=True)
     
+    objects = CartQuerySet.as_manager()
+    
     def __str__(self):
         return f"Cart {self.cart_id}"
     
@@ -34,11 +60,15 @@ class Cart(models.Model):
     
     @property
     def total(self):
-        """Calculate total from items"""
+        """Calculate total from items (computed in SQL when loaded via with_totals)"""
+        if hasattr(self, 'computed_total'):
+            return self.computed_total
         return sum(float(item.subtotal) for item in self.items.all())
     
     @property
     def item_count(self):
+        if hasattr(self, 'computed_item_count'):
+            return self.computed_item_count
         return self.items.count()
 
 
@@ -51,9 +81,15 @@ class CartItem(models.Model):
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     
     added_at = models.DateTimeField(auto_now_add=True)
+    # Soft reservation: the line counts against other carts' available stock until then
+    reserved_until = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         unique_together = ['cart', 'inventory_item']
+        indexes = [
+            models.Index(fields=['inventory_item', 'reserved_until']),
+            models.Index(fields=['reserved_until']),
+        ]
     
     def __str__(self):
         return f"{self.quantity} x {self.inventory_item.name}"
@@ -67,13 +103,15 @@ class CartItem(models.Model):
         if not self.pk:
             self.unit_price = self.inventory_item.selling_price
             
-            # Check stock
-            if self.quantity > self.inventory_item.current_stock:
-                raise ValueError(f"Not enough stock. Available: {self.inventory_item.current_stock}")
+            # Check stock, less what other carts have reserved
+            from .reservations import available_stock
+            available = available_stock(self.inventory_item, exclude_cart=self.cart_id)
+            if self.quantity > available:
+                raise ValueError(f"Not enough stock. Available: {available}")
         
         super().save(*args, **kwargs)
     
-    def update_inventory(self):
+    def update_inventory(self, user=None):
         """Update inventory after purchase"""
-        self.inventory_item.current_stock -= self.quantity
-        self.inventory_item.save()
\ No newline at end of file
+        from inventory.stock import deduct_stock
+        deduct_stock({self.inventory_item_id: self.quantity}, reference=self.cart.cart_id, user=user)
\ No newline at end of file
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db.models import Sum, Q
+from django.utils import timezone
+from .models import Cart, CartItem
+
+REAP_CHUNK_SIZE = 1000
+
+
+def reservation_ttl():
+    return settings.CART_RESERVATION_TTL
+
+
+def live_reservations(exclude_cart=None):
+    """Cart lines currently holding stock"""
+    lines = CartItem.objects.filter(
+        reserved_until__gt=timezone.now(),
+        cart__is_checked_out=False,
+        cart__is_active=True,
+    )
+    if exclude_cart is not None:
+        lines = lines.exclude(cart_id=exclude_cart)
+    return lines
+
+
+def reserved_quantities(inventory_pks, exclude_cart=None):
+    """{inventory_pk: quantity reserved by other carts} in one grouped query"""
+    rows = live_reservations(exclude_cart).filter(
+        inventory_item_id__in=inventory_pks
+    ).order_by().values('inventory_item').annotate(reserved=Sum('quantity'))
+    return {row['inventory_item']: row['reserved'] for row in rows}
+
+
+def available_stock(item, exclude_cart=None):
+    """Stock not held by another cart's live reservation"""
+    reserved = reserved_quantities([item.pk], exclude_cart).get(item.pk, 0)
+    return max(item.current_stock - reserved, 0)
+
+
+def reserve_cart(cart):
+    """Extend every line's reservation and mark the cart as recently used"""
+    now = timezone.now()
+    CartItem.objects.filter(cart=cart).update(reserved_until=now + reservation_ttl())
+    Cart.objects.filter(pk=cart.pk).update(updated_at=now)
+
+
+def reservation_conflicts(cart):
+    """Lines of cart that other carts' live reservations leave short of stock"""
+    lines = list(cart.items.values_list('id', 'inventory_item_id', 'quantity', 'inventory_item__current_stock'))
+    reserved = reserved_quantities([line[1] for line in lines], exclude_cart=cart.pk)
+    conflicts = []
+    for line_id, inventory_pk, quantity, current_stock in lines:
+        available = max(current_stock - reserved.get(inventory_pk, 0), 0)
+        if quantity > available:
+            conflicts.append({
+                'cart_item': line_id,
+                'inventory_item': inventory_pk,
+                'requested': quantity,
+                'available': available,
+                'error': f"Reserved by other carts. Available: {available}",
+            })
+    return conflicts
+
+
+def _chunked_ids(queryset, chunk_size):
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+
+
+def release_expired_reservations(chunk_size=REAP_CHUNK_SIZE):
+    """Clear lapsed reservations in chunks; returns how many lines were released"""
+    released = 0
+    expired = CartItem.objects.filter(reserved_until__lte=timezone.now())
+    for ids in _chunked_ids(expired, chunk_size):
+        released += CartItem.objects.filter(pk__in=ids).update(reserved_until=None)
+    return released
+
+
+def reap_stale_carts(stale_after=None, chunk_size=REAP_CHUNK_SIZE):
+    """
+    Delete open carts untouched for stale_after (default CART_STALE_AFTER)
+    that hold no live reservation, chunk by chunk. Returns how many were deleted.
+    """
+    cutoff = timezone.now() - (stale_after or settings.CART_STALE_AFTER)
+    stale = Cart.objects.filter(is_checked_out=False, updated_at__lt=cutoff).exclude(
+        Q(items__reserved_until__gt=timezone.now())
+    )
+    deleted = 0
+    for ids in _chunked_ids(stale, chunk_size):
+        _, per_model = Cart.objects.filter(pk__in=ids).delete()
+        deleted += per_model.get(Cart._meta.label, 0)
+    return deleted
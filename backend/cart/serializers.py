@@ -11,8 +11,8 @@ class CartItemSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = CartItem
-        fields = ['id', 'item_id', 'item_name', 'quantity', 'unit_price', 'stock_available', 'subtotal']
-        read_only_fields = ['id', 'item_name', 'stock_available', 'subtotal']
+        fields = ['id', 'item_id', 'item_name', 'quantity', 'unit_price', 'stock_available', 'subtotal', 'reserved_until']
+        read_only_fields = ['id', 'item_name', 'stock_available', 'subtotal', 'reserved_until']
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -0,0 +1,158 @@
+from decimal import Decimal
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from inventory.models import Inventory
+from inventory.stock import deduct_stock, InsufficientStock
+from .models import Cart, CartItem
+
+MAX_SYNC_SALES = 500
+
+
+def _whole_number(value):
+    """int for 3, '3' or 3.0; ValueError for 1.7, '1.7', booleans and anything else"""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    if isinstance(value, (int, str)):
+        return int(value)
+    raise TypeError(value)
+
+
+def _validate_sale(sale, items):
+    """Return (client_ref, patient_id, {inventory_pk: quantity}, sold_at, errors) for one queued sale"""
+    errors = []
+    client_ref = str(sale.get('client_ref') or '').strip()
+    if not client_ref:
+        errors.append('client_ref is required')
+    elif len(client_ref) > 64:
+        errors.append('client_ref must be at most 64 characters')
+    payment_method = str(sale.get('payment_method') or '')
+    if not payment_method:
+        errors.append('payment_method is required')
+    elif len(payment_method) > 20:
+        errors.append('payment_method must be at most 20 characters')
+    if len(str(sale.get('patient_name') or '')) > 200:
+        errors.append('patient_name must be at most 200 characters')
+
+    patient_id = sale.get('patient_id')
+    if patient_id not in (None, ''):
+        try:
+            patient_id = int(patient_id)
+        except (TypeError, ValueError):
+            errors.append(f"Invalid patient_id: {patient_id}")
+    else:
+        patient_id = None
+
+    sold_at = timezone.now()
+    if sale.get('sold_at'):
+        try:
+            sold_at = parse_datetime(str(sale['sold_at']))
+        except ValueError:
+            sold_at = None
+        if sold_at is None:
+            errors.append(f"Invalid sold_at: {sale['sold_at']}")
+        elif timezone.is_naive(sold_at):
+            sold_at = timezone.make_aware(sold_at)
+
+    quantities = {}
+    lines = sale.get('lines') or []
+    if not isinstance(lines, list) or not lines:
+        errors.append('A sale needs at least one line')
+        lines = []
+    for number, line in enumerate(lines, start=1):
+        try:
+            pk = _whole_number(line.get('inventory_item_id'))
+            quantity = _whole_number(line.get('quantity', 1))
+        except (AttributeError, TypeError, ValueError):
+            errors.append(f"Line {number}: inventory_item_id and quantity must be whole numbers")
+            continue
+        if pk not in items:
+            errors.append(f"Line {number}: item {pk} not found")
+        elif quantity < 1:
+            errors.append(f"Line {number}: quantity must be at least 1")
+        else:
+            quantities[pk] = quantities.get(pk, 0) + quantity
+    return client_ref, patient_id, quantities, sold_at, errors
+
+
+def apply_sale(sale, items, user):
+    """
+    Record one offline sale as a checked-out cart and deduct its stock in a
+    single transaction. Returns a result dict; never raises for bad input.
+    """
+    client_ref, patient_id, quantities, sold_at, errors = _validate_sale(sale, items)
+    result = {'client_ref': client_ref}
+    if errors:
+        result.update({'status': 'invalid', 'errors': errors})
+        return result
+
+    try:
+        with transaction.atomic():
+            cart = Cart.objects.create(
+                client_ref=client_ref,
+                created_by=user,
+                patient_id=patient_id,
+                patient_name=sale.get('patient_name') or '',
+                payment_method=str(sale['payment_method']),
+                is_active=False,
+                is_checked_out=True,
+                checked_out_at=sold_at,
+            )
+            # bulk_create skips CartItem.save(): deduct_stock below is the stock check
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, inventory_item_id=pk, quantity=quantity,
+                         unit_price=items[pk].selling_price)
+                for pk, quantity in quantities.items()
+            ])
+            deduct_stock(quantities, reference=cart.cart_id, user=user, notes='Offline sale')
+    except IntegrityError as exc:
+        # Already synced, possibly by a concurrent request from the same terminal;
+        # any other constraint failure is not a duplicate
+        existing = Cart.objects.filter(client_ref=client_ref).values_list('cart_id', flat=True).first()
+        if existing is None:
+            result.update({'status': 'failed', 'error': str(exc)})
+        else:
+            result.update({'status': 'duplicate', 'cart_id': existing})
+        return result
+    except InsufficientStock as exc:
+        result.update({'status': 'rejected', 'error': 'Insufficient stock', 'conflicts': exc.conflicts})
+        return result
+
+    total = sum((items[pk].selling_price * quantity for pk, quantity in quantities.items()), Decimal('0.00'))
+    result.update({'status': 'applied', 'cart_id': cart.cart_id, 'total': float(total)})
+    return result
+
+
+def sync_sales(sales, user):
+    """
+    Apply a terminal's queue of offline sales in order, one transaction per
+    sale. Sales whose client_ref was synced before come back as duplicates
+    without touching stock, so a terminal can safely resend its whole queue.
+    """
+    refs = [str(sale.get('client_ref') or '').strip() for sale in sales if isinstance(sale, dict)]
+    synced = dict(Cart.objects.filter(client_ref__in=[ref for ref in refs if ref]).values_list('client_ref', 'cart_id'))
+    item_ids = set()
+    for sale in sales:
+        for line in (sale.get('lines') or []) if isinstance(sale, dict) else []:
+            if isinstance(line, dict) and str(line.get('inventory_item_id', '')).isdigit():
+                item_ids.add(int(line['inventory_item_id']))
+    items = Inventory.objects.only('id', 'selling_price').in_bulk(item_ids)
+
+    results = []
+    for sale in sales:
+        if not isinstance(sale, dict):
+            results.append({'client_ref': None, 'status': 'invalid', 'errors': ['Each sale must be an object']})
+            continue
+        client_ref = str(sale.get('client_ref') or '').strip()
+        if client_ref in synced:
+            results.append({'client_ref': client_ref, 'status': 'duplicate', 'cart_id': synced[client_ref]})
+            continue
+        result = apply_sale(sale, items, user)
+        if result['status'] == 'applied':
+            synced[client_ref] = result['cart_id']
+        results.append(result)
+    return results
@@ -1,3 +1,187 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from inventory.models import Inventory, StockMovement
+from .models import Cart, CartItem
+from .reservations import release_expired_reservations, reap_stale_carts
 
-# Create your tests here.
+
+class CartReadTestCase(APITestCase):
+    """Cart totals computed in SQL with lines prefetched"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='dispenser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(created_by=self.user)
+
+    def add_lines(self, count):
+        for number in range(count):
+            item = Inventory.objects.create(name=f'Drug {number}', department='PHARMACY',
+                                            current_stock=100, selling_price='2.50')
+            CartItem.objects.create(cart=self.cart, inventory_item=item, quantity=2)
+
+    def test_totals_match_python(self):
+        self.add_lines(3)
+        cart = Cart.objects.with_totals().get(pk=self.cart.pk)
+        self.assertEqual(float(cart.total), Cart.objects.get(pk=self.cart.pk).total)
+        self.assertEqual(cart.item_count, 3)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self.add_lines(1)
+        with self.assertNumQueries(2):
+            small = self.client.get(f'/api/cart/{self.cart.cart_id}/')
+        self.add_lines(10)
+        with self.assertNumQueries(2):
+            large = self.client.get(f'/api/cart/{self.cart.cart_id}/')
+        self.assertEqual(small.data['item_count'], 1)
+        self.assertEqual((large.data['item_count'], float(large.data['total'])), (11, 55.0))
+        self.assertEqual(len(large.data['items']), 11)
+
+    def test_empty_cart_total_is_zero(self):
+        response = self.client.get(f'/api/cart/{self.cart.cart_id}/')
+        self.assertEqual((response.data['item_count'], float(response.data['total'])), (0, 0.0))
+
+
+class CheckoutTestCase(APITestCase):
+    """Checkout deducts all lines atomically"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(created_by=self.user)
+        self.plenty = Inventory.objects.create(name='ORS sachets', department='PHARMACY', current_stock=10)
+        self.last_box = Inventory.objects.create(name='Insulin pen', department='PHARMACY', current_stock=1)
+        CartItem.objects.create(cart=self.cart, inventory_item=self.plenty, quantity=3)
+        self.pen_line = CartItem.objects.create(cart=self.cart, inventory_item=self.last_box, quantity=1)
+
+    def checkout(self):
+        return self.client.post(f'/api/cart/{self.cart.cart_id}/checkout/', {'payment_method': 'Cash'})
+
+    def test_checkout_deducts_every_line(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cart']['item_count'], 2)
+        self.assertEqual(
+            dict(Inventory.objects.values_list('name', 'current_stock')),
+            {'ORS sachets': 7, 'Insulin pen': 0}
+        )
+        self.assertEqual(StockMovement.objects.filter(reference=self.cart.cart_id).count(), 2)
+        self.assertEqual(self.checkout().status_code, 400)
+
+    def test_shortage_reports_line_and_changes_nothing(self):
+        # Another terminal sold the last pen after it was added to this cart
+        Inventory.objects.filter(pk=self.last_box.pk).update(current_stock=0)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(response.data['conflicts']), 1)
+        self.assertEqual(response.data['conflicts'][0]['cart_item'], self.pen_line.pk)
+        self.assertEqual(Inventory.objects.get(pk=self.plenty.pk).current_stock, 10)
+        self.assertFalse(Cart.objects.get(pk=self.cart.pk).is_checked_out)
+
+
+class ReservationTestCase(APITestCase):
+    """Cart lines hold stock for other terminals until they lapse"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='terminal1', password='testpass123')
+        self.other = User.objects.create_user(username='terminal2', password='testpass123')
+        self.item = Inventory.objects.create(name='Amoxiclav 625mg', department='PHARMACY', current_stock=5)
+        self.cart = Cart.objects.create(created_by=self.user)
+        self.other_cart = Cart.objects.create(created_by=self.other)
+
+    def add(self, user, cart, quantity):
+        self.client.force_authenticate(user=user)
+        return self.client.post(f'/api/cart/{cart.cart_id}/add-item/',
+                                {'inventory_item_id': self.item.pk, 'quantity': quantity})
+
+    def test_reserved_stock_is_unavailable_to_other_carts(self):
+        response = self.add(self.user, self.cart, 4)
+        self.assertIsNotNone(response.data['reserved_until'])
+        self.assertEqual(self.add(self.other, self.other_cart, 2).status_code, 400)
+        self.assertEqual(self.add(self.other, self.other_cart, 1).status_code, 200)
+
+    def test_lapsed_reservation_frees_stock(self):
+        self.add(self.user, self.cart, 4)
+        CartItem.objects.update(reserved_until=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.add(self.other, self.other_cart, 5).status_code, 200)
+        # The first cart now cannot check out what the second one holds
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(f'/api/cart/{self.cart.cart_id}/checkout/', {'payment_method': 'Cash'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'][0]['available'], 0)
+
+    def test_reaper_releases_and_deletes_in_chunks(self):
+        self.add(self.user, self.cart, 2)
+        CartItem.objects.update(reserved_until=timezone.now() - timedelta(minutes=1))
+        stale = timezone.now() - timedelta(days=2)
+        Cart.objects.create(created_by=self.user)
+        Cart.objects.update(updated_at=stale)
+        checked_out = Cart.objects.create(created_by=self.user, is_checked_out=True, is_active=False)
+        Cart.objects.filter(pk=checked_out.pk).update(updated_at=stale)
+
+        self.assertEqual(release_expired_reservations(chunk_size=1), 1)
+        self.assertEqual(reap_stale_carts(chunk_size=1), 3)
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [checked_out.pk])
+
+
+class OfflineSyncTestCase(APITestCase):
+    """Batched, idempotent sync of offline sales"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='offline', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.item = Inventory.objects.create(name='Zinc tablets', department='PHARMACY',
+                                             current_stock=5, selling_price='1.50')
+
+    def sale(self, ref, quantity):
+        return {'client_ref': ref, 'payment_method': 'Cash',
+                'lines': [{'inventory_item_id': self.item.pk, 'quantity': quantity}]}
+
+    def test_each_sale_gets_its_own_result(self):
+        response = self.client.post('/api/cart/sync/', {'sales': [
+            self.sale('T1-001', 2),
+            self.sale('T1-002', 9),
+            {'client_ref': 'T1-003', 'payment_method': 'Cash', 'lines': []},
+            self.sale('T1-004', 3),
+        ]}, format='json')
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['applied', 'rejected', 'invalid', 'applied'])
+        self.assertEqual(response.data['results'][0]['total'], 3.0)
+        self.assertEqual(Inventory.objects.get(pk=self.item.pk).current_stock, 0)
+        self.assertEqual(Cart.objects.filter(is_checked_out=True).count(), 2)
+
+    def test_resending_the_queue_is_idempotent(self):
+        self.client.post('/api/cart/sync/', {'sales': [self.sale('T2-001', 2)]}, format='json')
+        response = self.client.post('/api/cart/sync/', {'sales': [self.sale('T2-001', 2)]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'duplicate')
+        self.assertEqual(Inventory.objects.get(pk=self.item.pk).current_stock, 3)
+
+    def test_other_integrity_errors_are_not_duplicates(self):
+        # e.g. a foreign key checked when the sale's transaction commits
+        with mock.patch('cart.sync.deduct_stock', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            response = self.client.post('/api/cart/sync/', {'sales': [self.sale('T4-001', 1)]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'failed')
+        self.assertFalse(Cart.objects.filter(client_ref='T4-001').exists())
+        response = self.client.post('/api/cart/sync/', {'sales': [self.sale('T4-001', 1)]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'applied')
+
+    def test_malformed_fields_are_invalid_per_sale(self):
+        response = self.client.post('/api/cart/sync/', {'sales': [
+            {**self.sale('T3-001', 1), 'patient_id': 'abc'},
+            {**self.sale('T3-002', 1), 'sold_at': '2026-13-45T10:00:00'},
+            {**self.sale('T3-003', 1), 'payment_method': 'M' * 21},
+            self.sale('T' * 65, 1),
+            {**self.sale('T3-005', 1), 'patient_id': '7'},
+            self.sale('T3-006', 1.7),
+            self.sale('T3-007', 0),
+            self.sale('T3-008', 2.0),
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['invalid'] * 4 + ['applied', 'invalid', 'invalid', 'applied'])
+        self.assertEqual(Inventory.objects.get(pk=self.item.pk).current_stock, 2)
+        self.assertEqual(Cart.objects.get(client_ref='T3-005').patient_id, 7)
@@ -5,12 +5,14 @@ from .views import (
     AddItemView,
     UpdateItemView,
     RemoveItemView,
-    CheckoutView
+    CheckoutView,
+    SyncSalesView
 )
 
 urlpatterns = [
     path('', CartView.as_view(), name='cart-active'),
     path('create/', CartView.as_view(), name='cart-create'),
+    path('sync/', SyncSalesView.as_view(), name='cart-sync'),
     path('<str:cart_id>/', CartDetailView.as_view(), name='cart-detail'),
     path('<str:cart_id>/add-item/', AddItemView.as_view(), name='add-item'),
     path('<str:cart_id>/items/<int:item_id>/', UpdateItemView.as_view(), name='update-item'),
@@ -1,9 +1,9 @@
-from datetime import timezone
 from rest_framework import views, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.utils import timezone
 
 from .models import Cart, CartItem
 from .serializers import (
@@ -13,6 +13,9 @@ from .serializers import (
     CartItemSerializer
 )
 from inventory.models import Inventory
+from inventory.stock import deduct_stock, InsufficientStock
+from .reservations import available_stock, reserve_cart, reservation_conflicts
+from .sync import sync_sales, MAX_SYNC_SALES
 
 class CartView(views.APIView):
     """Cart management view"""
@@ -20,7 +23,7 @@ class CartView(views.APIView):
     
     def get(self, request):
         """Get active cart or create new one"""
-        cart = Cart.objects.filter(
+        cart = Cart.objects.with_totals().filter(
             created_by=request.user,
             is_active=True,
             is_checked_out=False
@@ -51,7 +54,7 @@ class CartDetailView(views.APIView):
     
     def get(self, request, cart_id):
         """Get cart details"""
-        cart = get_object_or_404(Cart, cart_id=cart_id, created_by=request.user)
+        cart = get_object_or_404(Cart.objects.with_totals(), cart_id=cart_id, created_by=request.user)
         serializer = CartSerializer(cart)
         return Response(serializer.data)
 
@@ -67,24 +70,31 @@ class AddItemView(views.APIView):
         serializer.is_valid(raise_exception=True)
         
         data = serializer.validated_data
-        inventory_item = data['inventory_item']
         quantity = data['quantity']
         
-        # Check if item already in cart
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            inventory_item=inventory_item,
-            defaults={
-                'quantity': quantity,
-                'unit_price': inventory_item.selling_price
-            }
-        )
-        
-        if not created:
-            # Update existing item
-            cart_item.quantity += quantity
-            cart_item.save()
+        with transaction.atomic():
+            # Lock the item so two terminals cannot reserve the same last units
+            inventory_item = Inventory.objects.select_for_update().get(pk=data['inventory_item'].pk)
+            cart_item = CartItem.objects.filter(cart=cart, inventory_item=inventory_item).first()
+            new_quantity = quantity + (cart_item.quantity if cart_item else 0)
+            available = available_stock(inventory_item, exclude_cart=cart.pk)
+            if new_quantity > available:
+                return Response({'error': f"Only {available} available"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            if cart_item:
+                # Update existing item
+                cart_item.quantity = new_quantity
+                cart_item.save()
+            else:
+                cart_item = CartItem.objects.create(
+                    cart=cart,
+                    inventory_item=inventory_item,
+                    quantity=quantity,
+                    unit_price=inventory_item.selling_price
+                )
+            reserve_cart(cart)
         
+        cart_item.refresh_from_db(fields=['reserved_until'])
         serializer = CartItemSerializer(cart_item)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -103,10 +113,18 @@ class UpdateItemView(views.APIView):
         
         if quantity < 1:
             cart_item.delete()
-        else:
+            return Response(CartItemSerializer(cart_item).data)
+        
+        with transaction.atomic():
+            inventory_item = Inventory.objects.select_for_update().get(pk=cart_item.inventory_item_id)
+            available = available_stock(inventory_item, exclude_cart=cart.pk)
+            if quantity > available:
+                return Response({'error': f"Only {available} available"}, status=status.HTTP_400_BAD_REQUEST)
             cart_item.quantity = quantity
             cart_item.save()
+            reserve_cart(cart)
         
+        cart_item.refresh_from_db(fields=['reserved_until'])
         return Response(CartItemSerializer(cart_item).data)
 
 
@@ -137,18 +155,73 @@ class CheckoutView(views.APIView):
             cart.patient_id = data['patient_id']
         if data.get('patient_name'):
             cart.patient_name = data['patient_name']
-        # Update inventory and mark as checked out
-        with transaction.atomic():
-            for item in cart.items.all():
-                item.update_inventory()
-            cart.is_checked_out = True
-            cart.is_active = False
-            cart.checked_out_at = timezone.now()
-            cart.save()
+        # Deduct every line in one conditional UPDATE and mark as checked out
+        try:
+            with transaction.atomic():
+                # Lock the cart so a double-submitted checkout cannot sell twice
+                locked = Cart.objects.select_for_update().filter(pk=cart.pk, is_checked_out=False).exists()
+                if not locked:
+                    return Response({'error': 'Cart is already checked out'}, status=status.HTTP_400_BAD_REQUEST)
+                lines = list(cart.items.values_list('id', 'inventory_item_id', 'quantity'))
+                if not lines:
+                    return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+                # Lock the items before checking reservations: AddItemView reserves under
+                # the same row locks, so nothing can be reserved between check and sale
+                list(Inventory.objects.select_for_update().filter(
+                    pk__in={inventory_pk for _, inventory_pk, _ in lines}
+                ).order_by('pk').values_list('pk', flat=True))
+                conflicts = reservation_conflicts(cart)
+                if conflicts:
+                    return Response(
+                        {'error': 'Insufficient stock', 'conflicts': conflicts},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                quantities = {inventory_pk: quantity for _, inventory_pk, quantity in lines}
+                deduct_stock(quantities, reference=cart.cart_id, user=request.user)
+                cart.is_checked_out = True
+                cart.is_active = False
+                cart.payment_method = data['payment_method']
+                cart.checked_out_at = timezone.now()
+                cart.save()
+        except InsufficientStock as exc:
+            line_ids = {inventory_pk: line_id for line_id, inventory_pk, _ in lines}
+            for conflict in exc.conflicts:
+                conflict['cart_item'] = line_ids.get(conflict['inventory_item'])
+            return Response(
+                {'error': 'Insufficient stock', 'conflicts': exc.conflicts},
+                status=status.HTTP_409_CONFLICT
+            )
         from notifications.audit import log_action
         log_action(request.user, "update", f"Checked out cart: {cart.cart_id}", {"cart_id": cart.cart_id})
-        serializer = CartSerializer(cart)
+        serializer = CartSerializer(Cart.objects.with_totals().get(pk=cart.pk))
         return Response({
             'message': 'Checkout successful',
             'cart': serializer.data,
-        })
\ No newline at end of file
+        })
+
+
+class SyncSalesView(views.APIView):
+    """
+    Batch sync for offline terminals.
+    POST {"sales": [{"client_ref", "payment_method", "lines": [{"inventory_item_id", "quantity"}],
+                     "patient_id"?, "patient_name"?, "sold_at"?}, ...]}
+    Each sale is applied in its own transaction; results come back in the same order
+    with a status of applied, duplicate, rejected (stock), invalid or failed.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        sales = request.data.get('sales') if isinstance(request.data, dict) else request.data
+        if not isinstance(sales, list) or not sales:
+            return Response({'error': 'sales must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(sales) > MAX_SYNC_SALES:
+            return Response({'error': f"At most {MAX_SYNC_SALES} sales per sync"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = sync_sales(sales, request.user)
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        
+        from notifications.audit import log_action
+        log_action(request.user, "create", f"Synced {len(results)} offline sale(s)", counts)
+        return Response({'results': results, 'summary': counts})
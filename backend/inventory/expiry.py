@@ -0,0 +1,108 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, When, Value, CharField, Count, Q, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Inventory, InventoryAdjustment, StockLot, generate_adjustment_id
+
+
+def _flag_case(today, soon):
+    return Case(
+        When(expiry_date__lt=today, then=Value('EXPIRED')),
+        When(expiry_date__lte=soon, then=Value('EXPIRING_SOON')),
+        default=Value(''),
+        output_field=CharField()
+    )
+
+
+def flag_expiry(model, today, soon):
+    """Set expiry_flag on every row of model with one UPDATE, touching only rows whose flag changes"""
+    flag = _flag_case(today, soon)
+    return model.objects.exclude(expiry_flag=flag).update(expiry_flag=flag)
+
+
+def queue_expired_write_offs(today, user=None):
+    """
+    bulk_create a pending 'Expired' adjustment for each expired lot with stock,
+    and for the stock of expired items that is not held in any lot, unless one
+    is already pending.
+    """
+    pending = InventoryAdjustment.objects.filter(adjustment_type='Expired', status='Pending')
+    lots = StockLot.objects.filter(expiry_date__lt=today, quantity__gt=0).exclude(
+        pk__in=pending.filter(lot__isnull=False).values('lot')
+    )
+    items = Inventory.objects.filter(expiry_date__lt=today, current_stock__gt=0).exclude(
+        pk__in=pending.filter(lot__isnull=True).values('inventory_item')
+    ).annotate(
+        untracked=F('current_stock') - Coalesce(Sum('lots__quantity', filter=Q(lots__quantity__gt=0)), 0)
+    ).filter(untracked__gt=0)
+
+    adjustments = [
+        InventoryAdjustment(
+            adjustment_id=generate_adjustment_id(),
+            inventory_item_id=lot.inventory_item_id,
+            lot=lot,
+            batch_number=lot.batch_number,
+            quantity=lot.quantity,
+            adjustment_type='Expired',
+            reason=f"Lot expired on {lot.expiry_date} (expiry sweep)",
+            created_by=user,
+        )
+        for lot in lots
+    ] + [
+        InventoryAdjustment(
+            adjustment_id=generate_adjustment_id(),
+            inventory_item=item,
+            quantity=item.untracked,
+            adjustment_type='Expired',
+            reason=f"Item expired on {item.expiry_date} (expiry sweep)",
+            created_by=user,
+        )
+        for item in items
+    ]
+    return InventoryAdjustment.objects.bulk_create(adjustments)
+
+
+def _flag_counts(model):
+    return model.objects.aggregate(
+        expired=Count('id', filter=Q(expiry_flag='EXPIRED')),
+        expiring_soon=Count('id', filter=Q(expiry_flag='EXPIRING_SOON')),
+    )
+
+
+def sweep_expiry(days=30, user=None, today=None):
+    """
+    Flag expired and soon-to-expire items and lots, queue write-offs for
+    expired stock and log a single summary notification. Safe to re-run:
+    already pending write-offs are not duplicated.
+    """
+    today = today or timezone.localdate()
+    soon = today + timedelta(days=days)
+    with transaction.atomic():
+        changed = flag_expiry(Inventory, today, soon) + flag_expiry(StockLot, today, soon)
+        adjustments = queue_expired_write_offs(today, user)
+
+    items = _flag_counts(Inventory)
+    lots = _flag_counts(StockLot)
+    summary = {
+        'date': today.isoformat(),
+        'days': days,
+        'flags_changed': changed,
+        'expired_items': items['expired'],
+        'expiring_items': items['expiring_soon'],
+        'expired_lots': lots['expired'],
+        'expiring_lots': lots['expiring_soon'],
+        'write_offs_queued': len(adjustments),
+        'adjustment_ids': [adjustment.adjustment_id for adjustment in adjustments],
+    }
+
+    if changed or adjustments:
+        from notifications.audit import log_action
+        log_action(
+            user, "update",
+            f"Expiry sweep: {items['expired']} item(s) and {lots['expired']} lot(s) expired, "
+            f"{items['expiring_soon']} item(s) and {lots['expiring_soon']} lot(s) expire within {days} days, "
+            f"{len(adjustments)} write-off(s) awaiting approval",
+            summary
+        )
+    return summary
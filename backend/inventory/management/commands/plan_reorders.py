@@ -0,0 +1,39 @@
+"""
+Management command to suggest reorder quantities from consumption velocity
+Usage: python manage.py plan_reorders [--department PHARMACY|LAB] [--history-days 90]
+       [--lead-time 7] [--cover-days 30] [--all]
+"""
+from django.core.management.base import BaseCommand
+from inventory.reorder import plan_reorders
+
+
+class Command(BaseCommand):
+    help = 'Suggest reorder quantities and days of cover for inventory items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--department', choices=['PHARMACY', 'LAB'])
+        parser.add_argument('--history-days', type=int, default=90, help='Days of consumption to learn from')
+        parser.add_argument('--lead-time', type=int, default=7, help='Supplier lead time in days')
+        parser.add_argument('--cover-days', type=int, default=30, help='Days of stock each order should cover')
+        parser.add_argument('--all', action='store_true', help='List items that do not need reordering too')
+
+    def handle(self, *args, **options):
+        plans = plan_reorders(
+            history_days=options['history_days'],
+            lead_time_days=options['lead_time'],
+            cover_days=options['cover_days'],
+            department=options['department'],
+        )
+        if not options['all']:
+            plans = [plan for plan in plans if plan['needs_reorder']]
+
+        self.stdout.write(f"{'Item':<40} {'Stock':>7} {'Per day':>8} {'Cover':>7} {'Order':>7}")
+        for plan in plans:
+            cover = f"{plan['days_of_cover']:.1f}d" if plan['days_of_cover'] is not None else '-'
+            self.stdout.write(
+                f"{plan['name'][:40]:<40} {plan['current_stock']:>7} "
+                f"{plan['recent_daily_usage']:>8.2f} {cover:>7} {plan['suggested_quantity']:>7}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(1 for plan in plans if plan['needs_reorder'])} item(s) need reordering"
+        ))
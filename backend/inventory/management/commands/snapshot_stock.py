@@ -0,0 +1,22 @@
+"""
+Management command to store each item's closing stock for a day
+Usage: python manage.py snapshot_stock [--date YYYY-MM-DD]  (defaults to yesterday; run nightly)
+"""
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from inventory.stock import snapshot_stock
+
+
+class Command(BaseCommand):
+    help = 'Snapshot closing stock per inventory item for a day'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to snapshot (YYYY-MM-DD). Defaults to yesterday')
+
+    def handle(self, *args, **options):
+        day = parse_date(options['date']) if options['date'] else date.today() - timedelta(days=1)
+        if not day:
+            raise CommandError('Invalid date')
+        count = snapshot_stock(day)
+        self.stdout.write(self.style.SUCCESS(f'Snapshotted closing stock for {count} item(s) on {day}'))
@@ -0,0 +1,21 @@
+"""
+Management command to flag expired / expiring stock and queue write-offs
+Usage: python manage.py sweep_expiry [--days 30]  (run daily, e.g. from cron)
+"""
+from django.core.management.base import BaseCommand
+from inventory.expiry import sweep_expiry
+
+
+class Command(BaseCommand):
+    help = 'Flag expired and soon-to-expire stock and queue pending Expired adjustments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Flag stock expiring within this many days')
+
+    def handle(self, *args, **options):
+        summary = sweep_expiry(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['expired_items']} expired and {summary['expiring_items']} expiring item(s), "
+            f"{summary['expired_lots']} expired and {summary['expiring_lots']} expiring lot(s); "
+            f"{summary['write_offs_queued']} write-off(s) queued"
+        ))
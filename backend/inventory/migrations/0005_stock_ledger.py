@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_inventoryadjustment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_type', models.CharField(choices=[('RECEIPT', 'Stock Receipt'), ('SALE', 'Sale'), ('ADJUSTMENT', 'Adjustment'), ('TRANSFER', 'Transfer')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to=settings.AUTH_USER_MODEL)),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.inventory')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['inventory_item', 'created_at'], name='inventory_s_invento_c4ac09_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('closing_stock', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.inventory')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('inventory_item', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:27
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_number', models.CharField(blank=True, max_length=100)),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('manufacturing_date', models.DateField(blank=True, null=True)),
+                ('quantity', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+                ('received_quantity', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='inventory.inventory')),
+            ],
+            options={
+                'ordering': ['expiry_date', 'received_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='inventoryadjustment',
+            name='lot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='adjustments', to='inventory.stocklot'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='lot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movements', to='inventory.stocklot'),
+        ),
+        migrations.AddIndex(
+            model_name='stocklot',
+            index=models.Index(fields=['inventory_item', 'expiry_date'], name='inventory_s_invento_248d8b_idx'),
+        ),
+    ]
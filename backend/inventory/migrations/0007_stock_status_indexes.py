@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_stock_lots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['department', 'is_active', 'current_stock'], name='inventory_i_departm_833e5b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['expiry_date'], name='inventory_i_expiry__faeaca_idx'),
+        ),
+    ]
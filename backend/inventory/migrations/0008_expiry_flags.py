@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stock_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='expiry_flag',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('EXPIRING_SOON', 'Expiring Soon'), ('EXPIRED', 'Expired')], db_index=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='stocklot',
+            name='expiry_flag',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('EXPIRING_SOON', 'Expiring Soon'), ('EXPIRED', 'Expired')], db_index=True, default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:34
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_expiry_flags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockTake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(editable=False, max_length=50, unique=True)),
+                ('department', models.CharField(blank=True, choices=[('PHARMACY', 'Pharmacy'), ('LAB', 'Laboratory')], max_length=20)),
+                ('status', models.CharField(choices=[('Open', 'Open'), ('Applied', 'Applied'), ('Cancelled', 'Cancelled')], default='Open', max_length=20)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('applied_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='applied_stock_takes', to=settings.AUTH_USER_MODEL)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_stock_takes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockTakeLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counted_quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('expected_quantity', models.IntegerField(default=0)),
+                ('variance', models.IntegerField(default=0)),
+                ('counted_at', models.DateTimeField(auto_now=True)),
+                ('inventory_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_take_lines', to='inventory.inventory')),
+                ('stock_take', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='inventory.stocktake')),
+            ],
+            options={
+                'ordering': ['inventory_item__name'],
+                'constraints': [models.UniqueConstraint(fields=('stock_take', 'inventory_item'), name='unique_stock_take_item')],
+            },
+        ),
+    ]
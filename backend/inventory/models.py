@@ -8,6 +8,60 @@ def generate_item_id():
     """Generate unique item ID"""
     return uuid.uuid4().hex[:8].upper()
 
+def generate_adjustment_id():
+    """Generate unique adjustment ID"""
+    return f"RET-{uuid.uuid4().hex[:8].upper()}"
+
+STOCK_STATUS_CHOICES = [
+    ('EXPIRED', 'Expired'),
+    ('OUT_OF_STOCK', 'Out of Stock'),
+    ('LOW_STOCK', 'Low Stock'),
+    ('EXPIRING_SOON', 'Expiring Soon'),
+    ('GOOD', 'Good'),
+]
+
+# Stored by the expiry sweeper (inventory.expiry.sweep_expiry)
+EXPIRY_FLAG_CHOICES = [
+    ('', 'None'),
+    ('EXPIRING_SOON', 'Expiring Soon'),
+    ('EXPIRED', 'Expired'),
+]
+
+class InventoryQuerySet(models.QuerySet):
+    def with_stock_status(self):
+        """Annotate computed_stock_status in SQL, mirroring Inventory.stock_status"""
+        today = date.today()
+        return self.annotate(computed_stock_status=models.Case(
+            models.When(expiry_date__lt=today, then=models.Value('EXPIRED')),
+            models.When(current_stock=0, then=models.Value('OUT_OF_STOCK')),
+            models.When(current_stock__lte=models.F('minimum_stock'), then=models.Value('LOW_STOCK')),
+            models.When(expiry_date__lte=today + timedelta(days=30), then=models.Value('EXPIRING_SOON')),
+            default=models.Value('GOOD'),
+            output_field=models.CharField(max_length=20),
+        ))
+    
+    def filter_stock_status(self, statuses):
+        """
+        Keep items in any of the given statuses. Each status is spelled out as
+        plain column conditions (not a filter on the Case annotation) so the
+        current_stock and expiry_date indexes can be used.
+        """
+        today = date.today()
+        soon = today + timedelta(days=30)
+        not_expired = models.Q(expiry_date__isnull=True) | models.Q(expiry_date__gte=today)
+        above_minimum = models.Q(current_stock__gt=models.F('minimum_stock')) & models.Q(current_stock__gt=0)
+        conditions = {
+            'EXPIRED': models.Q(expiry_date__lt=today),
+            'OUT_OF_STOCK': not_expired & models.Q(current_stock=0),
+            'LOW_STOCK': not_expired & models.Q(current_stock__gt=0, current_stock__lte=models.F('minimum_stock')),
+            'EXPIRING_SOON': above_minimum & models.Q(expiry_date__gte=today, expiry_date__lte=soon),
+            'GOOD': above_minimum & (models.Q(expiry_date__isnull=True) | models.Q(expiry_date__gt=soon)),
+        }
+        combined = models.Q(pk__in=[])
+        for status in statuses:
+            combined |= conditions[status]
+        return self.filter(combined)
+
 class Inventory(models.Model):
     """Simplified inventory model"""
     
@@ -51,6 +105,7 @@ class Inventory(models.Model):
 
     # Expiry
     expiry_date = models.DateField(null=True, blank=True)
+    expiry_flag = models.CharField(max_length=20, choices=EXPIRY_FLAG_CHOICES, blank=True, default='', db_index=True)
 
     # Lock: Only visible to admin if locked
     is_locked = models.BooleanField(default=False)
@@ -63,9 +118,15 @@ class Inventory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = InventoryQuerySet.as_manager()
+    
     class Meta:
         ordering = ['name']
         verbose_name_plural = "Inventories"
+        indexes = [
+            models.Index(fields=['department', 'is_active', 'current_stock']),
+            models.Index(fields=['expiry_date']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.department})"
@@ -79,6 +140,8 @@ class Inventory(models.Model):
     @property
     def stock_status(self):
         """Calculate stock status"""
+        if hasattr(self, 'computed_stock_status'):
+            return self.computed_stock_status
         if self.expiry_date and self.expiry_date < date.today():
             return 'EXPIRED'
         if self.current_stock == 0:
@@ -96,6 +159,37 @@ class Inventory(models.Model):
         """Calculate total inventory value"""
         return float(self.current_stock * self.selling_price)
 
+class StockLot(models.Model):
+    """A received batch of an inventory item with its own expiry"""
+    inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='lots')
+    batch_number = models.CharField(max_length=100, blank=True)
+    expiry_date = models.DateField(null=True, blank=True)
+    expiry_flag = models.CharField(max_length=20, choices=EXPIRY_FLAG_CHOICES, blank=True, default='', db_index=True)
+    manufacturing_date = models.DateField(null=True, blank=True)
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    received_quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    received_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['expiry_date', 'received_at']
+        indexes = [
+            models.Index(fields=['inventory_item', 'expiry_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.inventory_item.name} lot {self.batch_number or self.pk}"
+    
+    @property
+    def stock_status(self):
+        """Calculate lot status"""
+        if self.expiry_date and self.expiry_date < date.today():
+            return 'EXPIRED'
+        if self.quantity == 0:
+            return 'EMPTY'
+        if self.expiry_date and self.expiry_date <= date.today() + timedelta(days=30):
+            return 'EXPIRING_SOON'
+        return 'GOOD'
+
 class InventoryAdjustment(models.Model):
     """Track inventory returns, damages, and adjustments"""
     
@@ -121,6 +215,7 @@ class InventoryAdjustment(models.Model):
     # Item details
     inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='adjustments')
     batch_number = models.CharField(max_length=100, blank=True, null=True)
+    lot = models.ForeignKey(StockLot, on_delete=models.SET_NULL, null=True, blank=True, related_name='adjustments')
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     
     # Adjustment details
@@ -136,13 +231,107 @@ class InventoryAdjustment(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.adjustment_id:
-            # Generate unique ID
-            import random
-            self.adjustment_id = f"RET-{random.randint(1000, 9999)}"
+            self.adjustment_id = generate_adjustment_id()
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.adjustment_id} - {self.inventory_item.name}"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class StockMovement(models.Model):
+    """Append-only ledger of every change to Inventory.current_stock"""
+    
+    TYPE_CHOICES = [
+        ('RECEIPT', 'Stock Receipt'),
+        ('SALE', 'Sale'),
+        ('ADJUSTMENT', 'Adjustment'),
+        ('TRANSFER', 'Transfer'),
+    ]
+    
+    inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='movements')
+    movement_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    # Signed: positive adds stock, negative removes it
+    quantity = models.IntegerField()
+    lot = models.ForeignKey(StockLot, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+    reference = models.CharField(max_length=100, blank=True)
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Stock movements are append-only")
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.movement_type} {self.quantity:+d} {self.inventory_item.name}"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['inventory_item', 'created_at']),
+        ]
+
+class StockSnapshot(models.Model):
+    """Closing stock per item per day, so stock on a date needs no full ledger replay"""
+    inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='snapshots')
+    date = models.DateField()
+    closing_stock = models.IntegerField()
+    created_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.inventory_item.name} on {self.date}: {self.closing_stock}"
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['inventory_item', 'date']
+
+class StockTake(models.Model):
+    """A stock count session; counts are uploaded in bulk and applied once"""
+    
+    STATUS_CHOICES = [
+        ('Open', 'Open'),
+        ('Applied', 'Applied'),
+        ('Cancelled', 'Cancelled'),
+    ]
+    
+    reference = models.CharField(max_length=50, unique=True, editable=False)
+    department = models.CharField(max_length=20, choices=Inventory.DEPARTMENT_CHOICES, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Open')
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_stock_takes')
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='applied_stock_takes')
+    applied_at = models.DateTimeField(null=True, blank=True)
+    
+    def save(self, *args, **kwargs):
+        if not self.reference:
+            self.reference = f"ST-{date.today().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.reference} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
+
+class StockTakeLine(models.Model):
+    """Counted quantity of one item in a stock take"""
+    stock_take = models.ForeignKey(StockTake, on_delete=models.CASCADE, related_name='lines')
+    inventory_item = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='stock_take_lines')
+    counted_quantity = models.IntegerField(validators=[MinValueValidator(0)])
+    # Book stock when counted, replaced by the stock at apply time once applied
+    expected_quantity = models.IntegerField(default=0)
+    variance = models.IntegerField(default=0)
+    counted_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['inventory_item__name']
+        constraints = [
+            models.UniqueConstraint(fields=['stock_take', 'inventory_item'], name='unique_stock_take_item'),
+        ]
+    
+    def __str__(self):
+        return f"{self.stock_take.reference}: {self.inventory_item.name} = {self.counted_quantity}"
@@ -0,0 +1,17 @@
+from rest_framework.pagination import PageNumberPagination
+
+
+class InventoryPagination(PageNumberPagination):
+    """
+    Page-number pagination for stock screens. Only applied when the client
+    sends ?page= or ?page_size=, so callers expecting a plain list keep working.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.page_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
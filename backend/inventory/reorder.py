@@ -0,0 +1,121 @@
+import math
+from datetime import timedelta
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from billing.models import InvoiceItem
+from cart.models import CartItem
+from .models import Inventory, InventoryAdjustment
+from .stock import day_start
+
+RECENT_DAYS = 14  # window of the moving average used as the demand base
+SAFETY_FACTOR = 1.65  # ~95% service level
+WRITE_OFF_TYPES = ['Damaged', 'Expired', 'Loss']
+WRITE_OFF_STATUSES = ['Approved', 'Disposed']
+
+
+def _daily_totals(queryset, time_field, quantity_field, start, end, items):
+    """{inventory_pk: {date: quantity}} from one grouped query over [start, end)"""
+    queryset = queryset.filter(**{f'{time_field}__gte': day_start(start), f'{time_field}__lt': day_start(end)})
+    if items is not None:
+        queryset = queryset.filter(inventory_item__in=items)
+    return queryset.annotate(day=TruncDate(time_field)).order_by().values(
+        'inventory_item', 'day'
+    ).annotate(used=Sum(quantity_field)).values_list('inventory_item', 'day', 'used')
+
+
+def daily_consumption(start, end, items=None):
+    """
+    Units consumed per item per day in [start, end): lines of paid invoices
+    (by payment date), lines of checked-out carts (by checkout time) and
+    approved damage, expiry and loss write-offs (by approval). Read from the
+    sales themselves rather than the stock ledger, so history from before the
+    ledger counts and stock-take corrections do not. Three grouped queries.
+    Returns {inventory_pk: {date: quantity}}.
+    """
+    sources = [
+        (InvoiceItem.objects.filter(invoice__status='Paid', inventory_item__isnull=False),
+         'invoice__payment_date', 'quantity'),
+        (CartItem.objects.filter(cart__is_checked_out=True), 'cart__checked_out_at', 'quantity'),
+        (InventoryAdjustment.objects.filter(status__in=WRITE_OFF_STATUSES, adjustment_type__in=WRITE_OFF_TYPES),
+         'updated_at', 'quantity'),
+    ]
+    usage = {}
+    for queryset, time_field, quantity_field in sources:
+        for pk, day, used in _daily_totals(queryset, time_field, quantity_field, start, end, items):
+            days = usage.setdefault(pk, {})
+            days[day] = days.get(day, 0) + float(used)
+    return usage
+
+
+def _weekday_factors(days, series, mean):
+    """Demand on each weekday relative to the overall mean (1.0 when flat or unknown)"""
+    totals, counts = [0] * 7, [0] * 7
+    for day, used in zip(days, series):
+        totals[day.weekday()] += used
+        counts[day.weekday()] += 1
+    return [
+        (totals[wd] / counts[wd]) / mean if counts[wd] and mean else 1.0
+        for wd in range(7)
+    ]
+
+
+def plan_item(item, usage, today, history_days, lead_time_days, cover_days):
+    """Forecast demand for one item and size its reorder"""
+    window_start = today - timedelta(days=history_days)
+    first_day = max(window_start, timezone.localtime(item.created_at).date())
+    days = [first_day + timedelta(days=offset) for offset in range((today - first_day).days)] or [today]
+    series = [usage.get(day, 0) for day in days]
+
+    mean = sum(series) / len(series)
+    recent = series[-RECENT_DAYS:]
+    base = sum(recent) / len(recent)
+    deviation = math.sqrt(sum((used - mean) ** 2 for used in series) / len(series))
+    factors = _weekday_factors(days, series, mean)
+
+    horizon = [today + timedelta(days=offset) for offset in range(lead_time_days + cover_days)]
+    forecast = [base * factors[day.weekday()] for day in horizon]
+    lead_demand = sum(forecast[:lead_time_days])
+    safety_stock = SAFETY_FACTOR * deviation * math.sqrt(lead_time_days)
+    reorder_point = math.ceil(lead_demand + safety_stock)
+    needs_reorder = base > 0 and item.current_stock <= reorder_point
+    suggested = max(math.ceil(sum(forecast) + safety_stock - item.current_stock), 0) if needs_reorder else 0
+
+    return {
+        'inventory_item': item.pk,
+        'item_id': item.item_id,
+        'name': item.name,
+        'department': item.department,
+        'current_stock': item.current_stock,
+        'minimum_stock': item.minimum_stock,
+        'average_daily_usage': round(mean, 2),
+        'recent_daily_usage': round(base, 2),
+        'days_of_cover': round(item.current_stock / base, 1) if base else None,
+        'reorder_point': reorder_point,
+        'safety_stock': math.ceil(safety_stock),
+        'suggested_quantity': suggested,
+        'needs_reorder': needs_reorder,
+    }
+
+
+def plan_reorders(history_days=90, lead_time_days=7, cover_days=30, department=None, today=None):
+    """
+    Reorder suggestions for every active item: a 14-day moving average
+    scaled by weekday seasonality over the history window, with safety stock
+    from the day-to-day variation. Four queries for the whole catalog.
+    Sorted by days of cover, items without demand last.
+    """
+    today = today or timezone.localdate()
+    items = Inventory.objects.filter(is_active=True)
+    if department:
+        items = items.filter(department=department)
+    usage = daily_consumption(today - timedelta(days=history_days), today,
+                              items if department else None)
+
+    plans = [
+        plan_item(item, usage.get(item.pk, {}), today, history_days, lead_time_days, cover_days)
+        for item in items.only('id', 'item_id', 'name', 'department', 'current_stock',
+                               'minimum_stock', 'created_at')
+    ]
+    plans.sort(key=lambda plan: (plan['days_of_cover'] is None, plan['days_of_cover'] or 0, plan['name']))
+    return plans
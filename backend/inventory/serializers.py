@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Inventory, InventoryAdjustment
+from .models import Inventory, InventoryAdjustment, StockLot, StockMovement, StockTake
 from datetime import timedelta, date
 
 class InventorySerializer(serializers.ModelSerializer):
@@ -13,10 +13,10 @@ class InventorySerializer(serializers.ModelSerializer):
         fields = [
             'id', 'item_id', 'name', 'department', 'manufacturer', 'manufacturing_date',
             'current_stock', 'minimum_stock', 'unit_of_measure', 'unit_cost', 'selling_price',
-            'expiry_date', 'is_active', 'is_locked', 'stock_status', 'total_value',
+            'expiry_date', 'expiry_flag', 'is_active', 'is_locked', 'stock_status', 'total_value',
             'created_by', 'created_by_username', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'item_id', 'stock_status', 'total_value', 
+        read_only_fields = ['id', 'item_id', 'expiry_flag', 'stock_status', 'total_value', 
                            'created_by', 'created_at', 'updated_at']
 
     def validate_expiry_date(self, value):
@@ -33,8 +33,52 @@ class InventoryAdjustmentSerializer(serializers.ModelSerializer):
         model = InventoryAdjustment
         fields = [
             'id', 'adjustment_id', 'inventory_item', 'inventory_item_name',
-            'batch_number', 'quantity', 'adjustment_type', 'reason', 'status',
+            'batch_number', 'lot', 'quantity', 'adjustment_type', 'reason', 'status',
             'created_by', 'created_by_name', 'approved_by', 'approved_by_name',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'adjustment_id', 'created_by', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'adjustment_id', 'created_by', 'created_at', 'updated_at']
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    inventory_item_name = serializers.CharField(source='inventory_item.name', read_only=True)
+    created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
+    
+    class Meta:
+        model = StockMovement
+        fields = [
+            'id', 'inventory_item', 'inventory_item_name', 'movement_type', 'quantity',
+            'lot', 'reference', 'notes', 'created_by', 'created_by_name', 'created_at'
+        ]
+        read_only_fields = fields
+
+
+class StockLotSerializer(serializers.ModelSerializer):
+    inventory_item_name = serializers.CharField(source='inventory_item.name', read_only=True)
+    department = serializers.CharField(source='inventory_item.department', read_only=True)
+    stock_status = serializers.CharField(read_only=True)
+    
+    class Meta:
+        model = StockLot
+        fields = [
+            'id', 'inventory_item', 'inventory_item_name', 'department', 'batch_number',
+            'expiry_date', 'expiry_flag', 'manufacturing_date', 'quantity', 'received_quantity',
+            'stock_status', 'received_at'
+        ]
+        read_only_fields = fields
+
+
+class StockTakeSerializer(serializers.ModelSerializer):
+    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+    applied_by_name = serializers.CharField(source='applied_by.username', read_only=True)
+    line_count = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = StockTake
+        fields = [
+            'id', 'reference', 'department', 'status', 'notes', 'line_count',
+            'created_by', 'created_by_name', 'created_at',
+            'applied_by', 'applied_by_name', 'applied_at'
+        ]
+        read_only_fields = [
+            'id', 'reference', 'status', 'created_by', 'created_at', 'applied_by', 'applied_at'
+        ]
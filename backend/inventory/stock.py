@@ -0,0 +1,349 @@
+from datetime import date, datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Case, When, Value, F, Sum, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Inventory, StockLot, StockMovement, StockSnapshot
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more items cannot cover the requested quantity"""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__("Insufficient stock")
+
+
+def _actor(user):
+    return user if user is not None and user.is_authenticated else None
+
+
+def _quantity_case(quantities):
+    return Case(
+        *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+        output_field=IntegerField()
+    )
+
+
+def _clean_quantities(quantities):
+    return {pk: int(qty) for pk, qty in quantities.items() if qty and int(qty) > 0}
+
+
+def _record(quantities, sign, movement_type, reference, user, notes=''):
+    _record_allocations(
+        [(pk, None, qty) for pk, qty in quantities.items()],
+        sign, movement_type, reference, user, notes
+    )
+
+
+def _record_allocations(allocations, sign, movement_type, reference, user, notes=''):
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            inventory_item_id=pk,
+            lot_id=lot_pk,
+            movement_type=movement_type,
+            quantity=sign * qty,
+            reference=reference or '',
+            notes=notes or '',
+            created_by=_actor(user),
+        )
+        for pk, lot_pk, qty in allocations
+    ])
+
+
+def allocate_lots(quantities, include_expired=False, untracked_first=False):
+    """
+    Take {inventory_pk: quantity}, already removed from current_stock, out of
+    the items' lots first-expiry-first-out, using one ordered query that locks
+    the lot rows. Whatever the lots do not cover comes from untracked stock
+    received before lots existed, or comes from it before any lot with
+    untracked_first=True. Sales skip expired lots; write-offs pass
+    include_expired=True. Returns [(inventory_pk, lot_pk or None, quantity)].
+    """
+    today = date.today()
+    lots = StockLot.objects.select_for_update().select_related('inventory_item').filter(
+        inventory_item_id__in=quantities.keys(),
+        quantity__gt=0
+    ).order_by('inventory_item_id', F('expiry_date').asc(nulls_last=True), 'received_at', 'id')
+
+    lots_by_item = {}
+    for lot in lots:
+        lots_by_item.setdefault(lot.inventory_item_id, []).append(lot)
+
+    allocations, changed, conflicts = [], [], []
+    for pk, qty in quantities.items():
+        item_lots = lots_by_item.get(pk, [])
+        if not item_lots:
+            allocations.append((pk, None, qty))
+            continue
+
+        on_hand_before = item_lots[0].inventory_item.current_stock + qty
+        untracked = max(on_hand_before - sum(lot.quantity for lot in item_lots), 0)
+        remaining = qty
+        if untracked_first:
+            take = min(untracked, remaining)
+            if take:
+                allocations.append((pk, None, take))
+                remaining -= take
+                untracked -= take
+        for lot in item_lots:
+            if remaining == 0:
+                break
+            if not include_expired and lot.expiry_date and lot.expiry_date < today:
+                continue
+            take = min(lot.quantity, remaining)
+            lot.quantity -= take
+            remaining -= take
+            changed.append(lot)
+            allocations.append((pk, lot.pk, take))
+
+        take = min(untracked, remaining)
+        if take:
+            allocations.append((pk, None, take))
+            remaining -= take
+
+        if remaining:
+            item = item_lots[0].inventory_item
+            conflicts.append({
+                'inventory_item': pk,
+                'item_id': item.item_id,
+                'name': item.name,
+                'requested': qty,
+                'available': qty - remaining,
+                'error': f"Only {qty - remaining} unexpired in stock",
+            })
+
+    if conflicts:
+        raise InsufficientStock(conflicts)
+    StockLot.objects.bulk_update(changed, ['quantity'])
+    return allocations
+
+
+def deduct_stock(quantities, reference='', user=None, movement_type='SALE', notes=''):
+    """
+    Deduct stock for {inventory_pk: quantity} in a single conditional UPDATE:
+    current_stock = current_stock - qty WHERE current_stock >= qty.
+    Either every item is deducted and its movement recorded, or none is and
+    InsufficientStock is raised with one conflict per short item. The rows are
+    locked in primary key order first, so concurrent multi-item sales queue
+    behind each other instead of deadlocking.
+    """
+    quantities = _clean_quantities(quantities)
+    if not quantities:
+        return
+
+    needed = _quantity_case(quantities)
+    try:
+        with transaction.atomic():
+            list(Inventory.objects.select_for_update().filter(
+                pk__in=quantities.keys()
+            ).order_by('pk').values_list('pk', flat=True))
+            updated = Inventory.objects.filter(
+                pk__in=quantities.keys(),
+                current_stock__gte=needed
+            ).update(current_stock=F('current_stock') - needed)
+            if updated != len(quantities):
+                # Roll back the rows that did have enough stock
+                raise InsufficientStock(None)
+            allocations = allocate_lots(quantities, include_expired=movement_type != 'SALE')
+            _record_allocations(allocations, -1, movement_type, reference, user, notes)
+    except InsufficientStock as exc:
+        if exc.conflicts is not None:
+            raise
+        raise InsufficientStock(stock_conflicts(quantities))
+
+
+def add_stock(quantities, reference='', user=None, movement_type='RECEIPT', notes=''):
+    """Add stock for {inventory_pk: quantity} with one UPDATE and record the movements"""
+    quantities = _clean_quantities(quantities)
+    if not quantities:
+        return
+
+    added = _quantity_case(quantities)
+    with transaction.atomic():
+        Inventory.objects.filter(pk__in=quantities.keys()).update(
+            current_stock=F('current_stock') + added
+        )
+        _record(quantities, 1, movement_type, reference, user, notes)
+
+
+def write_off_stock(inventory_pk, quantity, reference='', user=None, movement_type='ADJUSTMENT', notes='', lot_pk=None,
+                    untracked_first=False):
+    """
+    Remove up to quantity (never below zero) and return how much was removed.
+    With lot_pk the write-off comes out of that lot, otherwise lots are used
+    first-expiry-first-out, expired ones included, after untracked stock when
+    untracked_first=True.
+    """
+    with transaction.atomic():
+        on_hand = Inventory.objects.select_for_update().values_list(
+            'current_stock', flat=True
+        ).get(pk=inventory_pk)
+        removed = min(int(quantity), on_hand)
+        if lot_pk:
+            lot = StockLot.objects.select_for_update().get(pk=lot_pk, inventory_item_id=inventory_pk)
+            removed = min(removed, lot.quantity)
+        if removed > 0:
+            Inventory.objects.filter(pk=inventory_pk).update(current_stock=F('current_stock') - removed)
+            if lot_pk:
+                StockLot.objects.filter(pk=lot_pk).update(quantity=F('quantity') - removed)
+                allocations = [(inventory_pk, lot_pk, removed)]
+            else:
+                allocations = allocate_lots({inventory_pk: removed}, include_expired=True,
+                                           untracked_first=untracked_first)
+            _record_allocations(allocations, -1, movement_type, reference, user, notes)
+    return removed
+
+
+def receive_lot(inventory_pk, quantity, batch_number='', expiry_date=None, manufacturing_date=None,
+                reference='', user=None, notes=''):
+    """Receive a delivery as a new lot and add it to stock"""
+    with transaction.atomic():
+        lot = StockLot.objects.create(
+            inventory_item_id=inventory_pk,
+            batch_number=batch_number or '',
+            expiry_date=expiry_date,
+            manufacturing_date=manufacturing_date,
+            quantity=quantity,
+            received_quantity=quantity,
+        )
+        Inventory.objects.filter(pk=inventory_pk).update(current_stock=F('current_stock') + quantity)
+        _record_allocations([(inventory_pk, lot.pk, quantity)], 1, 'RECEIPT', reference or batch_number, user, notes)
+    return lot
+
+
+def transfer_stock(from_pk, to_pk, quantity, reference='', user=None, notes=''):
+    """Move stock between two items (e.g. pharmacy to lab) as a pair of TRANSFER movements"""
+    with transaction.atomic():
+        deduct_stock({from_pk: quantity}, reference, user, 'TRANSFER', notes)
+        add_stock({to_pk: quantity}, reference, user, 'TRANSFER', notes)
+
+
+def record_stock_change(inventory_pk, delta, reference='', user=None, movement_type='ADJUSTMENT', notes=''):
+    """Record a change that was already applied to current_stock (e.g. a direct edit)"""
+    if delta > 0:
+        _record({inventory_pk: delta}, 1, movement_type, reference, user, notes)
+    elif delta < 0:
+        allocations = allocate_lots({inventory_pk: -delta}, include_expired=True)
+        _record_allocations(allocations, -1, movement_type, reference, user, notes)
+
+
+def set_stock_levels(levels, reference='', user=None, notes=''):
+    """
+    Set current_stock to {inventory_pk: level} with one bulk_update over the
+    locked rows and record the differences as ADJUSTMENT movements (shortfalls
+    come out of lots first-expiry-first-out). Returns {inventory_pk: (before, delta)}.
+    """
+    with transaction.atomic():
+        items = list(Inventory.objects.select_for_update().filter(pk__in=levels.keys()))
+        now = timezone.now()
+        changes, changed = {}, []
+        for item in items:
+            delta = levels[item.pk] - item.current_stock
+            changes[item.pk] = (item.current_stock, delta)
+            if delta:
+                item.current_stock = levels[item.pk]
+                item.updated_at = now
+                changed.append(item)
+        Inventory.objects.bulk_update(changed, ['current_stock', 'updated_at'], batch_size=500)
+
+        gains = {pk: delta for pk, (_, delta) in changes.items() if delta > 0}
+        losses = {pk: -delta for pk, (_, delta) in changes.items() if delta < 0}
+        if gains:
+            _record(gains, 1, 'ADJUSTMENT', reference, user, notes)
+        if losses:
+            allocations = allocate_lots(losses, include_expired=True)
+            _record_allocations(allocations, -1, 'ADJUSTMENT', reference, user, notes)
+    return changes
+
+
+def stock_conflicts(quantities):
+    """Describe every item in {inventory_pk: quantity} that cannot cover its quantity"""
+    rows = {
+        row['id']: row for row in Inventory.objects.filter(
+            pk__in=quantities.keys()
+        ).values('id', 'item_id', 'name', 'current_stock')
+    }
+    conflicts = []
+    for pk, qty in quantities.items():
+        row = rows.get(pk)
+        if row is None:
+            conflicts.append({
+                'inventory_item': pk,
+                'requested': qty,
+                'available': 0,
+                'error': 'Item not found',
+            })
+        elif row['current_stock'] < qty:
+            conflicts.append({
+                'inventory_item': pk,
+                'item_id': row['item_id'],
+                'name': row['name'],
+                'requested': qty,
+                'available': row['current_stock'],
+                'error': f"Not enough stock. Available: {row['current_stock']}",
+            })
+    return conflicts
+
+
+# ============ SNAPSHOTS ============
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _movements_since(start):
+    return Coalesce(Subquery(
+        StockMovement.objects.filter(
+            inventory_item=OuterRef('pk'),
+            created_at__gte=start
+        ).order_by().values('inventory_item').annotate(total=Sum('quantity')).values('total'),
+        output_field=IntegerField()
+    ), Value(0))
+
+
+def snapshot_stock(day):
+    """
+    Store every item's closing stock for day: current stock minus movements
+    recorded after that day, read in one statement. Re-running a day updates it.
+    """
+    end = day_start(day + timedelta(days=1))
+    rows = Inventory.objects.filter(created_at__lt=end).annotate(
+        later=_movements_since(end)
+    ).values_list('id', 'current_stock', 'later')
+
+    snapshots = [
+        StockSnapshot(inventory_item_id=pk, date=day, closing_stock=current - later)
+        for pk, current, later in rows
+    ]
+    StockSnapshot.objects.bulk_create(
+        snapshots,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['inventory_item', 'date'],
+        update_fields=['closing_stock', 'created_at'],
+    )
+    return len(snapshots)
+
+
+def stock_as_of(inventory_pk, day):
+    """
+    On-hand stock at the end of day: the latest snapshot on or before it plus
+    the movements since, or current stock minus later movements if none exists.
+    """
+    end = day_start(day + timedelta(days=1))
+    movements = StockMovement.objects.filter(inventory_item_id=inventory_pk)
+    snapshot = StockSnapshot.objects.filter(
+        inventory_item_id=inventory_pk, date__lte=day
+    ).order_by('-date').first()
+
+    if snapshot:
+        since = day_start(snapshot.date + timedelta(days=1))
+        delta = movements.filter(created_at__gte=since, created_at__lt=end).aggregate(
+            total=Sum('quantity')
+        )['total'] or 0
+        return snapshot.closing_stock + delta
+
+    current = Inventory.objects.values_list('current_stock', flat=True).get(pk=inventory_pk)
+    later = movements.filter(created_at__gte=end).aggregate(total=Sum('quantity'))['total'] or 0
+    return current - later
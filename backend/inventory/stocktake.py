@@ -0,0 +1,187 @@
+import csv
+import io
+from django.db import transaction
+from django.db.models import Q, F, Sum, Count, ExpressionWrapper, DecimalField
+from django.utils import timezone
+from .models import Inventory, InventoryAdjustment, StockTake, StockTakeLine, generate_adjustment_id
+from .stock import set_stock_levels
+
+COUNT_KEYS = ('counted_quantity', 'counted', 'quantity')
+
+
+def rows_from_csv(text):
+    """CSV with an item_id (or inventory_item) column and a counted_quantity column"""
+    return list(csv.DictReader(io.StringIO(text.lstrip('\ufeff'))))
+
+
+def _row_key(row):
+    item_id = str(row.get('item_id') or '').strip()
+    pk = str(row.get('inventory_item') or row.get('id') or '').strip()
+    return item_id, pk
+
+
+def _row_count(row):
+    for key in COUNT_KEYS:
+        value = row.get(key)
+        if value not in (None, ''):
+            try:
+                return int(str(value).strip())
+            except ValueError:
+                raise ValueError(f"Invalid counted quantity: {value}")
+    raise ValueError('counted_quantity is required')
+
+
+def record_counts(stock_take, rows):
+    """
+    Resolve uploaded rows to items with one query and upsert their lines in
+    one bulk_create; a recount of the same item replaces the earlier count.
+    Returns (lines recorded, [row errors]).
+    """
+    parsed, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        item_id, pk = _row_key(row)
+        try:
+            counted = _row_count(row)
+            if counted < 0:
+                raise ValueError('counted_quantity cannot be negative')
+            if not item_id and not pk.isdigit():
+                raise ValueError('item_id or inventory_item is required')
+        except ValueError as exc:
+            errors.append({'row': number, 'error': str(exc)})
+            continue
+        parsed.append((number, item_id, pk, counted))
+
+    items = Inventory.objects.filter(
+        Q(item_id__in=[item_id for _, item_id, _, _ in parsed if item_id]) |
+        Q(pk__in=[int(pk) for _, item_id, pk, _ in parsed if not item_id])
+    )
+    if stock_take.department:
+        items = items.filter(department=stock_take.department)
+    by_code, by_pk = {}, {}
+    for item in items.values('id', 'item_id', 'current_stock'):
+        by_code[item['item_id']] = by_pk[item['id']] = item
+
+    lines = {}
+    for number, item_id, pk, counted in parsed:
+        item = by_code.get(item_id) if item_id else by_pk.get(int(pk))
+        if item is None:
+            errors.append({'row': number, 'error': f"Item {item_id or pk} not found in this stock take"})
+            continue
+        lines[item['id']] = StockTakeLine(
+            stock_take=stock_take,
+            inventory_item_id=item['id'],
+            counted_quantity=counted,
+            expected_quantity=item['current_stock'],
+            variance=counted - item['current_stock'],
+        )
+
+    errors.sort(key=lambda error: error['row'])
+    StockTakeLine.objects.bulk_create(
+        lines.values(),
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['stock_take', 'inventory_item'],
+        update_fields=['counted_quantity', 'expected_quantity', 'variance', 'counted_at'],
+    )
+    return len(lines), errors
+
+
+def variance_report(stock_take):
+    """
+    Per-item variances and totals. Open sessions compare the counts with the
+    current book stock; applied ones report what was applied.
+    """
+    lines = stock_take.lines.all()
+    if stock_take.status == 'Open':
+        lines = lines.annotate(
+            book=F('inventory_item__current_stock'),
+            diff=F('counted_quantity') - F('inventory_item__current_stock'),
+        )
+    else:
+        lines = lines.annotate(book=F('expected_quantity'), diff=F('variance'))
+    lines = lines.annotate(value=ExpressionWrapper(
+        F('diff') * F('inventory_item__unit_cost'), output_field=DecimalField(max_digits=14, decimal_places=2)
+    ))
+
+    totals = lines.aggregate(
+        counted_items=Count('id'),
+        variance_items=Count('id', filter=~Q(diff=0)),
+        units_over=Sum('diff', filter=Q(diff__gt=0)),
+        units_short=Sum('diff', filter=Q(diff__lt=0)),
+        variance_value=Sum('value'),
+    )
+    uncounted = 0
+    if stock_take.department:
+        uncounted = Inventory.objects.filter(department=stock_take.department, is_active=True).exclude(
+            stock_take_lines__stock_take=stock_take
+        ).count()
+
+    rows = lines.order_by('inventory_item__name').values(
+        'inventory_item', 'inventory_item__item_id', 'inventory_item__name',
+        'counted_quantity', 'book', 'diff', 'value'
+    )
+    return {
+        'stock_take': stock_take.reference,
+        'status': stock_take.status,
+        'department': stock_take.department,
+        'counted_items': totals['counted_items'],
+        'variance_items': totals['variance_items'],
+        'units_over': totals['units_over'] or 0,
+        'units_short': -(totals['units_short'] or 0),
+        'variance_value': float(totals['variance_value'] or 0),
+        'uncounted_items': uncounted,
+        'lines': [
+            {
+                'inventory_item': row['inventory_item'],
+                'item_id': row['inventory_item__item_id'],
+                'name': row['inventory_item__name'],
+                'book_quantity': row['book'],
+                'counted_quantity': row['counted_quantity'],
+                'variance': row['diff'],
+                'variance_value': float(row['value'] or 0),
+            }
+            for row in rows
+        ],
+    }
+
+
+def apply_stock_take(stock_take, user=None):
+    """
+    Set every counted item to its count in one transaction: one bulk_update of
+    stock, ledger movements for the differences, and one bulk_create of
+    approved 'Adjustment' records. Raises ValueError unless the session is open.
+    """
+    with transaction.atomic():
+        stock_take = StockTake.objects.select_for_update().get(pk=stock_take.pk)
+        if stock_take.status != 'Open':
+            raise ValueError(f"Stock take is {stock_take.status.lower()}")
+
+        lines = list(stock_take.lines.all())
+        changes = set_stock_levels(
+            {line.inventory_item_id: line.counted_quantity for line in lines},
+            reference=stock_take.reference, user=user, notes='Stock take'
+        )
+
+        adjustments = []
+        for line in lines:
+            line.expected_quantity, line.variance = changes[line.inventory_item_id]
+            if line.variance:
+                adjustments.append(InventoryAdjustment(
+                    adjustment_id=generate_adjustment_id(),
+                    inventory_item_id=line.inventory_item_id,
+                    quantity=abs(line.variance),
+                    adjustment_type='Adjustment',
+                    reason=(f"Stock take {stock_take.reference}: counted {line.counted_quantity}, "
+                            f"book stock {line.expected_quantity}"),
+                    status='Approved',
+                    created_by=user,
+                    approved_by=user,
+                ))
+        StockTakeLine.objects.bulk_update(lines, ['expected_quantity', 'variance'], batch_size=500)
+        InventoryAdjustment.objects.bulk_create(adjustments, batch_size=500)
+
+        stock_take.status = 'Applied'
+        stock_take.applied_by = user
+        stock_take.applied_at = timezone.now()
+        stock_take.save(update_fields=['status', 'applied_by', 'applied_at'])
+    return stock_take
@@ -1,3 +1,387 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.core.files.uploadedfile import SimpleUploadedFile
+from .models import Inventory, InventoryAdjustment, StockLot, StockMovement, StockSnapshot, StockTake
+from .stock import (
+    deduct_stock, add_stock, receive_lot, set_stock_levels, snapshot_stock, stock_as_of, InsufficientStock
+)
+from .reorder import plan_reorders
+from .expiry import sweep_expiry
+from notifications.models import Notification
+from billing.models import Invoice, InvoiceItem
+from cart.models import Cart, CartItem
 
-# Create your tests here.
+
+class StockLedgerTestCase(APITestCase):
+    """Stock movements and point-in-time stock"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pharmacist', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.item = Inventory.objects.create(name='Ibuprofen 400mg', department='PHARMACY', current_stock=20)
+
+    def test_sales_and_receipts_are_recorded(self):
+        deduct_stock({self.item.pk: 5}, reference='INV-1', user=self.user)
+        add_stock({self.item.pk: 10}, reference='GRN-1', user=self.user)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 25)
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('movement_type', 'quantity')),
+            [('SALE', -5), ('RECEIPT', 10)]
+        )
+
+    def test_failed_deduction_records_nothing(self):
+        with self.assertRaises(InsufficientStock):
+            deduct_stock({self.item.pk: 21})
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_approved_write_off_goes_through_ledger(self):
+        adjustment = InventoryAdjustment.objects.create(
+            inventory_item=self.item, quantity=3, adjustment_type='Damaged',
+            reason='Broken blister', created_by=self.user
+        )
+        response = self.client.post(f'/api/inventory/adjustments/{adjustment.pk}/approve/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 17)
+        movement = StockMovement.objects.get()
+        self.assertEqual((movement.movement_type, movement.quantity), ('ADJUSTMENT', -3))
+        self.assertEqual(movement.reference, adjustment.adjustment_id)
+
+    def test_adjustment_is_written_off_once(self):
+        adjustment = InventoryAdjustment.objects.create(
+            inventory_item=self.item, quantity=3, adjustment_type='Damaged',
+            reason='Broken blister', created_by=self.user
+        )
+        url = f'/api/inventory/adjustments/{adjustment.pk}/approve/'
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 17)
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_item_edit_keeps_stock_and_ledgers_stock_changes(self):
+        url = f'/api/inventory/{self.item.pk}/'
+        deduct_stock({self.item.pk: 5}, reference='INV-1', user=self.user)
+        response = self.client.patch(url, {'name': 'Ibuprofen 400mg tabs'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['current_stock'], 15)
+
+        response = self.client.patch(url, {'current_stock': 18}, format='json')
+        self.assertEqual(response.data['current_stock'], 18)
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('movement_type', 'quantity')),
+            [('SALE', -5), ('ADJUSTMENT', 3)]
+        )
+
+    def test_transfer_moves_stock_between_items(self):
+        reagent = Inventory.objects.create(name='Ibuprofen 400mg', department='LAB', current_stock=0)
+        response = self.client.post('/api/inventory/transfer/', {
+            'from_item': self.item.pk, 'to_item': reagent.pk, 'quantity': 4
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        reagent.refresh_from_db()
+        self.assertEqual(reagent.current_stock, 4)
+        self.assertEqual(StockMovement.objects.filter(movement_type='TRANSFER').count(), 2)
+
+    def test_stock_as_of_uses_snapshots(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        Inventory.objects.filter(pk=self.item.pk).update(created_at=timezone.now() - timedelta(days=3))
+        deduct_stock({self.item.pk: 5})
+        # Today's sale happened after yesterday closed
+        self.assertEqual(stock_as_of(self.item.pk, yesterday), 20)
+        self.assertEqual(snapshot_stock(yesterday), 1)
+        self.assertEqual(StockSnapshot.objects.get().closing_stock, 20)
+
+        add_stock({self.item.pk: 2})
+        self.assertEqual(stock_as_of(self.item.pk, today), 17)
+        response = self.client.get(f'/api/inventory/{self.item.pk}/stock-on/', {'date': yesterday.isoformat()})
+        self.assertEqual(response.data['stock'], 20)
+
+    def test_invalid_dates_are_rejected(self):
+        deduct_stock({self.item.pk: 5})
+        today = timezone.localdate().isoformat()
+        response = self.client.get('/api/inventory/movements/', {'date_from': today, 'date_to': today})
+        self.assertEqual(len(response.data), 1)
+        for params in ({'date_from': 'bad'}, {'date_to': '2026-02-30'}):
+            response = self.client.get('/api/inventory/movements/', params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f'/api/inventory/{self.item.pk}/stock-on/', {'date': '2026-02-30'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StockLotTestCase(APITestCase):
+    """First-expiry-first-out lot allocation"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='storekeeper', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.item = Inventory.objects.create(name='Artemether/Lumefantrine', department='PHARMACY', current_stock=2)
+        today = timezone.localdate()
+        self.late = receive_lot(self.item.pk, 10, 'B-LATE', expiry_date=today + timedelta(days=300))
+        self.early = receive_lot(self.item.pk, 5, 'B-EARLY', expiry_date=today + timedelta(days=20))
+        self.expired = StockLot.objects.create(
+            inventory_item=self.item, batch_number='B-OLD', quantity=3,
+            expiry_date=today - timedelta(days=1)
+        )
+        # The expired lot was part of the opening stock
+        Inventory.objects.filter(pk=self.item.pk).update(current_stock=20)
+
+    def lot_quantities(self):
+        return dict(StockLot.objects.values_list('batch_number', 'quantity'))
+
+    def test_sale_takes_earliest_unexpired_lot_first(self):
+        deduct_stock({self.item.pk: 7}, reference='INV-7')
+        self.assertEqual(self.lot_quantities(), {'B-LATE': 8, 'B-EARLY': 0, 'B-OLD': 3})
+        movements = StockMovement.objects.filter(reference='INV-7')
+        self.assertEqual(
+            sorted(movements.values_list('lot__batch_number', 'quantity')),
+            [('B-EARLY', -5), ('B-LATE', -2)]
+        )
+
+    def test_untracked_stock_covers_the_rest(self):
+        deduct_stock({self.item.pk: 17})
+        self.assertEqual(self.lot_quantities(), {'B-LATE': 0, 'B-EARLY': 0, 'B-OLD': 3})
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 3)
+
+    def test_expired_stock_is_never_sold(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            deduct_stock({self.item.pk: 18})
+        self.assertEqual(raised.exception.conflicts[0]['available'], 17)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_stock, 20)
+
+    def test_write_off_by_batch_number(self):
+        adjustment = InventoryAdjustment.objects.create(
+            inventory_item=self.item, batch_number='B-OLD', quantity=3,
+            adjustment_type='Expired', reason='Past expiry', created_by=self.user
+        )
+        self.client.post(f'/api/inventory/adjustments/{adjustment.pk}/approve/')
+        self.assertEqual(self.lot_quantities()['B-OLD'], 0)
+
+    def test_batch_receipt_needs_valid_dates(self):
+        url = f'/api/inventory/{self.item.pk}/receive/'
+        for data in ({'batch_number': 'B-NEW'}, {'batch_number': 'B-NEW', 'expiry_date': 'soon'},
+                     {'expiry_date': '2027-02-30'},
+                     {'expiry_date': '2027-06-30', 'manufacturing_date': '2026-13-01'}):
+            response = self.client.post(url, {'quantity': 4, **data})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StockLot.objects.filter(batch_number='B-NEW').exists())
+
+        response = self.client.post(url, {'quantity': 4, 'batch_number': 'B-NEW', 'expiry_date': '2027-06-30'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(str(StockLot.objects.get(batch_number='B-NEW').expiry_date), '2027-06-30')
+
+    def test_expiring_lots_endpoint(self):
+        response = self.client.get('/api/inventory/lots/expiring/')
+        statuses = {lot['batch_number']: lot['stock_status'] for lot in response.data}
+        self.assertEqual(statuses, {'B-OLD': 'EXPIRED', 'B-EARLY': 'EXPIRING_SOON'})
+
+
+class StockStatusFilterTestCase(APITestCase):
+    """Stock status computed and filtered in SQL"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        today = timezone.localdate()
+        Inventory.objects.create(name='Expired syrup', department='PHARMACY', current_stock=30,
+                                 expiry_date=today - timedelta(days=2))
+        Inventory.objects.create(name='Empty shelf', department='PHARMACY', current_stock=0)
+        Inventory.objects.create(name='Running low', department='PHARMACY', current_stock=4, minimum_stock=10)
+        Inventory.objects.create(name='Short dated', department='LAB', current_stock=50,
+                                 expiry_date=today + timedelta(days=10))
+        Inventory.objects.create(name='Plenty', department='LAB', current_stock=50)
+
+    def test_filter_matches_python_status(self):
+        for item in Inventory.objects.with_stock_status():
+            self.assertEqual(item.computed_stock_status, Inventory.objects.get(pk=item.pk).stock_status)
+            matched = Inventory.objects.filter_stock_status([item.computed_stock_status])
+            self.assertEqual(list(matched.values_list('pk', flat=True)), [item.pk])
+
+    def test_list_filters_by_status(self):
+        response = self.client.get('/api/inventory/', {'stock_status': 'low_stock,OUT_OF_STOCK'})
+        self.assertEqual(sorted(item['name'] for item in response.data), ['Empty shelf', 'Running low'])
+
+    def test_unknown_status_is_rejected(self):
+        response = self.client.get('/api/inventory/', {'stock_status': 'HALF_FULL'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_department_list_paginates_on_request(self):
+        response = self.client.get('/api/inventory/pharmacy/', {'page_size': 2})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        unpaginated = self.client.get('/api/inventory/lab/', {'stock_status': 'EXPIRING_SOON'})
+        self.assertEqual([item['name'] for item in unpaginated.data], ['Short dated'])
+
+    def test_stats_break_down_by_status(self):
+        response = self.client.get('/api/inventory/stats/')
+        self.assertEqual(response.data['by_status'], {
+            'EXPIRED': 1, 'OUT_OF_STOCK': 1, 'LOW_STOCK': 1, 'EXPIRING_SOON': 1, 'GOOD': 1,
+        })
+
+
+class ReorderPlanTestCase(APITestCase):
+    """Reorder suggestions from consumption velocity"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        now = timezone.now()
+        self.fast = Inventory.objects.create(name='Paracetamol 500mg', department='PHARMACY', current_stock=1000)
+        self.slow = Inventory.objects.create(name='Malaria RDT', department='LAB', current_stock=1000)
+        self.idle = Inventory.objects.create(name='Gauze roll', department='PHARMACY', current_stock=5)
+        Inventory.objects.update(created_at=now - timedelta(days=60))
+        # 10 a day of paracetamol sold on invoices and 1 a day of test kits
+        # through the cart for the past four weeks, before the ledger existed
+        for days_ago in range(1, 29):
+            sold_at = now - timedelta(days=days_ago)
+            invoice = Invoice.objects.create(walkin_id=f'WALK-{days_ago}', created_by=self.user)
+            invoice.refresh_from_db()
+            InvoiceItem.objects.create(invoice=invoice, inventory_item=self.fast, description='Paracetamol',
+                                       quantity=10, unit_price=1)
+            Invoice.objects.filter(pk=invoice.pk).update(status='Paid', payment_date=sold_at)
+            cart = Cart.objects.create(is_active=False, is_checked_out=True, checked_out_at=sold_at)
+            CartItem.objects.bulk_create([CartItem(cart=cart, inventory_item=self.slow, quantity=1, unit_price=5)])
+        Inventory.objects.filter(pk=self.fast.pk).update(current_stock=60)
+        Inventory.objects.filter(pk=self.slow.pk).update(current_stock=100)
+
+    def test_fast_mover_needs_reorder(self):
+        plans = {plan['name']: plan for plan in plan_reorders(history_days=28, lead_time_days=7, cover_days=30)}
+        fast = plans['Paracetamol 500mg']
+        self.assertEqual(fast['recent_daily_usage'], 10)
+        self.assertEqual(fast['days_of_cover'], 6.0)
+        self.assertTrue(fast['needs_reorder'])
+        # 37 days of demand minus what is on hand
+        self.assertEqual(fast['suggested_quantity'], 310)
+        self.assertFalse(plans['Malaria RDT']['needs_reorder'])
+        self.assertIsNone(plans['Gauze roll']['days_of_cover'])
+
+    def test_endpoint_lists_only_items_to_reorder(self):
+        response = self.client.get('/api/inventory/reorder-plan/', {'history_days': 28})
+        self.assertEqual([plan['name'] for plan in response.data['items']], ['Paracetamol 500mg'])
+        response = self.client.get('/api/inventory/reorder-plan/', {'department': 'LAB', 'all': 'true'})
+        self.assertEqual([plan['name'] for plan in response.data['items']], ['Malaria RDT'])
+
+    def test_write_offs_count_but_stock_take_corrections_do_not(self):
+        set_stock_levels({self.idle.pk: 0}, reference='ST-1')
+        plans = {plan['name']: plan for plan in plan_reorders(history_days=28)}
+        self.assertEqual(plans['Gauze roll']['average_daily_usage'], 0)
+
+        adjustment = InventoryAdjustment.objects.create(inventory_item=self.idle, quantity=28,
+                                                        adjustment_type='Damaged', reason='Water damage')
+        InventoryAdjustment.objects.filter(pk=adjustment.pk).update(
+            status='Approved', updated_at=timezone.now() - timedelta(days=1)
+        )
+        plans = {plan['name']: plan for plan in plan_reorders(history_days=28)}
+        self.assertEqual(plans['Gauze roll']['average_daily_usage'], 1)
+
+
+class ExpirySweepTestCase(APITestCase):
+    """Bulk expiry flags and queued write-offs"""
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.lotted = Inventory.objects.create(name='Amoxicillin 250mg', department='PHARMACY', current_stock=0)
+        self.old_lot = receive_lot(self.lotted.pk, 8, 'A-OLD', expiry_date=today + timedelta(days=5))
+        self.new_lot = receive_lot(self.lotted.pk, 8, 'A-NEW', expiry_date=today + timedelta(days=200))
+        StockLot.objects.filter(pk=self.old_lot.pk).update(expiry_date=today - timedelta(days=1))
+        self.plain = Inventory.objects.create(name='Urine strips', department='LAB', current_stock=12,
+                                              expiry_date=today + timedelta(days=10))
+        Inventory.objects.filter(pk=self.plain.pk).update(expiry_date=today - timedelta(days=3))
+        self.soon = Inventory.objects.create(name='Glucose strips', department='LAB', current_stock=4,
+                                             expiry_date=today + timedelta(days=12))
+
+    def test_sweep_flags_and_queues_write_offs(self):
+        summary = sweep_expiry()
+        self.assertEqual(dict(Inventory.objects.values_list('name', 'expiry_flag')), {
+            'Amoxicillin 250mg': '', 'Urine strips': 'EXPIRED', 'Glucose strips': 'EXPIRING_SOON',
+        })
+        self.assertEqual(StockLot.objects.get(pk=self.old_lot.pk).expiry_flag, 'EXPIRED')
+        queued = InventoryAdjustment.objects.filter(adjustment_type='Expired', status='Pending')
+        self.assertEqual(
+            sorted(queued.values_list('inventory_item__name', 'lot__batch_number', 'quantity')),
+            [('Amoxicillin 250mg', 'A-OLD', 8), ('Urine strips', None, 12)]
+        )
+        self.assertEqual(summary['write_offs_queued'], 2)
+        self.assertEqual(Notification.objects.filter(message__startswith='Expiry sweep').count(), 1)
+
+    def test_rerun_does_not_duplicate(self):
+        sweep_expiry()
+        summary = sweep_expiry()
+        self.assertEqual((summary['flags_changed'], summary['write_offs_queued']), (0, 0))
+        self.assertEqual(InventoryAdjustment.objects.count(), 2)
+        self.assertEqual(Notification.objects.filter(message__startswith='Expiry sweep').count(), 1)
+
+    def test_untracked_stock_of_lotted_item_is_queued(self):
+        # 4 units predate the lots and share the item's own, past expiry date
+        Inventory.objects.filter(pk=self.lotted.pk).update(
+            current_stock=20, expiry_date=timezone.localdate() - timedelta(days=2)
+        )
+        sweep_expiry()
+        queued = InventoryAdjustment.objects.filter(inventory_item=self.lotted, status='Pending')
+        self.assertEqual(sorted(queued.values_list('quantity', 'lot__batch_number')), [(4, None), (8, 'A-OLD')])
+        self.assertEqual(sweep_expiry()['write_offs_queued'], 0)
+
+        user = User.objects.create_user(username='approver', password='testpass123')
+        self.client.force_authenticate(user=user)
+        for adjustment in queued:
+            self.client.post(f'/api/inventory/adjustments/{adjustment.pk}/approve/')
+        self.assertEqual(Inventory.objects.get(pk=self.lotted.pk).current_stock, 8)
+        self.assertEqual(dict(StockLot.objects.values_list('batch_number', 'quantity')), {'A-OLD': 0, 'A-NEW': 8})
+
+
+class StockTakeTestCase(APITestCase):
+    """Bulk count upload, variance report and apply"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='counter', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.gloves = Inventory.objects.create(name='Gloves', department='LAB', current_stock=50, unit_cost=2)
+        self.swabs = Inventory.objects.create(name='Swabs', department='LAB', current_stock=30, unit_cost=1)
+        self.tubes = Inventory.objects.create(name='EDTA tubes', department='LAB', current_stock=10)
+        self.syrup = Inventory.objects.create(name='Cough syrup', department='PHARMACY', current_stock=5)
+        response = self.client.post('/api/inventory/stock-takes/', {'department': 'LAB'})
+        self.stock_take = StockTake.objects.get(pk=response.data['id'])
+
+    def test_csv_upload_reports_variances(self):
+        upload = SimpleUploadedFile('count.csv', (
+            'item_id,counted_quantity\n'
+            f'{self.gloves.item_id},45\n'
+            f'{self.swabs.item_id},30\n'
+            f'{self.syrup.item_id},5\n'
+            f'{self.tubes.item_id},lots\n'
+        ).encode(), content_type='text/csv')
+        response = self.client.post(f'/api/inventory/stock-takes/{self.stock_take.pk}/counts/', {'file': upload})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['recorded'], 2)
+        # Pharmacy item is outside the session, tubes had no valid count
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertEqual((response.data['variance_items'], response.data['units_short']), (1, 5))
+        self.assertEqual(response.data['variance_value'], -10.0)
+        self.assertEqual(response.data['uncounted_items'], 1)
+
+    def test_apply_sets_stock_and_records_adjustments(self):
+        self.client.post(f'/api/inventory/stock-takes/{self.stock_take.pk}/counts/', {'counts': [
+            {'item_id': self.gloves.item_id, 'counted_quantity': 45},
+            {'inventory_item': self.tubes.pk, 'counted_quantity': 12},
+            {'item_id': self.swabs.item_id, 'counted_quantity': 30},
+        ]}, format='json')
+        response = self.client.post(f'/api/inventory/stock-takes/{self.stock_take.pk}/apply/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(Inventory.objects.filter(department='LAB').values_list('name', 'current_stock')),
+            {'Gloves': 45, 'Swabs': 30, 'EDTA tubes': 12}
+        )
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(reference=self.stock_take.reference).values_list('quantity', flat=True)),
+            [-5, 2]
+        )
+        self.assertEqual(InventoryAdjustment.objects.filter(status='Approved', adjustment_type='Adjustment').count(), 2)
+        again = self.client.post(f'/api/inventory/stock-takes/{self.stock_take.pk}/apply/')
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
@@ -7,6 +7,23 @@ urlpatterns = [
     path('pharmacy/', views.pharmacy_items, name='pharmacy-items'),
     path('lab/', views.lab_items, name='lab-items'),
     path('stats/', views.inventory_stats, name='inventory-stats'),
+    path('reorder-plan/', views.reorder_plan, name='reorder-plan'),
+    
+    # Stock ledger
+    path('movements/', views.StockMovementListView.as_view(), name='stock-movements'),
+    path('transfer/', views.transfer_stock_view, name='stock-transfer'),
+    path('<int:pk>/receive/', views.receive_stock, name='receive-stock'),
+    path('<int:pk>/stock-on/', views.stock_on_date, name='stock-on-date'),
+    
+    # Lots
+    path('<int:pk>/lots/', views.StockLotListView.as_view(), name='stock-lots'),
+    path('lots/expiring/', views.ExpiringLotListView.as_view(), name='expiring-lots'),
+    
+    # Stock takes
+    path('stock-takes/', views.StockTakeListCreateView.as_view(), name='stock-take-list'),
+    path('stock-takes/<int:pk>/', views.stock_take_report, name='stock-take-report'),
+    path('stock-takes/<int:pk>/counts/', views.upload_stock_take_counts, name='stock-take-counts'),
+    path('stock-takes/<int:pk>/apply/', views.apply_stock_take_view, name='stock-take-apply'),
     
     # Adjustments/Returns
     path('adjustments/', views.InventoryAdjustmentListCreateView.as_view(), name='adjustment-list'),
@@ -2,32 +2,98 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Inventory, InventoryAdjustment
-from .serializers import InventorySerializer, InventoryAdjustmentSerializer
+from rest_framework.exceptions import ValidationError
+from .models import Inventory, InventoryAdjustment, StockLot, StockMovement, StockTake, STOCK_STATUS_CHOICES
+from .pagination import InventoryPagination
+from .reorder import plan_reorders
+from .stocktake import rows_from_csv, record_counts, variance_report, apply_stock_take
+from users.permissions import is_admin
+from .serializers import (
+    InventorySerializer, InventoryAdjustmentSerializer, StockLotSerializer, StockMovementSerializer,
+    StockTakeSerializer
+)
+from .stock import (
+    add_stock, receive_lot, write_off_stock, transfer_stock, record_stock_change, set_stock_levels,
+    stock_as_of, InsufficientStock
+)
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db.models import Q, Sum, Count, F  # Make sure F is imported
 from datetime import timedelta, date
 
+def _parse_date(value):
+    """YYYY-MM-DD as a date; None when missing, malformed or impossible (2026-02-30)"""
+    try:
+        return parse_date(str(value)) if value else None
+    except ValueError:
+        return None
+
+def stock_queryset(request, department=None):
+    """
+    Inventory visible to the user, with stock status computed in SQL.
+    Supports ?stock_status=LOW_STOCK,OUT_OF_STOCK and ?department=PHARMACY
+    """
+    qs = Inventory.objects.with_stock_status().select_related('created_by')
+    user = request.user
+    # Only admins see locked items
+    if not is_admin(user):
+        qs = qs.filter(is_locked=False)
+    
+    department = department or request.query_params.get('department', None)
+    if department:
+        qs = qs.filter(department=department)
+    
+    stock_status = request.query_params.get('stock_status', None)
+    if stock_status:
+        statuses = [value.strip().upper() for value in stock_status.split(',') if value.strip()]
+        valid = [code for code, _ in STOCK_STATUS_CHOICES]
+        unknown = [value for value in statuses if value not in valid]
+        if unknown:
+            raise ValidationError({'stock_status': f"Unknown status: {', '.join(unknown)}. Choose from {', '.join(valid)}"})
+        qs = qs.filter_stock_status(statuses)
+    
+    return qs
+
+def stock_list_response(request, qs):
+    """Serialize a stock list, paginated when the client asks for a page"""
+    paginator = InventoryPagination()
+    page = paginator.paginate_queryset(qs, request)
+    if page is not None:
+        return paginator.get_paginated_response(InventorySerializer(page, many=True).data)
+    return Response(InventorySerializer(qs, many=True).data)
+
 class InventoryListCreateView(generics.ListCreateAPIView):
     serializer_class = InventorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = InventoryPagination
 
     def get_queryset(self):
-        qs = Inventory.objects.all()
-        user = self.request.user
-        # Only admins see locked items
-        if not (user.is_superuser or user.groups.filter(name__iexact='admin').exists()):
-            qs = qs.filter(is_locked=False)
-        return qs
+        return stock_queryset(self.request)
 
     def perform_create(self, serializer):
         obj = serializer.save(created_by=self.request.user)
+        # Opening balance goes on the ledger
+        record_stock_change(obj.pk, obj.current_stock, reference=obj.item_id, user=self.request.user,
+                            movement_type='RECEIPT', notes='Opening stock')
         # Audit log
         from notifications.audit import log_action
         log_action(self.request.user, "create", f"Created inventory item: {obj.name}", {"item_id": obj.item_id})
 
 class InventoryDetailView(generics.RetrieveUpdateDestroyAPIView):
+        @transaction.atomic
         def perform_update(self, serializer):
+            # Lock the row and save the current level, so a concurrent sale is
+            # never overwritten; a stock edit goes through the ledger instead
+            level = serializer.validated_data.pop('current_stock', None)
+            serializer.instance.current_stock = Inventory.objects.select_for_update().values_list(
+                'current_stock', flat=True
+            ).get(pk=serializer.instance.pk)
             obj = serializer.save()
+            if level is not None:
+                set_stock_levels({obj.pk: level}, reference=obj.item_id, user=self.request.user,
+                                 notes='Manual stock edit')
+                obj.refresh_from_db(fields=['current_stock', 'updated_at'])
             from notifications.audit import log_action
             log_action(self.request.user, "update", f"Updated inventory item: {obj.name}", {"item_id": obj.item_id})
 
@@ -42,29 +108,19 @@ class InventoryDetailView(generics.RetrieveUpdateDestroyAPIView):
         def get_queryset(self):
             qs = Inventory.objects.all()
             user = self.request.user
-            if not (user.is_superuser or user.groups.filter(name__iexact='admin').exists()):
+            if not is_admin(user):
                 qs = qs.filter(is_locked=False)
             return qs
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def pharmacy_items(request):
-    qs = Inventory.objects.filter(department='PHARMACY')
-    user = request.user
-    if not (user.is_superuser or user.groups.filter(name__iexact='admin').exists()):
-        qs = qs.filter(is_locked=False)
-    serializer = InventorySerializer(qs, many=True)
-    return Response(serializer.data)
+    return stock_list_response(request, stock_queryset(request, department='PHARMACY'))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def lab_items(request):
-    qs = Inventory.objects.filter(department='LAB')
-    user = request.user
-    if not (user.is_superuser or user.groups.filter(name__iexact='admin').exists()):
-        qs = qs.filter(is_locked=False)
-    serializer = InventorySerializer(qs, many=True)
-    return Response(serializer.data)
+    return stock_list_response(request, stock_queryset(request, department='LAB'))
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def inventory_stats(request):
@@ -92,6 +148,14 @@ def inventory_stats(request):
         expiry_date__gte=date.today()
     ).count()
     
+    # Per-lot expiry alerts
+    open_lots = StockLot.objects.filter(quantity__gt=0)
+    expired_lots = open_lots.filter(expiry_date__lt=date.today()).count()
+    expiring_lots = open_lots.filter(
+        expiry_date__lte=thirty_days,
+        expiry_date__gte=date.today()
+    ).count()
+    
     # By department
     by_department = queryset.values(
         'department'
@@ -100,13 +164,21 @@ def inventory_stats(request):
         value=Sum(F('current_stock') * F('selling_price'))
     )
     
+    # Count per stock status in one grouped query
+    by_status = {code: 0 for code, _ in STOCK_STATUS_CHOICES}
+    for row in queryset.with_stock_status().order_by().values('computed_stock_status').annotate(count=Count('id')):
+        by_status[row['computed_stock_status']] = row['count']
+    
     return Response({
         'total_items': total_items,
         'total_value': float(total_value),
         'low_stock': low_stock,
         'out_of_stock': out_of_stock,
         'expiring_soon': expiring_soon,
-        'by_department': list(by_department)
+        'expired_lots': expired_lots,
+        'expiring_lots': expiring_lots,
+        'by_department': list(by_department),
+        'by_status': by_status,
     })
 
 # Inventory Adjustments/Returns Views
@@ -156,31 +228,301 @@ class InventoryAdjustmentDetailView(generics.RetrieveUpdateDestroyAPIView):
 @permission_classes([IsAuthenticated])
 def approve_adjustment(request, pk):
     """Approve an inventory adjustment and update stock"""
+    with transaction.atomic():
+        # Only the request that moves the adjustment out of Pending adjusts stock
+        approved = InventoryAdjustment.objects.filter(pk=pk, status='Pending').update(
+            status='Approved', approved_by=request.user, updated_at=timezone.now()
+        )
+        try:
+            adjustment = InventoryAdjustment.objects.get(pk=pk)
+        except InventoryAdjustment.DoesNotExist:
+            return Response({'error': 'Adjustment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if approved != 1:
+            return Response({'error': 'Only pending adjustments can be approved'}, status=status.HTTP_400_BAD_REQUEST)
+
+        _apply_approved_adjustment(adjustment, request.user)
+
+    from notifications.audit import log_action
+    log_action(request.user, "approve", f"Approved adjustment: {adjustment.adjustment_id}", {"adjustment_id": adjustment.adjustment_id})
+
+    return Response(InventoryAdjustmentSerializer(adjustment).data)
+
+
+def _apply_approved_adjustment(adjustment, user):
+    """Update inventory stock (reduce for returns/damages)"""
+    if adjustment.adjustment_type in ['Damaged', 'Expired', 'Loss']:
+        lot_pk = adjustment.lot_id
+        if not lot_pk and adjustment.batch_number:
+            lot_pk = StockLot.objects.filter(
+                inventory_item_id=adjustment.inventory_item_id,
+                batch_number=adjustment.batch_number
+            ).values_list('pk', flat=True).first()
+        write_off_stock(adjustment.inventory_item_id, adjustment.quantity,
+                        reference=adjustment.adjustment_id, user=user,
+                        notes=adjustment.adjustment_type, lot_pk=lot_pk,
+                        # Lots carry their own expiry; a lot-less expiry is the untracked stock's
+                        untracked_first=adjustment.adjustment_type == 'Expired' and not lot_pk)
+    elif adjustment.adjustment_type == 'Customer Return':
+        # Restock
+        add_stock({adjustment.inventory_item_id: adjustment.quantity},
+                  reference=adjustment.adjustment_id, user=user,
+                  movement_type='ADJUSTMENT', notes=adjustment.adjustment_type)
+
+# Stock Movement Ledger Views
+class StockMovementListView(generics.ListAPIView):
+    """GET: Stock ledger, filterable by ?item=<id>, ?type=SALE, ?date_from=, ?date_to="""
+    serializer_class = StockMovementSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        qs = StockMovement.objects.select_related('inventory_item', 'created_by')
+        
+        item = self.request.query_params.get('item', None)
+        if item:
+            qs = qs.filter(inventory_item_id=item)
+        
+        movement_type = self.request.query_params.get('type', None)
+        if movement_type:
+            qs = qs.filter(movement_type=movement_type)
+        
+        for param, lookup in (('date_from', 'created_at__date__gte'), ('date_to', 'created_at__date__lte')):
+            value = self.request.query_params.get(param, None)
+            if value:
+                day = _parse_date(value)
+                if day is None:
+                    raise ValidationError({param: 'Enter a valid date (YYYY-MM-DD)'})
+                qs = qs.filter(**{lookup: day})
+        
+        return qs.order_by('-created_at')
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def receive_stock(request, pk):
+    """Record a stock receipt (delivery) for an item"""
+    if not Inventory.objects.filter(pk=pk).exists():
+        return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+    
     try:
-        adjustment = InventoryAdjustment.objects.get(pk=pk)
-    except InventoryAdjustment.DoesNotExist:
-        return Response({'error': 'Adjustment not found'}, status=status.HTTP_404_NOT_FOUND)
+        quantity = int(request.data.get('quantity', 0))
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity < 1:
+        return Response({'error': 'Quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
     
-    if adjustment.status != 'Pending':
-        return Response({'error': 'Only pending adjustments can be approved'}, status=status.HTTP_400_BAD_REQUEST)
+    reference = request.data.get('reference', '')
+    batch_number = request.data.get('batch_number', '')
+    if batch_number or request.data.get('expiry_date'):
+        # Deliveries with batch details become a lot with its own expiry
+        expiry_date = _parse_date(request.data.get('expiry_date'))
+        if expiry_date is None:
+            return Response({'error': 'A valid expiry_date (YYYY-MM-DD) is required for a batch'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        manufacturing_date = request.data.get('manufacturing_date')
+        if manufacturing_date and _parse_date(manufacturing_date) is None:
+            return Response({'error': 'manufacturing_date must be a valid date (YYYY-MM-DD)'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        receive_lot(pk, quantity, batch_number=batch_number, expiry_date=expiry_date,
+                    manufacturing_date=_parse_date(manufacturing_date),
+                    reference=reference, user=request.user, notes=request.data.get('notes', ''))
+    else:
+        add_stock({pk: quantity}, reference=reference, user=request.user, notes=request.data.get('notes', ''))
     
-    # Update adjustment status
-    adjustment.status = 'Approved'
-    adjustment.approved_by = request.user
-    adjustment.save()
+    from notifications.audit import log_action
+    log_action(request.user, "update", f"Received {quantity} units for inventory item {pk}", {"inventory_id": pk, "reference": reference})
     
-    # Update inventory stock (reduce for returns/damages)
-    if adjustment.adjustment_type in ['Damaged', 'Expired', 'Loss']:
-        item = adjustment.inventory_item
-        item.current_stock = max(0, item.current_stock - adjustment.quantity)
-        item.save()
-    elif adjustment.adjustment_type == 'Customer Return':
-        # Restock
-        item = adjustment.inventory_item
-        item.current_stock += adjustment.quantity
-        item.save()
+    return Response(InventorySerializer(Inventory.objects.get(pk=pk)).data)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def transfer_stock_view(request):
+    """Transfer stock between two items, e.g. from Pharmacy to Lab"""
+    try:
+        from_item = int(request.data.get('from_item'))
+        to_item = int(request.data.get('to_item'))
+        quantity = int(request.data.get('quantity', 0))
+    except (TypeError, ValueError):
+        return Response({'error': 'from_item, to_item and quantity are required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if quantity < 1 or from_item == to_item:
+        return Response({'error': 'Quantity must be at least 1 and items must differ'}, status=status.HTTP_400_BAD_REQUEST)
+    if Inventory.objects.filter(pk__in=[from_item, to_item]).count() != 2:
+        return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        transfer_stock(from_item, to_item, quantity, reference=request.data.get('reference', ''),
+                       user=request.user, notes=request.data.get('notes', ''))
+    except InsufficientStock as exc:
+        return Response({'error': 'Insufficient stock', 'conflicts': exc.conflicts}, status=status.HTTP_409_CONFLICT)
     
     from notifications.audit import log_action
-    log_action(request.user, "approve", f"Approved adjustment: {adjustment.adjustment_id}", {"adjustment_id": adjustment.adjustment_id})
+    log_action(request.user, "update", f"Transferred {quantity} units from item {from_item} to item {to_item}",
+               {"from_item": from_item, "to_item": to_item, "quantity": quantity})
     
-    return Response(InventoryAdjustmentSerializer(adjustment).data)
\ No newline at end of file
+    items = Inventory.objects.filter(pk__in=[from_item, to_item])
+    return Response(InventorySerializer(items, many=True).data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def stock_on_date(request, pk):
+    """On-hand stock for an item at the end of ?date=YYYY-MM-DD"""
+    day = _parse_date(request.query_params.get('date', ''))
+    if not day:
+        return Response({'error': 'date (YYYY-MM-DD) is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if not Inventory.objects.filter(pk=pk).exists():
+        return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({'inventory_item': pk, 'date': day, 'stock': stock_as_of(pk, day)})
+
+# Stock Lot Views
+class StockLotListView(generics.ListAPIView):
+    """GET: Lots of one item in first-expiry-first-out order (?include_empty=true for used-up lots)"""
+    serializer_class = StockLotSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        qs = StockLot.objects.filter(inventory_item_id=self.kwargs['pk']).select_related('inventory_item')
+        if self.request.query_params.get('include_empty', 'false').lower() != 'true':
+            qs = qs.filter(quantity__gt=0)
+        return qs.order_by(F('expiry_date').asc(nulls_last=True), 'received_at')
+
+class ExpiringLotListView(generics.ListAPIView):
+    """GET: Lots with stock that are expired or expire within ?days= (default 30)"""
+    serializer_class = StockLotSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        try:
+            days = int(self.request.query_params.get('days', 30))
+        except ValueError:
+            days = 30
+        qs = StockLot.objects.filter(
+            quantity__gt=0,
+            expiry_date__lte=date.today() + timedelta(days=days)
+        ).select_related('inventory_item')
+        
+        department = self.request.query_params.get('department', None)
+        if department:
+            qs = qs.filter(inventory_item__department=department)
+        
+        return qs.order_by('expiry_date')
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reorder_plan(request):
+    """
+    Suggested reorders from consumption velocity.
+    Query params: department, history_days (90), lead_time (7), cover_days (30), all=true
+    """
+    try:
+        history_days = int(request.query_params.get('history_days', 90))
+        lead_time = int(request.query_params.get('lead_time', 7))
+        cover_days = int(request.query_params.get('cover_days', 30))
+    except ValueError:
+        return Response({'error': 'history_days, lead_time and cover_days must be whole numbers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if history_days < 1 or lead_time < 0 or cover_days < 0:
+        return Response({'error': 'history_days must be at least 1 and lead_time/cover_days not negative'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    plans = plan_reorders(history_days=history_days, lead_time_days=lead_time, cover_days=cover_days,
+                          department=request.query_params.get('department', None))
+    if request.query_params.get('all', 'false').lower() != 'true':
+        plans = [plan for plan in plans if plan['needs_reorder']]
+    
+    return Response({
+        'history_days': history_days,
+        'lead_time': lead_time,
+        'cover_days': cover_days,
+        'count': len(plans),
+        'items': plans,
+    })
+
+# Stock Take Views
+class StockTakeListCreateView(generics.ListCreateAPIView):
+    """GET: Stock take sessions (?status=Open). POST: Start a session, optionally for one department"""
+    serializer_class = StockTakeSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        qs = StockTake.objects.select_related('created_by', 'applied_by').annotate(line_count=Count('lines'))
+        status_filter = self.request.query_params.get('status', None)
+        if status_filter:
+            qs = qs.filter(status=status_filter)
+        return qs.order_by('-created_at')
+    
+    def perform_create(self, serializer):
+        obj = serializer.save(created_by=self.request.user)
+        from notifications.audit import log_action
+        log_action(self.request.user, "create", f"Started stock take: {obj.reference}", {"stock_take": obj.reference})
+
+def get_stock_take(pk):
+    return StockTake.objects.filter(pk=pk).first()
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def stock_take_report(request, pk):
+    """Variance report for a stock take"""
+    stock_take = get_stock_take(pk)
+    if stock_take is None:
+        return Response({'error': 'Stock take not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(variance_report(stock_take))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_stock_take_counts(request, pk):
+    """
+    Upload counted quantities in bulk, as a CSV file (multipart 'file'), CSV text
+    ('csv') or JSON rows ([...] or {'counts': [...]}). Each row needs item_id (or
+    inventory_item) and counted_quantity. Returns the variance report.
+    """
+    stock_take = get_stock_take(pk)
+    if stock_take is None:
+        return Response({'error': 'Stock take not found'}, status=status.HTTP_404_NOT_FOUND)
+    if stock_take.status != 'Open':
+        return Response({'error': 'Counts can only be uploaded to an open stock take'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    upload = request.FILES.get('file')
+    if upload is not None:
+        try:
+            rows = rows_from_csv(upload.read().decode('utf-8'))
+        except UnicodeDecodeError:
+            return Response({'error': 'CSV file must be UTF-8'}, status=status.HTTP_400_BAD_REQUEST)
+    elif isinstance(request.data, list):
+        rows = request.data
+    elif request.data.get('csv'):
+        rows = rows_from_csv(request.data['csv'])
+    else:
+        rows = request.data.get('counts', [])
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+        return Response({'error': 'No count rows found'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    recorded, errors = record_counts(stock_take, rows)
+    
+    from notifications.audit import log_action
+    log_action(request.user, "update", f"Uploaded {recorded} count(s) to stock take {stock_take.reference}",
+               {"stock_take": stock_take.reference, "recorded": recorded, "errors": len(errors)})
+    
+    report = variance_report(stock_take)
+    report.update({'recorded': recorded, 'errors': errors})
+    return Response(report)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def apply_stock_take_view(request, pk):
+    """Apply all counted quantities and close the stock take"""
+    stock_take = get_stock_take(pk)
+    if stock_take is None:
+        return Response({'error': 'Stock take not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        stock_take = apply_stock_take(stock_take, user=request.user)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    report = variance_report(stock_take)
+    from notifications.audit import log_action
+    log_action(request.user, "update", f"Applied stock take {stock_take.reference}: "
+               f"{report['variance_items']} variance(s) over {report['counted_items']} item(s)",
+               {"stock_take": stock_take.reference, "variance_value": report['variance_value']})
+    return Response(report)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import LabTest, LabOrder, LabOrderTest, LabResult
+from .models import LabTest, LabPanel, LabOrder, LabOrderTest, LabResult, LabResultValue, QCLot, QCRun
 
 
 @admin.register(LabTest)
@@ -10,6 +10,15 @@ class LabTestAdmin(admin.ModelAdmin):
     ordering = ['name']
 
 
+@admin.register(LabPanel)
+class LabPanelAdmin(admin.ModelAdmin):
+    list_display = ['code', 'name', 'is_active', 'created_at']
+    list_filter = ['is_active']
+    search_fields = ['name', 'code']
+    filter_horizontal = ['tests']
+    ordering = ['name']
+
+
 @admin.register(LabOrder)
 class LabOrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'patient', 'urgency', 'status', 'ordered_by', 'created_at']
@@ -34,3 +43,30 @@ class LabResultAdmin(admin.ModelAdmin):
     search_fields = ['order__patient__name', 'order__id']
     ordering = ['-created_at']
     readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(LabResultValue)
+class LabResultValueAdmin(admin.ModelAdmin):
+    list_display = ['id', 'patient', 'analyte_code', 'value_text', 'unit', 'flag', 'resulted_at']
+    list_filter = ['flag', 'analyte_code']
+    search_fields = ['patient__mrn', 'analyte_code', 'analyte_name']
+    ordering = ['-resulted_at']
+
+
+@admin.register(QCLot)
+class QCLotAdmin(admin.ModelAdmin):
+    list_display = ['id', 'analyte_code', 'level', 'lot_number', 'instrument', 'target_mean', 'target_sd',
+                    'expiry_date', 'is_active']
+    list_filter = ['is_active', 'level', 'instrument']
+    search_fields = ['lot_number', 'analyte_code', 'material']
+    ordering = ['analyte_code', 'level']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(QCRun)
+class QCRunAdmin(admin.ModelAdmin):
+    list_display = ['id', 'lot', 'value', 'z_score', 'status', 'run_at', 'reviewed_by']
+    list_filter = ['status', 'run_at']
+    search_fields = ['lot__lot_number', 'lot__analyte_code']
+    ordering = ['-run_at']
+    readonly_fields = ['z_score', 'violations', 'status', 'created_at']
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import LabOrder
+
+MAX_BULK_ORDERS = 500
+
+
+def _collect(user, now):
+    return {'status': 'Sample Collected', 'sample_collected_at': now, 'sample_collected_by': user}
+
+
+def _start(user, now):
+    # Samples not collected yet are collected now, as in start_processing_view
+    return {
+        'status': 'In Progress',
+        'started_at': now,
+        'processed_by': user,
+        'sample_collected_by': Case(
+            When(sample_collected_at__isnull=True, then=Value(user.pk)), default=F('sample_collected_by'),
+            output_field=IntegerField()
+        ),
+        'sample_collected_at': Coalesce(F('sample_collected_at'), Value(now)),
+    }
+
+
+def _cancel(user, now):
+    return {'status': 'Cancelled'}
+
+
+# action -> (allowed current statuses, changes, error for other statuses, audit verb)
+TRANSITIONS = {
+    'collect-sample': (['Pending'], _collect, 'Can only collect samples for pending orders', 'Sample collected for'),
+    'start-processing': (['Pending', 'Sample Collected'], _start,
+                         'Can only start processing for pending or sample collected orders', 'Started processing'),
+    'cancel': (['Pending', 'Sample Collected', 'In Progress'], _cancel,
+               'Cannot cancel completed or cancelled orders', 'Cancelled'),
+}
+
+
+def bulk_transition(action, order_ids, user):
+    """
+    Apply one status transition to many orders: one locking read of their
+    current statuses and one guarded UPDATE (WHERE status IN allowed).
+    Returns ([per-ID outcome], [updated IDs]) in request order.
+    """
+    allowed, changes, error, _ = TRANSITIONS[action]
+    now = timezone.now()
+    with transaction.atomic():
+        current = dict(
+            LabOrder.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').values_list('pk', 'status')
+        )
+        eligible = [pk for pk in dict.fromkeys(order_ids) if current.get(pk) in allowed]
+        LabOrder.objects.filter(pk__in=eligible, status__in=allowed).update(updated_at=now, **changes(user, now))
+
+    outcomes = []
+    for pk in dict.fromkeys(order_ids):
+        if pk not in current:
+            outcomes.append({'id': pk, 'outcome': 'not_found'})
+        elif current[pk] not in allowed:
+            outcomes.append({'id': pk, 'outcome': 'rejected', 'status': current[pk], 'detail': error})
+        else:
+            outcomes.append({'id': pk, 'outcome': 'updated'})
+    return outcomes, eligible
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.db.models import Count, Max
+from .models import LabTest, LabPanel
+
+ACTIVE_TESTS_CACHE_KEY = 'lab-active-tests:v2'
+ACTIVE_TESTS_CACHE_TIMEOUT = 60 * 60
+
+
+def catalog_version():
+    """Latest LabTest change and the test count: moved by any save or delete, in whichever worker"""
+    state = LabTest.objects.aggregate(changed=Max('updated_at'), count=Count('id'))
+    changed = state['changed'].isoformat() if state['changed'] else ''
+    return f"{changed}:{state['count']}"
+
+
+def active_test_ids():
+    """IDs of orderable tests, cached under the current catalog_version()"""
+    key = f"{ACTIVE_TESTS_CACHE_KEY}:{catalog_version()}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(LabTest.objects.filter(is_active=True).values_list('id', flat=True))
+        cache.set(key, ids, ACTIVE_TESTS_CACHE_TIMEOUT)
+    return ids
+
+
+def expand_order_tests(test_ids, panel_ids):
+    """
+    Test IDs for an order: explicit tests first, then each panel's active
+    members, without duplicates. One query for the catalog version and one
+    for the panels while the active catalog is cached. Returns
+    (test IDs, {field: [errors]}).
+    """
+    active = active_test_ids()
+    errors = {}
+    unknown = [pk for pk in test_ids if pk not in active]
+    if unknown:
+        errors['test_ids'] = [f"Unknown or inactive test(s): {', '.join(map(str, unknown))}"]
+
+    members = {}
+    rows = LabPanel.objects.filter(pk__in=panel_ids, is_active=True).order_by('tests__name').values_list('pk', 'tests')
+    for panel, test in rows if panel_ids else ():
+        members.setdefault(panel, [])
+        if test is not None:
+            members[panel].append(test)
+    missing = [pk for pk in panel_ids if pk not in members]
+    if missing:
+        errors['panel_ids'] = [f"Unknown or inactive panel(s): {', '.join(map(str, missing))}"]
+
+    ordered = list(test_ids)
+    for panel in panel_ids:
+        # Inactive catalog tests are dropped from panels rather than failing the order
+        ordered.extend(test for test in members.get(panel, []) if test in active)
+    return list(dict.fromkeys(ordered)), errors
@@ -0,0 +1,125 @@
+import uuid
+from datetime import datetime, time, timedelta
+from html import escape
+from django.core.cache import cache
+from django.utils import timezone
+from billing.receipts import CLINIC_NAME
+from .models import LabResultValue, CumulativeVersion
+
+CUMULATIVE_CACHE_TIMEOUT = 60 * 60
+DEFAULT_WINDOW_DAYS = 365
+
+
+def cumulative_version(patient_id):
+    """Per-patient token; every cached report of the patient is keyed by it"""
+    return CumulativeVersion.objects.filter(patient_id=patient_id).values_list('version', flat=True).first() or ''
+
+
+def invalidate_cumulative(patient_ids):
+    """
+    New cumulative versions for these patients, written in the current
+    transaction so the reports move on exactly when the values they show do
+    """
+    patient_ids = {patient_id for patient_id in patient_ids if patient_id}
+    if patient_ids:
+        CumulativeVersion.objects.bulk_create(
+            [CumulativeVersion(patient_id=patient_id, version=uuid.uuid4().hex) for patient_id in sorted(patient_ids)],
+            update_conflicts=True, unique_fields=['patient'], update_fields=['version']
+        )
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def build_cumulative(patient_id, date_from, date_to, analytes=None):
+    """
+    Analytes x dates matrix of one patient's results from a single query on
+    the (patient, analyte, time) index. A later value on the same day
+    replaces an earlier one.
+    """
+    values = LabResultValue.objects.filter(
+        patient_id=patient_id,
+        resulted_at__gte=_day_start(date_from),
+        resulted_at__lt=_day_start(date_to + timedelta(days=1)),
+    )
+    if analytes:
+        values = values.filter(analyte_code__in=analytes)
+
+    dates, rows = set(), {}
+    for value in values.order_by('analyte_code', 'resulted_at', 'id').values(
+        'analyte_code', 'analyte_name', 'unit', 'reference_range', 'test__code',
+        'value_text', 'numeric_value', 'flag', 'resulted_at', 'result', 'result__status'
+    ):
+        day = timezone.localtime(value['resulted_at']).date().isoformat()
+        dates.add(day)
+        row = rows.setdefault((value['test__code'], value['analyte_code']), {
+            'analyte_code': value['analyte_code'],
+            'analyte_name': value['analyte_name'],
+            'test_code': value['test__code'],
+            'unit': value['unit'],
+            'reference_range': value['reference_range'],
+            'values': {},
+        })
+        row['unit'] = value['unit'] or row['unit']
+        row['reference_range'] = value['reference_range'] or row['reference_range']
+        row['values'][day] = {
+            'value': value['value_text'],
+            'numeric_value': value['numeric_value'],
+            'flag': value['flag'],
+            'result': value['result'],
+            'status': value['result__status'],
+        }
+
+    return {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'dates': sorted(dates),
+        'analytes': sorted(rows.values(), key=lambda row: (row['test_code'] or '', row['analyte_name'])),
+    }
+
+
+def cumulative_report(patient_id, date_from, date_to, analytes=None):
+    """build_cumulative, cached per patient until one of their results changes"""
+    analytes = sorted(set(analytes or []))
+    key = (f"lab-cumulative:{patient_id}:{cumulative_version(patient_id)}:"
+           f"{date_from}:{date_to}:{','.join(analytes)}")
+    report = cache.get(key)
+    if report is None:
+        report = build_cumulative(patient_id, date_from, date_to, analytes)
+        cache.set(key, report, CUMULATIVE_CACHE_TIMEOUT)
+    return report
+
+
+def render_cumulative_html(patient, report):
+    """Printable landscape table of a cumulative report"""
+    header = ''.join(f'<th>{escape(day)}</th>' for day in report['dates'])
+    body = []
+    for row in report['analytes']:
+        cells = []
+        for day in report['dates']:
+            cell = row['values'].get(day)
+            if cell is None:
+                cells.append('<td></td>')
+                continue
+            flag = f" <b>{escape(cell['flag'])}</b>" if cell['flag'] else ''
+            pending = '' if cell['status'] == 'Final' else ' class="pending"'
+            cells.append(f"<td{pending}>{escape(cell['value'])}{flag}</td>")
+        body.append(
+            f"<tr><th>{escape(row['analyte_name'])}</th><td>{escape(row['unit'])}</td>"
+            f"<td>{escape(row['reference_range'])}</td>{''.join(cells)}</tr>"
+        )
+
+    title = f"Cumulative Lab Report - {patient.name} ({patient.mrn})"
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f'<title>{escape(title)}</title>'
+        '<style>@page{size:landscape}body{font:11px sans-serif;margin:12px}'
+        'table{border-collapse:collapse}th,td{border:1px solid #999;padding:2px 6px;text-align:left}'
+        'td.pending{font-style:italic;color:#555}</style></head><body>'
+        f'<h2>{escape(CLINIC_NAME)}</h2><h3>{escape(title)}</h3>'
+        f"<p>{escape(report['date_from'])} to {escape(report['date_to'])}. "
+        'Italic values are not yet verified; H/L high/low, HH/LL critical.</p>'
+        '<table><thead><tr><th>Analyte</th><th>Unit</th><th>Reference</th>'
+        f"{header}</tr></thead><tbody>{''.join(body)}</tbody></table></body></html>"
+    ).encode('utf-8')
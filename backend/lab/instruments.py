@@ -0,0 +1,286 @@
+import re
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from .models import LabOrder, LabOrderTest, LabResult, LabResultValue
+from .ranges import analyte_code
+from .results import build_result_values
+from .cumulative import invalidate_cumulative
+
+INGEST_BATCH_SIZE = 200
+READ_CHUNK_SIZE = 64 * 1024
+
+OPEN_STATUSES = ['Pending', 'Sample Collected', 'In Progress']
+# Result status codes meaning "no result" (ASTM X = cannot be done, HL7 D = deleted)
+DISCARDED_STATUSES = {'X', 'D'}
+
+CONTROL_CHARS = re.compile(r'[\x02\x04\x05\x0b\x1c]')
+ASTM_HEADER = re.compile(r'H[^\w\s]')  # 'H|\^&': the header declares the delimiters
+
+
+class InstrumentFileError(ValueError):
+    """The file is not an ASTM or HL7 v2 result file"""
+
+
+def _records(stream):
+    """
+    Records of an instrument file one at a time, split on CR and/or LF,
+    reading the stream in chunks so large runs are never held in memory
+    """
+    pending = ''
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('latin-1')
+        lines = re.split(r'[\r\n]+', pending + chunk)
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def _clean_astm(line):
+    """Drop low-level framing: STX/ETX, checksum and the frame number"""
+    line = CONTROL_CHARS.sub('', line)
+    line = re.split(r'[\x03\x17]', line, maxsplit=1)[0]
+    if len(line) > 1 and line[0].isdigit() and line[1].isalpha():
+        line = line[1:]
+    return line
+
+
+def _component(field, separator, index=0):
+    components = field.split(separator)
+    return components[index].strip() if len(components) > index else ''
+
+
+def _field(fields, index):
+    return fields[index] if len(fields) > index else ''
+
+
+def _test_code(field, separator):
+    """'^^^WBC^White cells' -> ('WBC', 'White cells'); first non-empty component otherwise"""
+    components = [component.strip() for component in field.split(separator)]
+    code = components[3] if len(components) > 3 and components[3] else next(
+        (component for component in components if component), ''
+    )
+    name = components[4] if len(components) > 4 and components[4] else code
+    return code, name
+
+
+def parse_astm(records):
+    """
+    Samples from ASTM E1394 records: each O record starts a sample keyed by
+    its specimen ID (our lab order ID) and the following R records are its
+    results. Yields (order_ref, [result entry]).
+    """
+    delimiter, component = '|', '^'
+    order_ref, entries = None, []
+    for line in records:
+        line = _clean_astm(line)
+        record_type = line[:1].upper()
+        if record_type == 'H':
+            delimiter, component = line[1:2] or '|', line[3:4] or '^'
+            continue
+        fields = line.split(delimiter)
+        if record_type == 'O':
+            if order_ref is not None:
+                yield order_ref, entries
+            order_ref = _component(_field(fields, 2), component) or _component(_field(fields, 3), component)
+            entries = []
+        elif record_type == 'R' and order_ref is not None:
+            if _field(fields, 8).strip().upper() in DISCARDED_STATUSES:
+                continue
+            code, name = _test_code(_field(fields, 2), component)
+            entries.append({
+                'code': code,
+                'name': name,
+                'value': _component(_field(fields, 3), component),
+                'unit': _field(fields, 4).strip(),
+                'reference_range': _field(fields, 5).strip(),
+                'flag': _field(fields, 6).strip(),
+            })
+        elif record_type == 'L':
+            break
+    if order_ref is not None:
+        yield order_ref, entries
+
+
+def parse_hl7(records):
+    """
+    Samples from HL7 v2 ORU messages: each OBR starts a sample keyed by its
+    placer (else filler) order number and the following OBX segments are its
+    observations. Yields (order_ref, [result entry]).
+    """
+    delimiter, component = '|', '^'
+    order_ref, entries = None, []
+    for line in records:
+        line = CONTROL_CHARS.sub('', line).strip()
+        segment = line[:3].upper()
+        if segment == 'MSH':
+            delimiter, component = line[3:4] or '|', line[4:5] or '^'
+            continue
+        fields = line.split(delimiter)
+        if segment == 'OBR':
+            if order_ref is not None:
+                yield order_ref, entries
+            order_ref = _component(_field(fields, 2), component) or _component(_field(fields, 3), component)
+            entries = []
+        elif segment == 'OBX' and order_ref is not None:
+            if _field(fields, 11).strip().upper() in DISCARDED_STATUSES:
+                continue
+            code = _component(_field(fields, 3), component)
+            entries.append({
+                'code': code,
+                'name': _component(_field(fields, 3), component, 1) or code,
+                'value': _component(_field(fields, 5), component),
+                'unit': _component(_field(fields, 6), component),
+                'reference_range': _field(fields, 7).strip(),
+                'flag': _component(_field(fields, 8), component),
+            })
+    if order_ref is not None:
+        yield order_ref, entries
+
+
+def parse_instrument_file(stream):
+    """('ASTM' | 'HL7', sample generator), detected from the first record"""
+    records = _records(stream)
+    first = next(records, None)
+    if first is None:
+        raise InstrumentFileError('File is empty')
+
+    def replay():
+        yield first
+        yield from records
+
+    if ASTM_HEADER.match(_clean_astm(first)):
+        return 'ASTM', parse_astm(replay())
+    if CONTROL_CHARS.sub('', first).strip()[:3].upper() == 'MSH':
+        return 'HL7', parse_hl7(replay())
+    raise InstrumentFileError('Not an ASTM (H record) or HL7 v2 (MSH segment) file')
+
+
+def _order_pk(order_ref):
+    """'123', 'LAB-123' and '000123' all refer to lab order 123"""
+    digits = re.findall(r'\d+', order_ref or '')
+    return int(digits[-1]) if digits else None
+
+
+def _test_for(code, tests):
+    """Order test whose code, or one of whose catalog parameters, matches an analyte"""
+    normalized = analyte_code(code)
+    for test in tests:
+        if analyte_code(test.code) == normalized:
+            return test
+        for parameter in test.parameters or []:
+            if isinstance(parameter, dict) and normalized in (
+                analyte_code(parameter.get('id') or ''), analyte_code(parameter.get('name') or '')
+            ):
+                return test
+    return tests[0] if len(tests) == 1 else None
+
+
+def _merge(existing, entries):
+    """Instrument entries replace earlier values of the same analyte"""
+    merged = {analyte_code(entry.get('code') or entry.get('name')): entry for entry in existing}
+    merged.update((analyte_code(entry['code'] or entry['name']), entry) for entry in entries)
+    return list(merged.values())
+
+
+def ingest_batch(samples, user, report):
+    """
+    Upsert one batch of samples in one transaction: one locking query for the
+    orders with their tests and results, one bulk_create and one bulk_update
+    of results, one rewrite of their normalized values and one UPDATE
+    completing the orders.
+    """
+    by_order = {}
+    for order_ref, entries in samples:
+        pk = _order_pk(order_ref)
+        if pk is None:
+            report['skipped'].append({'order_ref': order_ref, 'reason': 'No order ID'})
+        elif entries:
+            by_order.setdefault(pk, (order_ref, []))[1].extend(entries)
+
+    with transaction.atomic():
+        # Lock the orders so concurrent imports of the same samples queue up
+        # instead of both creating a result
+        orders = LabOrder.objects.select_for_update(of=('self',)).filter(pk__in=by_order).select_related(
+            'patient', 'result'
+        ).prefetch_related(
+            Prefetch('tests', queryset=LabOrderTest.objects.select_related('test'))
+        ).in_bulk()
+
+        now = timezone.now()
+        created, updated = [], []
+        for pk, (order_ref, entries) in by_order.items():
+            order = orders.get(pk)
+            result = getattr(order, 'result', None) if order else None
+            reason = None
+            if order is None:
+                reason = 'Order not found'
+            elif order.status == 'Cancelled':
+                reason = 'Order is cancelled'
+            elif result is None and order.status not in OPEN_STATUSES:
+                reason = f"Order is {order.status.lower()}"
+            elif result is not None and result.status == 'Final':
+                reason = 'Result is already verified'
+            elif result is not None and not isinstance(result.results_data, list):
+                reason = 'Result was entered manually'
+            if reason:
+                report['skipped'].append({'order_ref': order_ref, 'order_id': pk, 'reason': reason})
+                continue
+
+            tests = [order_test.test for order_test in order.tests.all()]
+            for entry in entries:
+                test = _test_for(entry['code'] or entry['name'], tests)
+                entry['test'] = test.code if test else ''
+            if result is None:
+                created.append(LabResult(order=order, results_data=_merge([], entries), performed_by=user,
+                                         created_at=now, updated_at=now))
+            else:
+                result.results_data = _merge(result.results_data, entries)
+                result.updated_at = now
+                updated.append(result)
+
+        LabResult.objects.bulk_create(created)
+        LabResult.objects.bulk_update(updated, ['results_data', 'updated_at'])
+        results = created + updated
+        values = [value for result in results for value in build_result_values(result)]
+        LabResultValue.objects.filter(result__in=[result.pk for result in results]).delete()
+        LabResultValue.objects.bulk_create(values, batch_size=500)
+        LabOrder.objects.filter(pk__in=[result.order_id for result in results], status__in=OPEN_STATUSES).update(
+            status='Completed', completed_at=now, updated_at=now
+        )
+        invalidate_cumulative({result.order.patient_id for result in results})
+
+    report['created'] += len(created)
+    report['updated'] += len(updated)
+    report['values'] += len(values)
+
+
+def ingest_instrument_file(stream, filename='', user=None, batch_size=INGEST_BATCH_SIZE):
+    """
+    Stream an ASTM or HL7 v2 result file into lab results, matching samples
+    to lab orders by order ID and upserting them batch_size samples at a time.
+    New results are Preliminary and await verification. Returns the
+    processing report; raises InstrumentFileError for unrecognised files.
+    """
+    file_format, samples = parse_instrument_file(stream)
+    report = {
+        'file': filename, 'format': file_format, 'samples': 0,
+        'created': 0, 'updated': 0, 'values': 0, 'skipped': [],
+    }
+    batch = []
+    for sample in samples:
+        report['samples'] += 1
+        batch.append(sample)
+        if len(batch) >= batch_size:
+            ingest_batch(batch, user, report)
+            batch = []
+    if batch:
+        ingest_batch(batch, user, report)
+    return report
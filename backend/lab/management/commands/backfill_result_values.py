@@ -0,0 +1,23 @@
+"""
+Management command to build normalized analyte values for historical lab results
+Usage: python manage.py backfill_result_values [--batch-size 500] [--missing-only]
+"""
+from django.core.management.base import BaseCommand
+from lab.results import backfill_result_values
+
+
+class Command(BaseCommand):
+    help = 'Rebuild LabResultValue rows from the results_data JSON of existing lab results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Results processed per batch')
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only process results that have no normalized values yet')
+
+    def handle(self, *args, **options):
+        processed, written = backfill_result_values(
+            batch_size=options['batch_size'], missing_only=options['missing_only']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{processed} result(s) processed, {written} value(s) written"
+        ))
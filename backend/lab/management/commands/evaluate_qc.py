@@ -0,0 +1,20 @@
+"""
+Management command to re-evaluate control runs against the Westgard rules
+Usage: python manage.py evaluate_qc [--lot 3,4]
+"""
+from django.core.management.base import BaseCommand
+from lab.qc import evaluate_qc
+
+
+class Command(BaseCommand):
+    help = 'Recompute z-scores, Westgard violations and status of QC runs from their lot targets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', default='', help='Comma-separated QC lot IDs (default: all lots)')
+
+    def handle(self, *args, **options):
+        lot_ids = [int(lot_id) for lot_id in options['lot'].split(',') if lot_id.strip()]
+        summary = evaluate_qc(lot_ids or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['runs']} run(s) evaluated, {summary['changed']} changed, {summary['rejected']} rejected"
+        ))
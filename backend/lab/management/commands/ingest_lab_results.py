@@ -0,0 +1,73 @@
+"""
+Management command to import analyzer result files (ASTM E1394 / HL7 v2) into lab results
+Usage: python manage.py ingest_lab_results [--dir PATH] [--watch [--interval 10]]
+
+Each file in the drop directory is ingested, then moved to processed/ with its
+processing report next to it as <file>.report.json. A file that cannot be
+ingested, for any reason, goes to failed/ with the error in its report.
+"""
+import json
+import os
+import shutil
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from notifications.audit import log_action
+from lab.instruments import ingest_instrument_file, InstrumentFileError
+
+# With --watch, leave files alone until the analyzer has stopped writing them
+SETTLE_SECONDS = 2
+
+
+class Command(BaseCommand):
+    help = 'Ingest ASTM / HL7 result files from the lab instrument drop directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.LAB_INSTRUMENT_DROP_DIR, help='Drop directory to read')
+        parser.add_argument('--watch', action='store_true', help='Keep polling the directory for new files')
+        parser.add_argument('--interval', type=int, default=10, help='Seconds between polls with --watch')
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        for subdirectory in ('processed', 'failed'):
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+        while True:
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if not os.path.isfile(path) or name.startswith('.') or name.endswith('.report.json'):
+                    continue
+                if options['watch'] and time.time() - os.path.getmtime(path) < SETTLE_SECONDS:
+                    continue
+                self.ingest(directory, name)
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+
+    def ingest(self, directory, name):
+        path = os.path.join(directory, name)
+        try:
+            with open(path, 'rb') as stream:
+                report = ingest_instrument_file(stream, filename=name)
+            target = 'processed'
+        except InstrumentFileError as exc:
+            report = {'file': name, 'error': str(exc)}
+            target = 'failed'
+        except Exception as exc:
+            # Park the file so it is not retried forever; batches committed
+            # before the error stay saved and re-ingesting the file is an upsert
+            report = {'file': name, 'error': f"{type(exc).__name__}: {exc}"}
+            target = 'failed'
+
+        destination = os.path.join(directory, target, name)
+        shutil.move(path, destination)
+        with open(f"{destination}.report.json", 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+        if target == 'failed':
+            self.stdout.write(self.style.ERROR(f"{name}: {report['error']}"))
+            return
+        log_action(None, "create", f"Instrument results imported from {name}", extra=report)
+        self.stdout.write(self.style.SUCCESS(
+            f"{name}: {report['samples']} sample(s), {report['created']} created, "
+            f"{report['updated']} updated, {len(report['skipped'])} skipped"
+        ))
@@ -0,0 +1,19 @@
+"""
+Management command to recompute abnormal flags of stored lab values against current reference ranges
+Usage: python manage.py reflag_results [--analyte K,HB] [--batch-size 1000]
+"""
+from django.core.management.base import BaseCommand
+from lab.ranges import reflag_result_values
+
+
+class Command(BaseCommand):
+    help = 'Re-flag historical LabResultValue rows (H/L/critical) from the compiled reference ranges'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyte', default='', help='Comma-separated analyte codes (default: all with a range)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Values processed per batch')
+
+    def handle(self, *args, **options):
+        analytes = [code for code in options['analyte'].split(',') if code.strip()]
+        checked, changed = reflag_result_values(batch_size=options['batch_size'], analytes=analytes or None)
+        self.stdout.write(self.style.SUCCESS(f"{checked} value(s) checked, {changed} re-flagged"))
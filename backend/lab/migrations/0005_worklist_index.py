@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0004_labtest_price'),
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='laborder',
+            index=models.Index(fields=['status', 'updated_at'], name='lab_laborde_status_8d7d92_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0005_worklist_index'),
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabResultValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analyte_code', models.CharField(max_length=50)),
+                ('analyte_name', models.CharField(blank=True, max_length=100)),
+                ('numeric_value', models.FloatField(blank=True, null=True)),
+                ('value_text', models.CharField(blank=True, max_length=255)),
+                ('unit', models.CharField(blank=True, max_length=30)),
+                ('flag', models.CharField(blank=True, choices=[('', 'Normal'), ('L', 'Low'), ('H', 'High'), ('LL', 'Critical Low'), ('HH', 'Critical High'), ('A', 'Abnormal')], default='', max_length=2)),
+                ('reference_range', models.CharField(blank=True, max_length=100)),
+                ('resulted_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_values', to='lab.laborder')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lab_values', to='patients.patient')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='values', to='lab.labresult')),
+                ('test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='result_values', to='lab.labtest')),
+            ],
+            options={
+                'ordering': ['-resulted_at', 'id'],
+                'indexes': [models.Index(fields=['patient', 'analyte_code', 'resulted_at'], name='lab_labresu_patient_d3e080_idx'), models.Index(fields=['analyte_code', 'numeric_value'], name='lab_labresu_analyte_311bea_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0006_result_values'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='labordertest',
+            options={'ordering': ['created_at', 'id']},
+        ),
+        migrations.CreateModel(
+            name='LabPanel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tests', models.ManyToManyField(blank=True, related_name='panels', to='lab.labtest')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
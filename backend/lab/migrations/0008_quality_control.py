@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0007_lab_panels'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QCLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_number', models.CharField(max_length=50)),
+                ('material', models.CharField(blank=True, max_length=100)),
+                ('level', models.CharField(default='Level 1', max_length=20)),
+                ('instrument', models.CharField(blank=True, max_length=100)),
+                ('analyte_code', models.CharField(max_length=50)),
+                ('unit', models.CharField(blank=True, max_length=30)),
+                ('target_mean', models.FloatField()),
+                ('target_sd', models.FloatField()),
+                ('expiry_date', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='qc_lots', to='lab.labtest')),
+            ],
+            options={
+                'ordering': ['analyte_code', 'level'],
+            },
+        ),
+        migrations.CreateModel(
+            name='QCRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.FloatField()),
+                ('run_at', models.DateTimeField()),
+                ('z_score', models.FloatField(default=0)),
+                ('violations', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('Accepted', 'Accepted'), ('Warning', 'Warning'), ('Rejected', 'Rejected')], default='Accepted', max_length=20)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('review_notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='lab.qclot')),
+                ('performed_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='qc_runs', to=settings.AUTH_USER_MODEL)),
+                ('reviewed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reviewed_qc_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-run_at', '-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='qclot',
+            index=models.Index(fields=['analyte_code', 'is_active'], name='lab_qclot_analyte_c8815e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='qclot',
+            unique_together={('lot_number', 'level', 'analyte_code', 'instrument')},
+        ),
+        migrations.AddIndex(
+            model_name='qcrun',
+            index=models.Index(fields=['lot', 'run_at'], name='lab_qcrun_lot_id_433265_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qcrun',
+            index=models.Index(fields=['status', 'reviewed_at'], name='lab_qcrun_status_ac9699_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lab', '0008_quality_control'),
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CumulativeVersion',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lab_cumulative_version', serialize=False, to='patients.patient')),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
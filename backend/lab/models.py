@@ -49,6 +49,23 @@ class LabTest(models.Model):
         return f"{self.code} - {self.name}"
 
 
+class LabPanel(models.Model):
+    """Named order set (e.g. antenatal profile) that expands to its member tests"""
+    name = models.CharField(max_length=100)
+    code = models.CharField(max_length=20, unique=True)
+    description = models.TextField(blank=True)
+    tests = models.ManyToManyField(LabTest, related_name='panels', blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+
+
 class LabOrder(models.Model):
     """Lab test orders"""
     URGENCY_CHOICES = [
@@ -95,6 +112,7 @@ class LabOrder(models.Model):
         indexes = [
             models.Index(fields=['status', 'urgency']),
             models.Index(fields=['patient', 'created_at']),
+            models.Index(fields=['status', 'updated_at']),
         ]
     
     def __str__(self):
@@ -110,7 +128,7 @@ class LabOrderTest(models.Model):
     
     class Meta:
         unique_together = ['order', 'test']
-        ordering = ['created_at']
+        ordering = ['created_at', 'id']
     
     def __str__(self):
         return f"{self.order} - {self.test.name}"
@@ -152,3 +170,116 @@ class LabResult(models.Model):
     
     def __str__(self):
         return f"Lab Result for Order #{self.order.id}"
+
+
+class LabResultValue(models.Model):
+    """
+    One analyte of a lab result, written alongside LabResult.results_data so
+    values can be trended and searched with indexed queries
+    """
+    FLAG_CHOICES = [
+        ('', 'Normal'),
+        ('L', 'Low'),
+        ('H', 'High'),
+        ('LL', 'Critical Low'),
+        ('HH', 'Critical High'),
+        ('A', 'Abnormal'),
+    ]
+
+    result = models.ForeignKey(LabResult, on_delete=models.CASCADE, related_name='values')
+    order = models.ForeignKey(LabOrder, on_delete=models.CASCADE, related_name='result_values')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='lab_values')
+    test = models.ForeignKey(LabTest, on_delete=models.SET_NULL, null=True, blank=True, related_name='result_values')
+    analyte_code = models.CharField(max_length=50)
+    analyte_name = models.CharField(max_length=100, blank=True)
+    numeric_value = models.FloatField(null=True, blank=True)
+    value_text = models.CharField(max_length=255, blank=True)
+    unit = models.CharField(max_length=30, blank=True)
+    flag = models.CharField(max_length=2, choices=FLAG_CHOICES, blank=True, default='')
+    reference_range = models.CharField(max_length=100, blank=True)
+    resulted_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-resulted_at', 'id']
+        indexes = [
+            models.Index(fields=['patient', 'analyte_code', 'resulted_at']),
+            models.Index(fields=['analyte_code', 'numeric_value']),
+        ]
+
+    def __str__(self):
+        return f"{self.analyte_code} {self.value_text} {self.unit}".strip()
+
+
+class CumulativeVersion(models.Model):
+    """
+    Replaced with a random token whenever one of the patient's results is
+    saved or deleted. Cached cumulative reports are keyed by it, so a change
+    reaches every worker on its next lookup whatever cache backend is
+    configured.
+    """
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='lab_cumulative_version')
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.patient_id}: v{self.version}"
+
+
+class QCLot(models.Model):
+    """Control material lot for one analyte on one analyzer, with its target mean and SD"""
+    lot_number = models.CharField(max_length=50)
+    material = models.CharField(max_length=100, blank=True)
+    level = models.CharField(max_length=20, default='Level 1')
+    instrument = models.CharField(max_length=100, blank=True)
+    test = models.ForeignKey(LabTest, on_delete=models.SET_NULL, null=True, blank=True, related_name='qc_lots')
+    analyte_code = models.CharField(max_length=50)
+    unit = models.CharField(max_length=30, blank=True)
+    target_mean = models.FloatField()
+    target_sd = models.FloatField()
+    expiry_date = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['analyte_code', 'level']
+        unique_together = ['lot_number', 'level', 'analyte_code', 'instrument']
+        indexes = [
+            models.Index(fields=['analyte_code', 'is_active']),
+        ]
+
+    def __str__(self):
+        return f"{self.analyte_code} {self.level} lot {self.lot_number}"
+
+
+class QCRun(models.Model):
+    """One measurement of a control, with the Westgard rules it violates"""
+    STATUS_CHOICES = [
+        ('Accepted', 'Accepted'),
+        ('Warning', 'Warning'),
+        ('Rejected', 'Rejected'),
+    ]
+
+    lot = models.ForeignKey(QCLot, on_delete=models.CASCADE, related_name='runs')
+    value = models.FloatField()
+    run_at = models.DateTimeField()
+    z_score = models.FloatField(default=0)
+    violations = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Accepted')
+    performed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='qc_runs')
+    reviewed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='reviewed_qc_runs'
+    )
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+    review_notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-run_at', '-id']
+        indexes = [
+            models.Index(fields=['lot', 'run_at']),
+            models.Index(fields=['status', 'reviewed_at']),
+        ]
+
+    def __str__(self):
+        return f"QC {self.lot} at {self.run_at}: {self.status}"
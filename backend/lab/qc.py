@@ -0,0 +1,133 @@
+from collections import defaultdict
+from itertools import groupby
+from django.db import transaction
+from django.db.models import F
+from .models import QCRun, LabResultValue
+
+UPDATE_CHUNK_SIZE = 500
+
+# 1-2s only warns; any other violation rejects the run
+WARNING_RULES = {'1-2s'}
+REJECTION_RULES = {'1-3s', '2-2s', 'R-4s', '4-1s', '10x'}
+
+
+def _streak(streak, sign):
+    """Signed run length of consecutive points on the same side (0 breaks it)"""
+    return streak + sign if sign and streak * sign > 0 else sign
+
+
+def westgard(z_scores):
+    """
+    Westgard violations of every point of one control's history, oldest
+    first, in a single pass: each rule only needs the previous point and two
+    running same-side streaks (beyond 1 SD, and of the mean).
+    """
+    violations = []
+    previous = None
+    beyond_1s = same_side = 0
+    for z in z_scores:
+        rules = []
+        if abs(z) > 2:
+            rules.append('1-2s')
+        if abs(z) > 3:
+            rules.append('1-3s')
+        if previous is not None:
+            if (z > 2 and previous > 2) or (z < -2 and previous < -2):
+                rules.append('2-2s')
+            if (z > 2 and previous < -2) or (z < -2 and previous > 2):
+                rules.append('R-4s')
+        sign = (z > 0) - (z < 0)
+        beyond_1s = _streak(beyond_1s, sign if abs(z) > 1 else 0)
+        same_side = _streak(same_side, sign)
+        if abs(beyond_1s) >= 4:
+            rules.append('4-1s')
+        if abs(same_side) >= 10:
+            rules.append('10x')
+        violations.append(rules)
+        previous = z
+    return violations
+
+
+def run_status(rules):
+    if REJECTION_RULES.intersection(rules):
+        return 'Rejected'
+    if WARNING_RULES.intersection(rules):
+        return 'Warning'
+    return 'Accepted'
+
+
+def _update_in_chunks(ids, **changes):
+    for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+        QCRun.objects.filter(pk__in=ids[start:start + UPDATE_CHUNK_SIZE]).update(**changes)
+
+
+def evaluate_qc(lot_ids=None):
+    """
+    Re-evaluate the full history of the given control lots (default: all)
+    against their targets: one query for every run and one pass per lot.
+    Only runs whose outcome changed are written, with one UPDATE per lot
+    target (z-scores computed in SQL) and one per distinct rule outcome.
+    Returns {'runs', 'changed', 'rejected'}.
+    """
+    runs = QCRun.objects.order_by('lot', 'run_at', 'id')
+    if lot_ids is not None:
+        runs = runs.filter(lot__in=lot_ids)
+    rows = runs.values_list(
+        'id', 'lot', 'value', 'z_score', 'violations', 'status', 'lot__target_mean', 'lot__target_sd'
+    )
+
+    rescored = defaultdict(list)  # (mean, sd) -> run IDs whose z-score changed
+    outcomes = defaultdict(list)  # (status, rules) -> run IDs whose outcome changed
+    total, rejected = 0, 0
+    for _, history in groupby(rows, key=lambda row: row[1]):
+        history = list(history)
+        z_scores = [(value - mean) / sd if sd else 0.0 for _, _, value, _, _, _, mean, sd in history]
+        for (pk, _, _, z_score, violations, status, mean, sd), z, rules in zip(
+            history, z_scores, westgard(z_scores)
+        ):
+            total += 1
+            outcome = run_status(rules)
+            rejected += outcome == 'Rejected'
+            if z != z_score:
+                rescored[mean, sd].append(pk)
+            if (rules, outcome) != (violations, status):
+                outcomes[outcome, tuple(rules)].append(pk)
+
+    if not rescored and not outcomes:
+        return {'runs': total, 'changed': 0, 'rejected': rejected}
+    with transaction.atomic():
+        for (mean, sd), ids in rescored.items():
+            _update_in_chunks(ids, z_score=(F('value') - mean) / sd if sd else 0.0)
+        for (outcome, rules), ids in outcomes.items():
+            _update_in_chunks(ids, status=outcome, violations=list(rules))
+
+    changed = {pk for ids in rescored.values() for pk in ids} | {pk for ids in outcomes.values() for pk in ids}
+    return {'runs': total, 'changed': len(changed), 'rejected': rejected}
+
+
+def unreviewed_failures(result):
+    """Rejected, unreviewed QC runs of any analyte reported in this result"""
+    return list(QCRun.objects.filter(
+        status='Rejected',
+        reviewed_at__isnull=True,
+        lot__analyte_code__in=LabResultValue.objects.filter(result=result).values('analyte_code'),
+    ).order_by('run_at').values(
+        'id', 'lot', 'lot__analyte_code', 'lot__level', 'lot__lot_number', 'lot__instrument', 'run_at', 'violations'
+    ))
+
+
+def levey_jennings(lot):
+    """Chart data for one lot: target lines at +/-1, 2 and 3 SD and every run"""
+    mean, sd = lot.target_mean, lot.target_sd
+    return {
+        'lot': lot.pk,
+        'analyte_code': lot.analyte_code,
+        'level': lot.level,
+        'unit': lot.unit,
+        'mean': mean,
+        'sd': sd,
+        'limits': {f'{sign}{n}sd': mean + (n if sign == '+' else -n) * sd for n in (1, 2, 3) for sign in '+-'},
+        'runs': list(lot.runs.order_by('run_at', 'id').values(
+            'id', 'run_at', 'value', 'z_score', 'violations', 'status', 'reviewed_at'
+        )),
+    }
@@ -0,0 +1,314 @@
+import re
+import time
+import uuid
+from collections import namedtuple
+from django.core.cache import cache
+from .models import LabTest, LabResultValue
+from .cumulative import invalidate_cumulative
+
+RANGES_VERSION_KEY = 'lab-reference-ranges:version'
+# Recompile at least this often even without an invalidation, for processes
+# that do not share a cache backend
+RANGES_MAX_AGE = 60 * 5
+
+AGE_UNITS = {'d': 1, 'w': 7, 'm': 30.4375, 'y': 365.25}
+SEXES = {'m': 'Male', 'male': 'Male', 'f': 'Female', 'female': 'Female'}
+
+NUMBER = r'\d*\.?\d+'
+SEGMENT = re.compile(r'\s*(?:(?P<label>[^:()]*?)\s*(?:\((?P<qualifiers>[^)]*)\))?\s*:)?\s*(?P<body>.*)', re.S)
+INTERVAL = re.compile(
+    rf'\s*(?:(?P<low>{NUMBER})\s*(?:-|–|to)\s*(?P<high>{NUMBER})|(?P<op>[<>]=?|≤|≥)\s*(?P<limit>{NUMBER}))\s*(?P<rest>.*)',
+    re.S
+)
+LIMIT = re.compile(rf'(?P<op>[<>]=?|≤|≥)\s*(?P<limit>{NUMBER})')
+CRITICAL = re.compile(r'\bcrit(?:ical)?\b\s*:?', re.I)
+AGE = re.compile(
+    rf'(?:(?P<low>{NUMBER})\s*-\s*(?P<high>{NUMBER})|(?P<op>[<>]=?)\s*(?P<limit>{NUMBER})|(?P<start>{NUMBER})\s*\+)'
+    r'\s*(?P<unit>[a-z]*)'
+)
+
+QUALIFIER_LABELS = set(SEXES) | {'adult', 'child'}
+
+# One compiled interval. Ages are in days, [min_age, max_age); the bounds
+# are inclusive unless the *_strict field is set ('>40' excludes 40).
+ReferenceRange = namedtuple('ReferenceRange', [
+    'sex', 'min_age', 'max_age', 'low', 'low_strict', 'high', 'high_strict',
+    'critical_low', 'critical_high', 'unit', 'text',
+])
+
+
+def analyte_code(name):
+    """'Hemoglobin (Hb)' -> 'HEMOGLOBIN_HB'"""
+    return re.sub(r'[^A-Z0-9]+', '_', str(name).upper()).strip('_')[:50]
+
+
+def _limit(op, value):
+    """(low, low_strict, high, high_strict) for '<5', '>=3' and friends"""
+    value = float(value)
+    if op in ('<', '<=', '≤'):
+        return None, False, value, op == '<'
+    return value, op == '>', None, False
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _age_days(value, unit):
+    return float(value) * AGE_UNITS.get((unit or 'y')[0], AGE_UNITS['y'])
+
+
+def parse_qualifiers(text):
+    """'F, 18-65y' -> ('Female', min_age, max_age); ages default to years"""
+    sex, min_age, max_age = None, None, None
+    for token in re.split(r'[,;/]', text or ''):
+        token = token.strip().lower()
+        if not token:
+            continue
+        if token in SEXES:
+            sex = SEXES[token]
+        elif token == 'adult':
+            min_age = _age_days(18, 'y')
+        elif token == 'child':
+            max_age = _age_days(18, 'y')
+        else:
+            match = AGE.fullmatch(token)
+            if not match:
+                raise ValueError(f"Unknown range qualifier: {token}")
+            unit = match['unit']
+            if match['low'] is not None:
+                min_age = _age_days(match['low'], unit)
+                max_age = _age_days(float(match['high']) + 1, unit)
+            elif match['start'] is not None:
+                min_age = _age_days(match['start'], unit)
+            elif match['op'].startswith('<'):
+                max_age = _age_days(float(match['limit']) + (match['op'] == '<='), unit)
+            else:
+                min_age = _age_days(float(match['limit']) + (match['op'] == '>'), unit)
+    return sex, min_age, max_age
+
+
+def parse_range(text, default_unit=''):
+    """
+    Compile the interval part of one range, e.g. '3.5-5.1 mmol/L critical 2.5-6.5',
+    '<200 mg/dL' or '>40 critical <20'. Returns None for text ranges such as 'Negative'.
+    """
+    normal, *critical = CRITICAL.split(text, maxsplit=1)
+    critical = critical[0] if critical else ''
+    match = INTERVAL.fullmatch(normal.strip())
+    if not match:
+        return None
+    if match['low'] is not None:
+        low, low_strict, high, high_strict = float(match['low']), False, float(match['high']), False
+    else:
+        low, low_strict, high, high_strict = _limit(match['op'], match['limit'])
+
+    critical_low = critical_high = None
+    critical_match = INTERVAL.fullmatch(critical.strip())
+    if critical_match and critical_match['low'] is not None:
+        critical_low, critical_high = float(critical_match['low']), float(critical_match['high'])
+    else:
+        for limit in LIMIT.finditer(critical):
+            if limit['op'].startswith('<') or limit['op'] == '≤':
+                critical_low = float(limit['limit'])
+            else:
+                critical_high = float(limit['limit'])
+
+    return ReferenceRange(
+        sex=None, min_age=None, max_age=None,
+        low=low, low_strict=low_strict, high=high, high_strict=high_strict,
+        critical_low=critical_low, critical_high=critical_high,
+        unit=match['rest'].strip() or default_unit, text=text.strip(),
+    )
+
+
+def parse_ranges(text, default_label=None, default_unit=''):
+    """
+    [(label, ReferenceRange)] for a free-text range list such as
+    'WBC: 4-11 x10^9/L, Hb (M): 13-17 g/dL, Hb (F, 18+y): 12-16 g/dL, K: 3.5-5.1 critical <2.5 >6.5'.
+    A bare qualifier label ('M: 13-17, F: 12-16') applies to default_label.
+    Segments without an interval ('Negative', 'A, B, AB, or O') are skipped.
+    """
+    compiled = []
+    for segment in re.split(r'[,;](?![^(]*\))', text or ''):
+        match = SEGMENT.fullmatch(segment)
+        if not match or not match['body'].strip():
+            continue
+        reference = parse_range(match['body'], default_unit)
+        if reference is None:
+            continue
+        label, qualifiers = (match['label'] or '').strip(), match['qualifiers']
+        if label.lower() in QUALIFIER_LABELS and not qualifiers:
+            label, qualifiers = '', label
+        try:
+            sex, min_age, max_age = parse_qualifiers(qualifiers)
+        except ValueError:
+            continue
+        label = label or default_label
+        if label:
+            compiled.append((label, reference._replace(sex=sex, min_age=min_age, max_age=max_age)))
+    return compiled
+
+
+def _specificity(reference):
+    """Ranges with more qualifiers, then narrower age bands, are tried first"""
+    has_age = reference.min_age is not None or reference.max_age is not None
+    span = (reference.max_age or float('inf')) - (reference.min_age or 0)
+    return -((reference.sex is not None) + has_age), span
+
+
+def compile_reference_ranges(tests):
+    """
+    {(test pk, analyte code): [ReferenceRange]} from each test's normal_range
+    and its parameters' refRange / unit / critLow / critHigh. An unlabelled
+    normal_range belongs to the test's own code (single-value tests).
+    """
+    table = {}
+    for test in tests:
+        entries = [(analyte_code(label), reference)
+                   for label, reference in parse_ranges(test['normal_range'], default_label=test['code'])]
+        for parameter in test['parameters'] or []:
+            if not isinstance(parameter, dict):
+                continue
+            codes = {analyte_code(parameter[key]) for key in ('id', 'name') if parameter.get(key)}
+            for _, reference in parse_ranges(str(parameter.get('refRange') or ''), default_label=test['code'],
+                                             default_unit=str(parameter.get('unit') or '')):
+                overrides = {
+                    field: _number(parameter.get(key))
+                    for field, key in (('critical_low', 'critLow'), ('critical_high', 'critHigh'))
+                    if _number(parameter.get(key)) is not None
+                }
+                entries.extend((code, reference._replace(**overrides)) for code in codes)
+
+        for code, reference in entries:
+            table.setdefault((test['id'], code), []).append(reference)
+    for references in table.values():
+        references.sort(key=_specificity)
+    return table
+
+
+_compiled = {'version': None, 'loaded_at': 0.0, 'table': None}
+
+
+def reference_table():
+    """
+    The compiled lookup table, built once per process and rebuilt after any
+    LabTest change (lab/signals.py bumps the shared version) or RANGES_MAX_AGE.
+    """
+    version = cache.get(RANGES_VERSION_KEY)
+    if version is None:
+        cache.add(RANGES_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(RANGES_VERSION_KEY)
+    if (_compiled['table'] is None or _compiled['version'] != version
+            or time.monotonic() - _compiled['loaded_at'] > RANGES_MAX_AGE):
+        _compiled['table'] = compile_reference_ranges(
+            LabTest.objects.values('id', 'code', 'normal_range', 'parameters')
+        )
+        _compiled['version'] = version
+        _compiled['loaded_at'] = time.monotonic()
+    return _compiled['table']
+
+
+def invalidate_reference_ranges():
+    cache.set(RANGES_VERSION_KEY, uuid.uuid4().hex, None)
+    _compiled['table'] = None
+
+
+def patient_age_days(date_of_birth, on):
+    return (on - date_of_birth).days if date_of_birth else None
+
+
+def _normalize_unit(unit):
+    return re.sub(r'\s+', '', unit or '').lower()
+
+
+def find_range(references, sex, age_days, unit=''):
+    """First (most specific) range matching the patient and the value's unit"""
+    for reference in references:
+        if reference.sex and reference.sex != sex:
+            continue
+        if reference.min_age is not None and (age_days is None or age_days < reference.min_age):
+            continue
+        if reference.max_age is not None and (age_days is None or age_days >= reference.max_age):
+            continue
+        if unit and reference.unit and _normalize_unit(unit) != _normalize_unit(reference.unit):
+            continue
+        return reference
+    return None
+
+
+def classify(value, reference):
+    """'LL', 'L', '', 'H' or 'HH' for a numeric value against one range"""
+    if reference.critical_low is not None and value < reference.critical_low:
+        return 'LL'
+    if reference.critical_high is not None and value > reference.critical_high:
+        return 'HH'
+    if reference.low is not None and (value <= reference.low if reference.low_strict else value < reference.low):
+        return 'L'
+    if reference.high is not None and (value >= reference.high if reference.high_strict else value > reference.high):
+        return 'H'
+    return ''
+
+
+def flag_values(values, sex, date_of_birth, table=None):
+    """
+    Flag a batch of LabResultValue rows (one order, or any rows of one patient)
+    in a single pass over the compiled table. Values with a matching range get
+    the computed flag and, if blank, its reference range text; non-numeric
+    values and analytes without a range keep what was entered.
+    Returns the rows whose flag or reference range changed.
+    """
+    table = reference_table() if table is None else table
+    changed = []
+    for value in values:
+        if value.numeric_value is None:
+            continue
+        reference = find_range(
+            table.get((value.test_id, value.analyte_code), ()),
+            sex, patient_age_days(date_of_birth, value.resulted_at.date()), value.unit
+        )
+        if reference is None:
+            continue
+        flag = classify(value.numeric_value, reference)
+        reference_range = value.reference_range or reference.text[:100]
+        if (flag, reference_range) != (value.flag, value.reference_range):
+            value.flag, value.reference_range = flag, reference_range
+            changed.append(value)
+    return changed
+
+
+def reflag_result_values(batch_size=1000, analytes=None):
+    """
+    Recompute flags of stored values against the current ranges in pk
+    batches: one query and at most one bulk_update per batch, limited to
+    analytes that have a range. Returns (values checked, values changed).
+    """
+    table = reference_table()
+    codes = {code for _, code in table}
+    if analytes:
+        codes &= {analyte_code(code) for code in analytes}
+    values = LabResultValue.objects.filter(
+        analyte_code__in=codes, numeric_value__isnull=False
+    ).select_related('patient').only(
+        'id', 'test', 'patient', 'analyte_code', 'numeric_value', 'unit', 'flag', 'reference_range', 'resulted_at',
+        'patient__gender', 'patient__date_of_birth'
+    ).order_by('pk')
+
+    checked = changed = 0
+    last_pk = 0
+    while True:
+        batch = list(values.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        updated = []
+        for value in batch:
+            updated += flag_values([value], value.patient.gender, value.patient.date_of_birth, table)
+        LabResultValue.objects.bulk_update(updated, ['flag', 'reference_range'])
+        invalidate_cumulative({value.patient_id for value in updated})
+        checked += len(batch)
+        changed += len(updated)
+        last_pk = batch[-1].pk
+    return checked, changed
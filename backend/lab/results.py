@@ -0,0 +1,162 @@
+import re
+from django.db import transaction
+from django.db.models import Prefetch
+from .models import LabResult, LabOrderTest, LabResultValue
+from .ranges import analyte_code, flag_values
+from .cumulative import invalidate_cumulative
+
+NUMBER = re.compile(r'[<>]?=?\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+
+FLAGS = {
+    'n': '', 'normal': '',
+    'l': 'L', 'low': 'L',
+    'h': 'H', 'high': 'H',
+    'll': 'LL', 'critical low': 'LL',
+    'hh': 'HH', 'critical high': 'HH',
+    'a': 'A', 'abnormal': 'A',
+}
+
+# Keys of a test entry that describe the report rather than an analyte
+REPORT_KEYS = {'summary', 'comment', 'comments', 'notes'}
+
+
+def parse_numeric(value):
+    """The number in '5.6', 5.6 or '<0.5'; None for text such as 'Positive'"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER.fullmatch(str(value).strip())
+    return float(match.group(1)) if match else None
+
+
+def normalize_flag(flag):
+    if not flag:
+        return ''
+    return FLAGS.get(str(flag).strip().lower(), 'A')
+
+
+def _parameter(test, key):
+    """The catalog parameter ({id, name, unit, refRange}) a result key refers to"""
+    if test is None:
+        return {}
+    for parameter in test.parameters or []:
+        if not isinstance(parameter, dict):
+            continue
+        if str(key).lower() in (str(parameter.get('id', '')).lower(), str(parameter.get('name', '')).lower()):
+            return parameter
+    return {}
+
+
+def _entries(results_data, tests):
+    """
+    (test, key, raw value) for every analyte in either stored shape:
+    {"<test name or code>": {"summary": ..., "parameters": {key: value}}}
+    as saved by lab entry, or [{"name", "value", "unit", "flag", ...}].
+    """
+    by_name = {}
+    for test in tests:
+        by_name[test.name.lower()] = by_name[test.code.lower()] = test
+    only_test = tests[0] if len(tests) == 1 else None
+
+    if isinstance(results_data, list):
+        for entry in results_data:
+            if isinstance(entry, dict) and entry.get('name'):
+                test = by_name.get(str(entry.get('test', '')).lower(), only_test)
+                yield test, entry['name'], entry
+        return
+    if not isinstance(results_data, dict):
+        return
+
+    for key, value in results_data.items():
+        test = by_name.get(str(key).lower())
+        if test is None:
+            # Flat {analyte: value} for the order's only test
+            yield only_test, key, value
+        elif isinstance(value, dict):
+            parameters = value.get('parameters', value)
+            if not isinstance(parameters, dict):
+                continue
+            for param_key, param_value in parameters.items():
+                if param_key not in REPORT_KEYS:
+                    yield test, param_key, param_value
+        else:
+            yield test, 'result', value
+
+
+def build_result_values(result, tests=None):
+    """
+    Unsaved LabResultValue rows for one result, flagged against the reference
+    ranges in one pass; tests default to the order's
+    """
+    if tests is None:
+        tests = [order_test.test for order_test in result.order.tests.all()]
+
+    values = {}
+    for test, key, raw in _entries(result.results_data, tests):
+        fields = raw if isinstance(raw, dict) else {'value': raw}
+        value = fields.get('value')
+        if value is None or str(value).strip() == '':
+            continue
+        parameter = _parameter(test, key)
+        if key == 'result' and test is not None:
+            code, name = analyte_code(test.code), test.name
+        else:
+            name = parameter.get('name') or str(key)
+            code = analyte_code(fields.get('code') or key)
+        values[(test.pk if test else None, code)] = LabResultValue(
+            result=result,
+            order_id=result.order_id,
+            patient_id=result.order.patient_id,
+            test=test,
+            analyte_code=code,
+            analyte_name=str(name)[:100],
+            numeric_value=parse_numeric(value),
+            value_text=str(value).strip()[:255],
+            unit=str(fields.get('unit') or parameter.get('unit') or '')[:30],
+            flag=normalize_flag(fields.get('flag')),
+            reference_range=str(fields.get('reference_range') or parameter.get('refRange') or '')[:100],
+            resulted_at=result.created_at,
+        )
+    values = list(values.values())
+    patient = result.order.patient
+    flag_values(values, patient.gender, patient.date_of_birth)
+    return values
+
+
+def sync_result_values(result):
+    """Rewrite the normalized values of one result from its JSON"""
+    values = build_result_values(result)
+    with transaction.atomic():
+        LabResultValue.objects.filter(result=result).delete()
+        LabResultValue.objects.bulk_create(values)
+    return values
+
+
+def backfill_result_values(batch_size=500, missing_only=False):
+    """
+    Rebuild the normalized values of historical results in pk batches: one
+    query for each batch of results with their tests, one delete and one
+    bulk_create. Returns (results processed, values written).
+    """
+    results = LabResult.objects.select_related('order__patient').prefetch_related(
+        Prefetch('order__tests', queryset=LabOrderTest.objects.select_related('test'))
+    ).order_by('pk')
+    if missing_only:
+        results = results.filter(values__isnull=True)
+
+    processed = written = 0
+    last_pk = 0
+    while True:
+        batch = list(results.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        values = [value for result in batch for value in build_result_values(result)]
+        with transaction.atomic():
+            LabResultValue.objects.filter(result__in=[result.pk for result in batch]).delete()
+            LabResultValue.objects.bulk_create(values, batch_size=batch_size)
+            invalidate_cumulative({result.order.patient_id for result in batch})
+        processed += len(batch)
+        written += len(values)
+        last_pk = batch[-1].pk
+    return processed, written
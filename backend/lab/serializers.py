@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from django.utils import timezone
-from .models import LabTest, LabOrder, LabOrderTest, LabResult
+from django.db import transaction
+from .models import LabTest, LabPanel, LabOrder, LabOrderTest, LabResult, LabResultValue, QCLot, QCRun
+from .catalog import active_test_ids, expand_order_tests
+from .ranges import analyte_code
 from patients.serializers import PatientSerializer
 
 
@@ -14,6 +17,43 @@ class LabTestSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class LabPanelSerializer(serializers.ModelSerializer):
+    tests = LabTestSerializer(many=True, read_only=True)
+    test_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        write_only=True,
+        required=False
+    )
+
+    class Meta:
+        model = LabPanel
+        fields = [
+            'id', 'name', 'code', 'description', 'tests', 'test_ids',
+            'is_active', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def validate_test_ids(self, value):
+        active = active_test_ids()
+        unknown = [pk for pk in value if pk not in active]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown or inactive test(s): {', '.join(map(str, unknown))}")
+        return list(dict.fromkeys(value))
+
+    def create(self, validated_data):
+        test_ids = validated_data.pop('test_ids', [])
+        panel = LabPanel.objects.create(**validated_data)
+        panel.tests.set(test_ids)
+        return panel
+
+    def update(self, instance, validated_data):
+        test_ids = validated_data.pop('test_ids', None)
+        panel = super().update(instance, validated_data)
+        if test_ids is not None:
+            panel.tests.set(test_ids)
+        return panel
+
+
 class LabOrderTestSerializer(serializers.ModelSerializer):
     test_name = serializers.CharField(source='test.name', read_only=True)
     test_code = serializers.CharField(source='test.code', read_only=True)
@@ -36,7 +76,12 @@ class LabOrderSerializer(serializers.ModelSerializer):
     test_ids = serializers.ListField(
         child=serializers.IntegerField(),
         write_only=True,
-        required=True
+        required=False
+    )
+    panel_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        write_only=True,
+        required=False
     )
     has_result = serializers.SerializerMethodField()
     
@@ -48,7 +93,7 @@ class LabOrderSerializer(serializers.ModelSerializer):
             'clinical_indication', 'special_instructions', 'status',
             'sample_collected_at', 'sample_collected_by', 'sample_collected_by_name',
             'processed_by', 'processed_by_name', 'started_at', 'completed_at',
-            'tests', 'test_ids', 'has_result', 'created_at', 'updated_at'
+            'tests', 'test_ids', 'panel_ids', 'has_result', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'id', 'ordered_by', 'sample_collected_by', 'processed_by',
@@ -74,15 +119,25 @@ class LabOrderSerializer(serializers.ModelSerializer):
     def get_has_result(self, obj):
         return hasattr(obj, 'result')
     
+    def validate(self, attrs):
+        if self.instance is None:
+            # Tests are fixed at creation; panels expand to their member tests here
+            test_ids, errors = expand_order_tests(attrs.get('test_ids', []), attrs.pop('panel_ids', []))
+            if errors:
+                raise serializers.ValidationError(errors)
+            if not test_ids:
+                raise serializers.ValidationError({'test_ids': ['Select at least one test or panel']})
+            attrs['test_ids'] = test_ids
+        return attrs
+    
     def create(self, validated_data):
         test_ids = validated_data.pop('test_ids')
         validated_data['ordered_by'] = self.context['request'].user
         
-        order = LabOrder.objects.create(**validated_data)
-        
-        # Create order tests
-        for test_id in test_ids:
-            LabOrderTest.objects.create(order=order, test_id=test_id)
+        with transaction.atomic():
+            order = LabOrder.objects.create(**validated_data)
+            # One INSERT for every test, panels included
+            LabOrderTest.objects.bulk_create([LabOrderTest(order=order, test_id=test_id) for test_id in test_ids])
         
         return order
 
@@ -125,3 +180,73 @@ class LabResultSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data['performed_by'] = self.context['request'].user
         return super().create(validated_data)
+
+
+class LabResultValueSerializer(serializers.ModelSerializer):
+    test_code = serializers.CharField(source='test.code', read_only=True, default=None)
+
+    class Meta:
+        model = LabResultValue
+        fields = [
+            'id', 'result', 'order', 'patient', 'test', 'test_code', 'analyte_code', 'analyte_name',
+            'numeric_value', 'value_text', 'unit', 'flag', 'reference_range', 'resulted_at'
+        ]
+        read_only_fields = fields
+
+
+class QCLotSerializer(serializers.ModelSerializer):
+    test_code = serializers.CharField(source='test.code', read_only=True, default=None)
+
+    class Meta:
+        model = QCLot
+        fields = [
+            'id', 'lot_number', 'material', 'level', 'instrument', 'test', 'test_code',
+            'analyte_code', 'unit', 'target_mean', 'target_sd', 'expiry_date', 'is_active',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def validate_analyte_code(self, value):
+        code = analyte_code(value)
+        if not code:
+            raise serializers.ValidationError("Analyte code is required")
+        return code
+
+    def validate_target_sd(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Target SD must be greater than zero")
+        return value
+
+
+class QCRunSerializer(serializers.ModelSerializer):
+    analyte_code = serializers.CharField(source='lot.analyte_code', read_only=True)
+    level = serializers.CharField(source='lot.level', read_only=True)
+    performed_by_name = serializers.SerializerMethodField()
+    reviewed_by_name = serializers.SerializerMethodField()
+    run_at = serializers.DateTimeField(required=False)
+
+    class Meta:
+        model = QCRun
+        fields = [
+            'id', 'lot', 'analyte_code', 'level', 'value', 'run_at', 'z_score', 'violations', 'status',
+            'performed_by', 'performed_by_name', 'reviewed_by', 'reviewed_by_name', 'reviewed_at',
+            'review_notes', 'created_at'
+        ]
+        read_only_fields = [
+            'id', 'z_score', 'violations', 'status', 'performed_by', 'reviewed_by', 'reviewed_at',
+            'review_notes', 'created_at'
+        ]
+
+    def get_performed_by_name(self, obj):
+        if obj.performed_by:
+            return f"{obj.performed_by.first_name} {obj.performed_by.last_name}".strip() or obj.performed_by.username
+        return None
+
+    def get_reviewed_by_name(self, obj):
+        if obj.reviewed_by:
+            return f"{obj.reviewed_by.first_name} {obj.reviewed_by.last_name}".strip() or obj.reviewed_by.username
+        return None
+
+    def create(self, validated_data):
+        validated_data.setdefault('run_at', timezone.now())
+        return super().create(validated_data)
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from patients.models import Patient
+from .models import LabTest, LabOrder, LabResult
+from .ranges import invalidate_reference_ranges
+from .cumulative import invalidate_cumulative
+
+
+@receiver(post_save, sender=LabTest)
+@receiver(post_delete, sender=LabTest)
+def lab_test_changed(sender, instance, **kwargs):
+    # normal_range / parameters feed the compiled reference ranges
+    invalidate_reference_ranges()
+
+
+@receiver(post_save, sender=LabResult)
+@receiver(post_delete, sender=LabResult)
+def lab_result_changed(sender, instance, origin=None, **kwargs):
+    # New, edited and verified results change the patient's cumulative report;
+    # deleting the patient takes the cumulative version with it
+    if isinstance(origin, Patient) or getattr(origin, 'model', None) is Patient:
+        return
+    if LabResult.order.is_cached(instance):
+        patient_id = instance.order.patient_id
+    else:
+        patient_id = LabOrder.objects.filter(pk=instance.order_id).values_list('patient_id', flat=True).first()
+    invalidate_cumulative([patient_id])
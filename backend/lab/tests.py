@@ -1,3 +1,586 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, IntegrityError
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from patients.models import Patient
+from notifications.models import Notification
+from .models import (
+    LabTest, LabPanel, LabOrder, LabOrderTest, LabResult, LabResultValue, QCLot, QCRun, CumulativeVersion
+)
+from .ranges import parse_ranges, reference_table
+from .instruments import ingest_instrument_file
+from .management.commands import ingest_lab_results
+from .qc import westgard, evaluate_qc
 
-# Create your tests here.
+
+class LabTestCaseMixin:
+    """Shared fixtures for lab API tests"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='labtech', password='testpass123',
+                                             first_name='Ama', last_name='Owusu')
+        self.client.force_authenticate(user=self.user)
+        self.patient = Patient.objects.create(first_name='Kofi', last_name='Mensah', phone='0240000000',
+                                              date_of_birth='1990-01-01', gender='Male')
+        self.fbc = LabTest.objects.create(name='Full Blood Count', code='FBC')
+
+    def make_order(self, urgency='Normal', status_value='Pending', tests=None):
+        order = LabOrder.objects.create(patient=self.patient, ordered_by=self.user, urgency=urgency,
+                                        clinical_indication='Fever', status=status_value)
+        for test in tests or [self.fbc]:
+            LabOrderTest.objects.create(order=order, test=test)
+        return order
+
+
+class LabWorklistTestCase(LabTestCaseMixin, APITestCase):
+    """Worklist ordering, query count and version token"""
+
+    def test_orders_ranked_by_urgency(self):
+        normal = self.make_order('Normal')
+        urgent = self.make_order('Urgent')
+        emergency = self.make_order('Emergency')
+        collected = self.make_order('Urgent', 'Sample Collected')
+        response = self.client.get('/api/lab/worklist/')
+        self.assertEqual([order['id'] for order in response.data['pending_orders']],
+                         [emergency.id, urgent.id, normal.id])
+        self.assertEqual([order['id'] for order in response.data['sample_collected']], [collected.id])
+        first = response.data['pending_orders'][0]
+        self.assertEqual((first['patient_name'], first['ordered_by_name']), ('Kofi Mensah', 'Ama Owusu'))
+        self.assertEqual(first['tests'][0]['test_code'], 'FBC')
+
+    def test_query_count_is_constant(self):
+        for _ in range(5):
+            self.make_order()
+        with self.assertNumQueries(3):
+            self.client.get('/api/lab/worklist/')
+
+    def test_unchanged_worklist_returns_304(self):
+        order = self.make_order()
+        version = self.client.get('/api/lab/worklist/')['ETag']
+        response = self.client.get('/api/lab/worklist/', HTTP_IF_NONE_MATCH=version)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.post(f'/api/lab/orders/{order.id}/collect-sample/')
+        response = self.client.get('/api/lab/worklist/', HTTP_IF_NONE_MATCH=version)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['sample_collected']), 1)
+
+    def test_version_follows_tests_results_and_patients(self):
+        order = self.make_order()
+
+        def changes(change):
+            version = self.client.get('/api/lab/worklist/')['ETag']
+            change()
+            return self.client.get('/api/lab/worklist/', HTTP_IF_NONE_MATCH=version).status_code
+
+        urinalysis = LabTest.objects.create(name='Urinalysis', code='UA')
+        self.assertEqual(changes(lambda: LabOrderTest.objects.create(order=order, test=urinalysis)),
+                         status.HTTP_200_OK)
+        self.assertEqual(changes(lambda: LabResult.objects.create(order=order, results_data={})),
+                         status.HTTP_200_OK)
+
+        def rename():
+            self.patient.first_name = 'Kwame'
+            self.patient.save()
+        self.assertEqual(changes(rename), status.HTTP_200_OK)
+        self.assertEqual(changes(lambda: None), status.HTTP_304_NOT_MODIFIED)
+
+
+class LabResultValueTestCase(LabTestCaseMixin, APITestCase):
+    """Normalized analyte values written with results and backfilled"""
+
+    def setUp(self):
+        super().setUp()
+        self.fbc.parameters = [{'id': 'hb', 'name': 'Hemoglobin (Hb)', 'unit': 'g/dL', 'refRange': '12-16'}]
+        self.fbc.save()
+        self.potassium = LabTest.objects.create(name='Potassium', code='K')
+
+    def test_result_entry_writes_values(self):
+        order = self.make_order(tests=[self.fbc, self.potassium])
+        response = self.client.post('/api/lab/results/', {
+            'order': order.id,
+            'results_data': {
+                'Full Blood Count': {'summary': 'See parameters', 'parameters': {'hb': '11.2', 'film': 'Normocytic'}},
+                'Potassium': {'summary': '6.4', 'parameters': {'result': '6.4'}},
+            },
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        values = {value.analyte_code: value for value in LabResultValue.objects.filter(order=order)}
+        self.assertEqual(set(values), {'HB', 'FILM', 'K'})
+        self.assertEqual((values['HB'].numeric_value, values['HB'].unit, values['HB'].analyte_name),
+                         (11.2, 'g/dL', 'Hemoglobin (Hb)'))
+        self.assertIsNone(values['FILM'].numeric_value)
+        self.assertEqual(values['K'].test, self.potassium)
+
+    def test_search_by_analyte_and_value(self):
+        for value in ('5.1', '6.3'):
+            order = self.make_order(tests=[self.potassium])
+            self.client.post('/api/lab/results/', {'order': order.id, 'results_data': {'K': value}}, format='json')
+        response = self.client.get('/api/lab/values/', {'analyte': 'k', 'min_value': '6.0'})
+        self.assertEqual([row['value_text'] for row in response.data], ['6.3'])
+        response = self.client.get('/api/lab/values/', {'patient_id': self.patient.id, 'analyte': 'K',
+                                                        'ordering': 'resulted_at'})
+        self.assertEqual([row['numeric_value'] for row in response.data], [5.1, 6.3])
+        response = self.client.get('/api/lab/values/', {'min_value': 'high'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for params in ({'date_from': 'bad'}, {'date_to': '2026-13-45'}):
+            self.assertEqual(self.client.get('/api/lab/values/', params).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/lab/values/', {'date_from': timezone.localdate().isoformat()})
+        self.assertEqual(len(response.data), 2)
+
+    def test_backfill_historical_results(self):
+        order = self.make_order()
+        LabResult.objects.create(order=order, results_data=[
+            {'name': 'Hb', 'value': 17.5, 'unit': 'g/dL', 'flag': 'High'},
+            {'name': 'WBC', 'value': '<0.5', 'flag': 'Low'},
+        ])
+        call_command('backfill_result_values', batch_size=1, stdout=StringIO())
+        values = {value.analyte_code: value for value in LabResultValue.objects.filter(order=order)}
+        self.assertEqual((values['HB'].flag, values['HB'].numeric_value), ('H', 17.5))
+        self.assertEqual((values['WBC'].flag, values['WBC'].numeric_value), ('L', 0.5))
+        call_command('backfill_result_values', stdout=StringIO())
+        self.assertEqual(LabResultValue.objects.filter(order=order).count(), 2)
+
+
+class ReferenceRangeTestCase(LabTestCaseMixin, APITestCase):
+    """Compiled reference ranges and automatic flagging"""
+
+    def setUp(self):
+        super().setUp()
+        self.fbc.normal_range = 'WBC: 4-11 x10^9/L, Hb (M): 13-17 g/dL, Hb (F): 12-16 g/dL, Hb (<12y): 11-13.5 g/dL'
+        self.fbc.save()
+        self.potassium = LabTest.objects.create(name='Potassium', code='K',
+                                                normal_range='3.5-5.1 mmol/L critical <2.5 >6.5')
+
+    def post_result(self, test, results_data):
+        order = self.make_order(tests=[test])
+        self.client.post('/api/lab/results/', {'order': order.id, 'results_data': results_data}, format='json')
+        return {value.analyte_code: value for value in LabResultValue.objects.filter(order=order)}
+
+    def test_parse_ranges(self):
+        (label, reference), = parse_ranges('HDL (F, 18+y): >40 mg/dL')
+        self.assertEqual((label, reference.sex, reference.low, reference.low_strict, reference.unit),
+                         ('HDL', 'Female', 40.0, True, 'mg/dL'))
+        self.assertEqual(parse_ranges('A, B, AB, or O; Rh+ or Rh-'), [])
+        self.assertEqual([ref.sex for _, ref in parse_ranges('M: 13-17, F: 12-16', default_label='HB')],
+                         ['Male', 'Female'])
+
+    def test_flags_use_sex_age_and_critical_limits(self):
+        values = self.post_result(self.fbc, {'Full Blood Count': {'parameters': {'hb': '12.5', 'wbc': '12'}}})
+        self.assertEqual((values['HB'].flag, values['HB'].reference_range), ('L', '13-17 g/dL'))
+        self.assertEqual(values['WBC'].flag, 'H')
+        self.assertEqual(self.post_result(self.potassium, {'K': '6.8'})['K'].flag, 'HH')
+        self.assertEqual(self.post_result(self.potassium, {'K': '4.2'})['K'].flag, '')
+
+        self.patient.date_of_birth = '2020-01-01'
+        self.patient.save()
+        self.assertEqual(self.post_result(self.fbc, {'Full Blood Count': {'parameters': {'hb': '12.5'}}})['HB'].flag, '')
+
+    def test_unit_mismatch_is_not_flagged(self):
+        values = self.post_result(self.potassium, [{'name': 'K', 'test': 'K', 'value': 99, 'unit': 'mg/dL'}])
+        self.assertEqual(values['K'].flag, '')
+
+    def test_catalog_change_invalidates_table_and_reflag(self):
+        reference_table()
+        values = self.post_result(self.potassium, {'K': '5.4'})
+        self.assertEqual(values['K'].flag, 'H')
+        self.potassium.normal_range = '3.5-5.5 mmol/L'
+        self.potassium.save()
+        self.assertEqual(reference_table()[(self.potassium.id, 'K')][0].high, 5.5)
+        call_command('reflag_results', stdout=StringIO())
+        self.assertEqual(LabResultValue.objects.get(pk=values['K'].pk).flag, '')
+
+
+class InstrumentIngestionTestCase(LabTestCaseMixin, APITestCase):
+    """ASTM / HL7 result files matched to orders and upserted in batches"""
+
+    def setUp(self):
+        super().setUp()
+        self.fbc.normal_range = 'WBC: 4-11 x10^9/L, HGB: 12-16 g/dL'
+        self.fbc.save()
+
+    def astm(self, *orders):
+        lines = ['H|\\^&|||XN-550^Sysmex||||||||E1394-97']
+        for number, (order, wbc) in enumerate(orders, start=1):
+            lines += [
+                f'P|{number}',
+                f'O|1|{order.id}||^^^FBC|R',
+                f'R|1|^^^WBC^White cells|{wbc}|x10^9/L|4-11|||F',
+                'R|2|^^^HGB|13.1|g/dL||N||F',
+                'R|3|^^^PLT||x10^9/L|||X',
+            ]
+        lines.append('L|1|N')
+        return SimpleUploadedFile('run.astm', '\r'.join(lines).encode())
+
+    def test_astm_upload_creates_preliminary_results(self):
+        order = self.make_order(status_value='In Progress')
+        response = self.client.post('/api/lab/results/import/', {'file': self.astm((order, '12.4'))})
+        report = response.data['reports'][0]
+        self.assertEqual((report['format'], report['samples'], report['created'], report['values']),
+                         ('ASTM', 1, 1, 2))
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.result.status), ('Completed', 'Preliminary'))
+        values = {value.analyte_code: value for value in order.result.values.all()}
+        self.assertEqual((values['WBC'].numeric_value, values['WBC'].flag, values['WBC'].test), (12.4, 'H', self.fbc))
+
+        # A rerun corrects the value in place
+        report = ingest_instrument_file(self.astm((order, '7.0')), 'rerun.astm')
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+        self.assertEqual(order.result.values.get(analyte_code='WBC').flag, '')
+
+    def test_hl7_and_unmatched_orders(self):
+        order = self.make_order(status_value='Sample Collected')
+        message = '\r'.join([
+            'MSH|^~\\&|LIS|LAB|||20260101120000||ORU^R01|1|P|2.5',
+            'PID|1||UV-2026-00001',
+            f'OBR|1|{order.id}||FBC',
+            'OBX|1|NM|WBC^White cells||3.2|x10^9/L|4-11|L|||F',
+            'OBR|2|999999||FBC',
+            'OBX|1|NM|WBC||5.0|x10^9/L||N|||F',
+        ])
+        report = ingest_instrument_file(SimpleUploadedFile('oru.hl7', message.encode()), 'oru.hl7')
+        self.assertEqual((report['format'], report['created']), ('HL7', 1))
+        self.assertEqual(report['skipped'], [{'order_ref': '999999', 'order_id': 999999, 'reason': 'Order not found'}])
+        self.assertEqual(LabResultValue.objects.get(order=order).flag, 'L')
+
+        response = self.client.post('/api/lab/results/import/', {'file': SimpleUploadedFile('x.txt', b'hello')})
+        self.assertIn('error', response.data['reports'][0])
+
+    def test_query_count_does_not_grow_with_samples(self):
+        reference_table()
+
+        def queries(count):
+            orders = [(self.make_order(status_value='In Progress'), '5.0') for _ in range(count)]
+            with CaptureQueriesContext(connection) as context:
+                ingest_instrument_file(self.astm(*orders), 'run.astm')
+            return len(context)
+        self.assertEqual(queries(2), queries(8))
+
+
+    def test_command_parks_failing_files_and_continues(self):
+        order = self.make_order(status_value='In Progress')
+        real_ingest = ingest_lab_results.ingest_instrument_file
+
+        def ingest(stream, filename='', **kwargs):
+            if filename == 'a-broken.astm':
+                raise IntegrityError('duplicate key value violates unique constraint')
+            return real_ingest(stream, filename, **kwargs)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('a-broken.astm', 'b-run.astm'):
+                with open(os.path.join(directory, name), 'wb') as handle:
+                    handle.write(self.astm((order, '5.0')).read())
+            with mock.patch.object(ingest_lab_results, 'ingest_instrument_file', side_effect=ingest):
+                call_command('ingest_lab_results', dir=directory, stdout=StringIO())
+
+            self.assertEqual(sorted(os.listdir(directory)), ['failed', 'processed'])
+            with open(os.path.join(directory, 'failed', 'a-broken.astm.report.json')) as report:
+                self.assertIn('IntegrityError', json.load(report)['error'])
+            self.assertTrue(os.path.exists(os.path.join(directory, 'processed', 'b-run.astm')))
+        self.assertTrue(LabResult.objects.filter(order=order).exists())
+
+    def test_upload_reports_failing_files_and_continues(self):
+        order = self.make_order(status_value='In Progress')
+
+        def ingest(stream, filename='', **kwargs):
+            if filename == 'broken.astm':
+                raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+            return ingest_instrument_file(stream, filename, **kwargs)
+
+        broken = SimpleUploadedFile('broken.astm', b'\xff')
+        with mock.patch('lab.views.ingest_instrument_file', side_effect=ingest):
+            response = self.client.post('/api/lab/results/import/', {'file': [broken, self.astm((order, '5.0'))]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        failed, imported = response.data['reports']
+        self.assertEqual(failed['file'], 'broken.astm')
+        self.assertIn('UnicodeDecodeError', failed['error'])
+        self.assertEqual(imported['created'], 1)
+
+
+class LabTurnaroundTestCase(LabTestCaseMixin, APITestCase):
+    """Stage percentiles per test / urgency and target breaches"""
+
+    def make_timed_order(self, urgency, collected_after, completed_after=None, created_ago=timedelta(hours=30)):
+        order = self.make_order(urgency, 'Completed' if completed_after else 'Sample Collected')
+        created = timezone.now() - created_ago
+        LabOrder.objects.filter(pk=order.pk).update(
+            created_at=created,
+            sample_collected_at=created + collected_after,
+            started_at=created + collected_after if completed_after else None,
+            completed_at=created + completed_after if completed_after else None,
+        )
+        return order
+
+    def test_percentiles_and_breaches(self):
+        for minutes in (10, 20, 30, 40):
+            self.make_timed_order('Normal', timedelta(minutes=minutes), timedelta(minutes=minutes + 60))
+        late = self.make_timed_order('Emergency', timedelta(minutes=5), created_ago=timedelta(hours=2))
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/lab/turnaround/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        fbc = response.data['by_test'][0]
+        self.assertEqual(fbc['test_code'], 'FBC')
+        self.assertEqual(fbc['order_to_collection'], {'count': 5, 'p50': 20.0, 'p90': 40.0, 'p95': 40.0})
+        normal, = [row for row in response.data['by_urgency'] if row['urgency'] == 'Normal']
+        self.assertEqual(normal['start_to_completion'], {'count': 4, 'p50': 60.0, 'p90': 60.0, 'p95': 60.0})
+        self.assertEqual([row['urgency'] for row in response.data['by_urgency']], ['Emergency', 'Normal'])
+        self.assertEqual([order['id'] for order in response.data['breaching']], [late.id])
+        self.assertEqual(response.data['breaching'][0]['target_minutes'], 60.0)
+
+    def test_invalid_date(self):
+        response = self.client.get('/api/lab/turnaround/', {'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/lab/turnaround/', {'date_from': '2026-13-45'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('date_from', response.data)
+
+
+class BulkOrderActionTestCase(LabTestCaseMixin, APITestCase):
+    """Guarded bulk status transitions"""
+
+    def test_bulk_collect_with_outcomes(self):
+        pending = [self.make_order() for _ in range(3)]
+        done = self.make_order(status_value='Completed')
+        ids = [order.id for order in pending] + [done.id, 999999]
+        with self.assertNumQueries(5):  # savepoint, read, UPDATE, release, audit
+            response = self.client.post('/api/lab/orders/bulk/collect-sample/', {'order_ids': ids}, format='json')
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual([row['outcome'] for row in response.data['results']],
+                         ['updated'] * 3 + ['rejected', 'not_found'])
+        self.assertEqual(LabOrder.objects.filter(status='Sample Collected', sample_collected_by=self.user).count(), 3)
+        self.assertEqual(Notification.objects.get().extra['order_ids'], [order.id for order in pending])
+
+    def test_bulk_start_collects_uncollected_samples(self):
+        pending = self.make_order()
+        collected = self.make_order(status_value='Sample Collected')
+        earlier = timezone.now() - timedelta(hours=1)
+        LabOrder.objects.filter(pk=collected.pk).update(sample_collected_at=earlier)
+        self.client.post('/api/lab/orders/bulk/start-processing/',
+                         {'order_ids': [pending.id, collected.id]}, format='json')
+        pending.refresh_from_db()
+        collected.refresh_from_db()
+        self.assertEqual((pending.status, pending.sample_collected_by, pending.processed_by),
+                         ('In Progress', self.user, self.user))
+        self.assertIsNotNone(pending.sample_collected_at)
+        self.assertEqual((collected.sample_collected_at, collected.sample_collected_by), (earlier, None))
+
+    def test_bulk_cancel_rejects_finished_orders(self):
+        running = self.make_order(status_value='In Progress')
+        cancelled = self.make_order(status_value='Cancelled')
+        done = self.make_order(status_value='Completed')
+        response = self.client.post('/api/lab/orders/bulk/cancel/',
+                                    {'order_ids': [running.id, cancelled.id, done.id]}, format='json')
+        self.assertEqual([row['outcome'] for row in response.data['results']], ['updated', 'rejected', 'rejected'])
+        self.assertEqual(LabOrder.objects.filter(status='Cancelled').count(), 2)
+
+    def test_invalid_requests(self):
+        response = self.client.post('/api/lab/orders/bulk/collect-sample/', {'order_ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/lab/orders/bulk/discard/', {'order_ids': [1]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LabPanelOrderTestCase(LabTestCaseMixin, APITestCase):
+    """Panels expand to their tests; order tests are inserted in bulk"""
+
+    def setUp(self):
+        super().setUp()
+        self.members = [LabTest.objects.create(name=f'Antenatal test {number:02}', code=f'ANC{number}')
+                        for number in range(12)]
+        self.panel = LabPanel.objects.create(name='Antenatal profile', code='ANC')
+        self.panel.tests.set(self.members)
+
+    def order(self, **data):
+        return self.client.post('/api/lab/orders/', {
+            'patient': self.patient.id, 'clinical_indication': 'Booking visit', **data
+        }, format='json')
+
+    def test_panel_order_is_one_insert(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.order(test_ids=[self.fbc.id], panel_ids=[self.panel.id])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([test['test_code'] for test in response.data['tests']],
+                         ['FBC'] + [test.code for test in self.members])
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT INTO "lab_labordertest"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_unknown_and_inactive_tests_are_rejected(self):
+        response = self.order(test_ids=[self.fbc.id, 999999])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('999999', str(response.data['test_ids']))
+        self.assertEqual(self.order(panel_ids=[999999]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.order().status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.fbc.is_active = False
+        self.fbc.save()
+        self.assertEqual(self.order(test_ids=[self.fbc.id]).status_code, status.HTTP_400_BAD_REQUEST)
+        # Changes made by another worker, whose signals never reach this process's cache
+        LabTest.objects.filter(pk=self.fbc.pk).update(is_active=True, updated_at=timezone.now())
+        self.assertEqual(self.order(test_ids=[self.fbc.id]).status_code, status.HTTP_201_CREATED)
+        with mock.patch('django.db.models.signals.post_save.send'):
+            added = LabTest.objects.create(name='Malaria RDT', code='MRDT')
+        self.assertEqual(self.order(test_ids=[added.id]).status_code, status.HTTP_201_CREATED)
+        # Inactive members are dropped from panels
+        self.members[0].is_active = False
+        self.members[0].save()
+        response = self.order(panel_ids=[self.panel.id])
+        self.assertEqual(len(response.data['tests']), 11)
+
+    def test_create_panel(self):
+        response = self.client.post('/api/lab/panels/', {
+            'name': 'Fever workup', 'code': 'FEVER', 'test_ids': [self.fbc.id, self.members[0].id]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['tests']), 2)
+
+
+class CumulativeReportTestCase(LabTestCaseMixin, APITestCase):
+    """Pivoted patient history, cached until results change"""
+
+    def setUp(self):
+        super().setUp()
+        self.potassium = LabTest.objects.create(name='Potassium', code='K', normal_range='3.5-5.1 mmol/L')
+
+    def add_result(self, value, days_ago):
+        order = self.make_order(tests=[self.potassium])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/lab/results/', {'order': order.id, 'results_data': {'K': value}},
+                                        format='json')
+        LabResultValue.objects.filter(result_id=response.data['id']).update(
+            resulted_at=timezone.now() - timedelta(days=days_ago)
+        )
+        return response.data['id']
+
+    def test_matrix_cache_and_invalidation(self):
+        self.add_result('4.0', days_ago=10)
+        latest = self.add_result('5.6', days_ago=2)
+        url = f'/api/lab/patients/{self.patient.id}/cumulative/'
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['dates']), 2)
+        row, = response.data['analytes']
+        self.assertEqual(row['analyte_code'], 'K')
+        self.assertEqual([row['values'][day]['value'] for day in response.data['dates']], ['4.0', '5.6'])
+        self.assertEqual(row['values'][response.data['dates'][1]]['flag'], 'H')
+
+        with self.assertNumQueries(2):  # patient and version lookups; the matrix comes from the cache
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/lab/results/{latest}/verify/')
+        response = self.client.get(url)
+        self.assertEqual(response.data['analytes'][0]['values'][response.data['dates'][1]]['status'], 'Final')
+
+        response = self.client.get(url, {'date_from': (timezone.localdate() - timedelta(days=5)).isoformat()})
+        self.assertEqual(len(response.data['dates']), 1)
+
+    def test_version_lives_in_the_database(self):
+        self.add_result('4.0', days_ago=3)
+        url = f'/api/lab/patients/{self.patient.id}/cumulative/'
+        self.client.get(url)
+        # Another worker edits the value and bumps the version; this process's cache is untouched
+        LabResultValue.objects.update(value_text='4.2')
+        CumulativeVersion.objects.filter(patient=self.patient).update(version='elsewhere')
+        response = self.client.get(url)
+        self.assertEqual(list(response.data['analytes'][0]['values'].values())[0]['value'], '4.2')
+
+        self.patient.delete()
+        self.assertFalse(CumulativeVersion.objects.exists())
+
+    def test_printable_report(self):
+        self.add_result('<b>', days_ago=1)
+        response = self.client.get(f'/api/lab/patients/{self.patient.id}/cumulative/print/')
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertIn(b'Kofi Mensah', response.content)
+        self.assertIn(b'&lt;b&gt;', response.content)
+        self.assertEqual(self.client.get('/api/lab/patients/999999/cumulative/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        for date_from in ('last year', '2026-13-45'):
+            response = self.client.get(f'/api/lab/patients/{self.patient.id}/cumulative/', {'date_from': date_from})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QualityControlTestCase(LabTestCaseMixin, APITestCase):
+    """Westgard evaluation of control runs and the verification block"""
+
+    def setUp(self):
+        super().setUp()
+        self.potassium = LabTest.objects.create(name='Potassium', code='K', normal_range='3.5-5.1 mmol/L')
+        self.lot = QCLot.objects.create(lot_number='L100', analyte_code='K', target_mean=4.0, target_sd=0.1)
+
+    def add_run(self, value):
+        return self.client.post('/api/lab/qc/runs/', {'lot': self.lot.id, 'value': value}, format='json')
+
+    def test_westgard_rules(self):
+        self.assertEqual(westgard([0.5, 2.5]), [[], ['1-2s']])
+        self.assertEqual(westgard([3.5])[0], ['1-2s', '1-3s'])
+        self.assertIn('2-2s', westgard([2.1, 2.2])[1])
+        self.assertIn('R-4s', westgard([2.1, -2.2])[1])
+        self.assertEqual(westgard([1.5, 1.2, -0.5, 1.1, 1.3, 1.4])[-1], [])
+        self.assertEqual(westgard([1.5, 1.2, 1.1, 1.3])[-1], ['4-1s'])
+        ten = westgard([0.3] * 9 + [-0.1] + [0.2] * 10)
+        self.assertEqual(ten[8], [])
+        self.assertEqual(ten[-1], ['10x'])
+
+    def test_run_evaluation_and_review_unblocks_verification(self):
+        order = self.make_order(tests=[self.potassium])
+        result = self.client.post('/api/lab/results/', {'order': order.id, 'results_data': {'K': '4.2'}},
+                                  format='json').data
+
+        self.assertEqual(self.add_run(4.25).data['status'], 'Warning')
+        run = self.add_run(4.23).data
+        self.assertEqual((run['status'], run['violations']), ('Rejected', ['1-2s', '2-2s']))
+        self.assertAlmostEqual(run['z_score'], 2.3)
+
+        response = self.client.post(f"/api/lab/results/{result['id']}/verify/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([failure['id'] for failure in response.data['qc_runs']], [run['id']])
+        response = self.client.patch(f"/api/lab/results/{result['id']}/", {'status': 'Final'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(LabResult.objects.get(pk=result['id']).status, 'Preliminary')
+
+        url = f"/api/lab/qc/runs/{run['id']}/review/"
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'notes': 'Recalibrated, repeat control in range'}, format='json')
+        self.assertEqual(response.data['reviewed_by_name'], 'Ama Owusu')
+        self.assertEqual(self.client.get('/api/lab/qc/runs/', {'unreviewed': 'true', 'status': 'Rejected'}).data,
+                         [])
+        for params in ({'date_from': 'bad'}, {'date_to': '2026-02-30'}):
+            self.assertEqual(self.client.get('/api/lab/qc/runs/', params).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"/api/lab/results/{result['id']}/verify/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_retarget_reevaluates_history(self):
+        for value in (4.0, 4.25, 4.05):
+            self.add_run(value)
+        self.client.patch(f'/api/lab/qc/lots/{self.lot.id}/', {'target_sd': 0.05}, format='json')
+        chart = self.client.get(f'/api/lab/qc/lots/{self.lot.id}/levey-jennings/').data
+        self.assertEqual(chart['limits']['+2sd'], 4.1)
+        self.assertEqual([run['status'] for run in chart['runs']], ['Accepted', 'Rejected', 'Accepted'])
+
+    def test_year_of_runs_evaluates_in_bulk(self):
+        lots = [QCLot.objects.create(lot_number=f'L{level}', level=f'Level {level}', analyte_code='NA',
+                                     target_mean=140, target_sd=2) for level in (1, 2, 3)]
+        start = timezone.now() - timedelta(days=365)
+        QCRun.objects.bulk_create(
+            QCRun(lot=lot, value=140 + (day % 7 - 3), run_at=start + timedelta(days=day))
+            for lot in lots for day in range(365)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            summary = evaluate_qc([lot.pk for lot in lots])
+        self.assertEqual(summary['runs'], 3 * 365)
+        # a single read, then UPDATEs grouped by lot target and by rule outcome rather than per run
+        self.assertEqual(sum(query['sql'].startswith('SELECT') for query in queries.captured_queries), 1)
+        self.assertLess(len(queries), 20)
+        with self.assertNumQueries(1):
+            self.assertEqual(evaluate_qc()['changed'], 0)
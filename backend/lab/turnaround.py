@@ -0,0 +1,126 @@
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q, Count, Window, ExpressionWrapper, DurationField
+from django.db.models.functions import RowNumber, Ceil
+from django.utils import timezone
+from .models import LabOrder, LabOrderTest
+from .worklist import URGENCY_RANK, WORKLIST_BUCKETS
+
+# Stage name -> (start, end) timestamp fields of LabOrder
+STAGES = {
+    'order_to_collection': ('created_at', 'sample_collected_at'),
+    'collection_to_start': ('sample_collected_at', 'started_at'),
+    'start_to_completion': ('started_at', 'completed_at'),
+    'order_to_completion': ('created_at', 'completed_at'),
+}
+PERCENTILES = (50, 90, 95)
+
+DEFAULT_TAT_TARGETS = {
+    'Emergency': timedelta(hours=1),
+    'Urgent': timedelta(hours=4),
+    'Normal': timedelta(hours=24),
+}
+
+
+def tat_targets():
+    """Order-to-completion target per urgency (LAB_TAT_TARGETS overrides)"""
+    return {**DEFAULT_TAT_TARGETS, **getattr(settings, 'LAB_TAT_TARGETS', {})}
+
+
+def _minutes(duration):
+    return round(duration.total_seconds() / 60, 1) if duration is not None else None
+
+
+def stage_percentiles(queryset, group, labels=(), prefix=''):
+    """
+    Nearest-rank percentiles of every stage per group in one query: each
+    stage gets a row number and a count over the group's partition, and only
+    rows sitting at a percentile rank are returned.
+    Returns {group value: {**labels, stage: {'count', 'p50', 'p90', 'p95'}}}.
+    """
+    annotations, windows, at_rank = {}, {}, Q()
+    for stage, (start, end) in STAGES.items():
+        annotations[stage] = ExpressionWrapper(F(f'{prefix}{end}') - F(f'{prefix}{start}'),
+                                               output_field=DurationField())
+        windows[f'{stage}_position'] = Window(
+            RowNumber(), partition_by=[F(group)], order_by=F(stage).asc(nulls_last=True)
+        )
+        windows[f'{stage}_count'] = Window(Count(stage), partition_by=[F(group)])
+        for percentile in PERCENTILES:
+            at_rank |= Q(**{f'{stage}_position': Ceil(F(f'{stage}_count') * percentile / 100.0)})
+
+    rows = queryset.annotate(**annotations).annotate(**windows).filter(at_rank).values(
+        group, *labels, *STAGES, *windows
+    )
+
+    summary = {}
+    for row in rows:
+        stages = summary.setdefault(row[group], {
+            **{label: row[label] for label in labels},
+            **{stage: {'count': 0, **{f'p{percentile}': None for percentile in PERCENTILES}} for stage in STAGES},
+        })
+        for stage in STAGES:
+            count = row[f'{stage}_count']
+            stages[stage]['count'] = count
+            for percentile in PERCENTILES:
+                if count and row[f'{stage}_position'] == math.ceil(count * percentile / 100):
+                    stages[stage][f'p{percentile}'] = _minutes(row[stage])
+    return summary
+
+
+def breaching_orders(now=None):
+    """Open orders already past their urgency's order-to-completion target, oldest first"""
+    now = now or timezone.now()
+    targets = tat_targets()
+    overdue = Q()
+    for urgency, target in targets.items():
+        overdue |= Q(urgency=urgency, created_at__lt=now - target)
+    orders = LabOrder.objects.filter(overdue, status__in=WORKLIST_BUCKETS).order_by('created_at').values(
+        'id', 'patient', 'patient__first_name', 'patient__last_name', 'urgency', 'status', 'created_at'
+    )
+    return [
+        {
+            'id': order['id'],
+            'patient': order['patient'],
+            'patient_name': f"{order['patient__first_name'] or ''} {order['patient__last_name'] or ''}".strip(),
+            'urgency': order['urgency'],
+            'status': order['status'],
+            'created_at': order['created_at'],
+            'elapsed_minutes': _minutes(now - order['created_at']),
+            'target_minutes': _minutes(targets[order['urgency']]),
+            'over_by_minutes': _minutes(now - order['created_at'] - targets[order['urgency']]),
+        }
+        for order in orders
+    ]
+
+
+def turnaround_report(date_from, date_to):
+    """
+    Stage turnaround percentiles (minutes) for orders placed between two
+    dates, per test and per urgency, plus the open orders breaching target.
+    Three queries.
+    """
+    orders = LabOrder.objects.filter(
+        created_at__date__gte=date_from, created_at__date__lte=date_to
+    ).exclude(status='Cancelled')
+    by_test = stage_percentiles(
+        LabOrderTest.objects.filter(order__in=orders), 'test', labels=('test__code', 'test__name'), prefix='order__'
+    )
+    by_urgency = stage_percentiles(orders, 'urgency')
+
+    return {
+        'date_from': date_from,
+        'date_to': date_to,
+        'percentiles': [f'p{percentile}' for percentile in PERCENTILES],
+        'targets': {urgency: _minutes(target) for urgency, target in tat_targets().items()},
+        'by_test': [
+            {'test': test, 'test_code': stages.pop('test__code'), 'test_name': stages.pop('test__name'), **stages}
+            for test, stages in sorted(by_test.items(), key=lambda item: item[1]['test__code'])
+        ],
+        'by_urgency': [
+            {'urgency': urgency, **by_urgency[urgency]}
+            for urgency in sorted(by_urgency, key=lambda urgency: URGENCY_RANK.get(urgency, len(URGENCY_RANK)))
+        ],
+        'breaching': breaching_orders(),
+    }
@@ -8,6 +8,10 @@ urlpatterns = [
     path('tests/', views.LabTestListView.as_view(), name='test-list'),
     path('tests/<int:id>/', views.LabTestDetailView.as_view(), name='test-detail'),
     
+    # Lab Panels (order sets)
+    path('panels/', views.LabPanelListView.as_view(), name='panel-list'),
+    path('panels/<int:id>/', views.LabPanelDetailView.as_view(), name='panel-detail'),
+    
     # Lab Orders
     path('orders/', views.LabOrderListView.as_view(), name='order-list'),
     path('orders/<int:id>/', views.LabOrderDetailView.as_view(), name='order-detail'),
@@ -19,13 +23,27 @@ urlpatterns = [
     path('orders/<int:order_id>/collect-sample/', views.collect_sample_view, name='collect-sample'),
     path('orders/<int:order_id>/start-processing/', views.start_processing_view, name='start-processing'),
     path('orders/<int:order_id>/cancel/', views.cancel_order_view, name='cancel-order'),
+    path('orders/bulk/<slug:action>/', views.bulk_order_action_view, name='bulk-order-action'),
     
     # Lab Results
     path('results/', views.LabResultListView.as_view(), name='result-list'),
     path('results/<int:id>/', views.LabResultDetailView.as_view(), name='result-detail'),
     path('results/by-order/<int:order_id>/', views.result_by_order_view, name='result-by-order'),
     path('results/<int:result_id>/verify/', views.verify_result_view, name='verify-result'),
+    path('values/', views.LabResultValueListView.as_view(), name='value-list'),
+    path('results/import/', views.ingest_instrument_results_view, name='result-import'),
+    path('patients/<int:patient_id>/cumulative/', views.cumulative_report_view, name='cumulative-report'),
+    path('patients/<int:patient_id>/cumulative/print/', views.cumulative_report_print_view,
+         name='cumulative-report-print'),
+    
+    # Quality Control
+    path('qc/lots/', views.QCLotListView.as_view(), name='qc-lot-list'),
+    path('qc/lots/<int:id>/', views.QCLotDetailView.as_view(), name='qc-lot-detail'),
+    path('qc/lots/<int:id>/levey-jennings/', views.qc_levey_jennings_view, name='qc-levey-jennings'),
+    path('qc/runs/', views.QCRunListView.as_view(), name='qc-run-list'),
+    path('qc/runs/<int:run_id>/review/', views.review_qc_run_view, name='qc-run-review'),
     
     # Lab Statistics
     path('statistics/', views.lab_statistics_view, name='statistics'),
+    path('turnaround/', views.lab_turnaround_view, name='turnaround'),
 ]
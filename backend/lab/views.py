@@ -1,18 +1,50 @@
+from datetime import timedelta
 from rest_framework import generics, permissions, status, filters
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 from django.db.models import Q, Count, Prefetch
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 
 from notifications.audit import log_action
-from .models import LabTest, LabOrder, LabOrderTest, LabResult
+from .models import LabTest, LabPanel, LabOrder, LabOrderTest, LabResult, LabResultValue, QCLot, QCRun
 from .serializers import (
     LabTestSerializer,
+    LabPanelSerializer,
     LabOrderSerializer,
     LabResultSerializer,
+    LabResultValueSerializer,
+    QCLotSerializer,
+    QCRunSerializer,
 )
+from .results import analyte_code, sync_result_values
+from .instruments import ingest_instrument_file, InstrumentFileError
+from .turnaround import turnaround_report
+from .bulk import bulk_transition, TRANSITIONS, MAX_BULK_ORDERS
+from .cumulative import cumulative_report, render_cumulative_html, DEFAULT_WINDOW_DAYS
+from .qc import evaluate_qc, unreviewed_failures, levey_jennings
+from patients.models import Patient
+from .worklist import build_worklist, worklist_version
+
+
+def _query_date(params, param, default=None):
+    """?param as a date, default when absent; a 400 field error when it is not a real date"""
+    value = params.get(param, None)
+    if not value:
+        return default
+    try:
+        parsed = parse_date(value)
+    except ValueError:  # well formed but impossible, e.g. 2026-02-30
+        parsed = None
+    if parsed is None:
+        raise ValidationError({param: 'Enter a valid date (YYYY-MM-DD)'})
+    return parsed
 
 
 # ============ LAB TESTS (CATALOG) ============
@@ -62,6 +94,52 @@ class LabTestDetailView(generics.RetrieveUpdateDestroyAPIView):
         )
         instance.delete()
 
+# ============ LAB PANELS (ORDER SETS) ============
+
+class LabPanelListView(generics.ListCreateAPIView):
+    """GET: List lab panels with their tests, POST: Create panel (test_ids)"""
+    serializer_class = LabPanelSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
+    search_fields = ['name', 'code']
+    filterset_fields = ['is_active']
+    ordering_fields = ['name', 'created_at']
+    ordering = ['name']
+
+    def get_queryset(self):
+        queryset = LabPanel.objects.prefetch_related('tests')
+        show_inactive = self.request.query_params.get('show_inactive', 'false').lower() == 'true'
+        if not show_inactive:
+            queryset = queryset.filter(is_active=True)
+        return queryset
+
+    def perform_create(self, serializer):
+        instance = serializer.save()
+        log_action(
+            self.request.user,
+            "create",
+            f"Lab panel created: {instance.name} ({instance.code})",
+            extra={"panel_id": instance.id}
+        )
+
+
+class LabPanelDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """GET/PUT/PATCH/DELETE: Single lab panel operations"""
+    queryset = LabPanel.objects.prefetch_related('tests')
+    serializer_class = LabPanelSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'id'
+
+    def perform_destroy(self, instance):
+        log_action(
+            self.request.user,
+            "delete",
+            f"Lab panel deleted: {instance.name} ({instance.code})",
+            extra={"panel_id": instance.id}
+        )
+        instance.delete()
+
+
 # ============ LAB ORDERS ============
 
 class LabOrderListView(generics.ListCreateAPIView):
@@ -127,43 +205,19 @@ class LabOrderDetailView(generics.RetrieveUpdateDestroyAPIView):
 @permission_classes([permissions.IsAuthenticated])
 def lab_worklist_view(request):
     """
-    GET: Retrieve lab worklist with pending, sample_collected, and in_progress orders
-    Returns empty arrays for each category if no data exists
+    GET: Retrieve lab worklist with pending, sample_collected, and in_progress orders,
+    each ordered Emergency > Urgent > Normal, then by time in queue.
+    Returns empty arrays for each category if no data exists. Send the returned
+    ETag back as If-None-Match to get 304 Not Modified while nothing has changed.
     """
-    # Pending orders (waiting for sample collection)
-    pending_orders = LabOrder.objects.filter(
-        status='Pending'
-    ).select_related(
-        'patient', 'ordered_by'
-    ).prefetch_related(
-        Prefetch('tests', queryset=LabOrderTest.objects.select_related('test'))
-    ).order_by('urgency', 'created_at')
-    
-    # Sample collected (ready for processing)
-    sample_collected = LabOrder.objects.filter(
-        status='Sample Collected'
-    ).select_related(
-        'patient', 'ordered_by', 'sample_collected_by'
-    ).prefetch_related(
-        Prefetch('tests', queryset=LabOrderTest.objects.select_related('test'))
-    ).order_by('urgency', 'sample_collected_at')
-    
-    # In progress (currently being processed)
-    in_progress = LabOrder.objects.filter(
-        status='In Progress'
-    ).select_related(
-        'patient', 'ordered_by', 'processed_by'
-    ).prefetch_related(
-        Prefetch('tests', queryset=LabOrderTest.objects.select_related('test'))
-    ).order_by('urgency', 'started_at')
-    
-    serializer_context = {'request': request}
-    
-    return Response({
-        'pending_orders': LabOrderSerializer(pending_orders, many=True, context=serializer_context).data,
-        'sample_collected': LabOrderSerializer(sample_collected, many=True, context=serializer_context).data,
-        'in_progress': LabOrderSerializer(in_progress, many=True, context=serializer_context).data,
-    })
+    version = worklist_version()
+    if version in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({'version': version, **build_worklist()})
+    response['ETag'] = version
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 # ============ LAB ORDER ACTIONS ============
@@ -256,8 +310,55 @@ def cancel_order_view(request, order_id):
     return Response(serializer.data)
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_order_action_view(request, action):
+    """
+    POST {"order_ids": [...]}: collect-sample, start-processing or cancel many
+    orders at once. Orders not in a valid status are left alone; returns a
+    compact outcome per ID.
+    """
+    if action not in TRANSITIONS:
+        return Response(
+            {'detail': f"Unknown action: {action}"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    order_ids = request.data.get('order_ids')
+    if (not isinstance(order_ids, list) or not order_ids
+            or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in order_ids)):
+        return Response(
+            {'detail': 'order_ids must be a non-empty list of order IDs'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(order_ids) > MAX_BULK_ORDERS:
+        return Response(
+            {'detail': f"At most {MAX_BULK_ORDERS} orders per request"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    outcomes, updated = bulk_transition(action, order_ids, request.user)
+    if updated:
+        log_action(
+            request.user,
+            "update",
+            f"{TRANSITIONS[action][3]} {len(updated)} LabOrder(s)",
+            extra={"action": action, "order_ids": updated}
+        )
+    return Response({'updated': len(updated), 'results': outcomes})
+
+
 # ============ LAB RESULTS ============
 
+QC_BLOCKED_DETAIL = 'Quality control failed for this result; review the rejected QC runs before verifying'
+
+
+def _ensure_qc_reviewed(result):
+    """Refuse to finalise a result while a rejected QC run of its analytes is unreviewed"""
+    failures = unreviewed_failures(result)
+    if failures:
+        raise ValidationError({'detail': QC_BLOCKED_DETAIL, 'qc_runs': failures})
+
+
 class LabResultListView(generics.ListCreateAPIView):
     """GET: List lab results, POST: Create new lab result"""
     serializer_class = LabResultSerializer
@@ -290,8 +391,12 @@ class LabResultListView(generics.ListCreateAPIView):
         
         return queryset
     
+    @transaction.atomic
     def perform_create(self, serializer):
         result = serializer.save(performed_by=self.request.user)
+        sync_result_values(result)
+        if result.status == 'Final':
+            _ensure_qc_reviewed(result)
         
         # Update order status to completed
         order = result.order
@@ -313,6 +418,55 @@ class LabResultDetailView(generics.RetrieveUpdateDestroyAPIView):
             Prefetch('order__tests', queryset=LabOrderTest.objects.select_related('test'))
         )
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        result = serializer.save()
+        if 'results_data' in serializer.validated_data:
+            sync_result_values(result)
+        if serializer.validated_data.get('status') == 'Final':
+            _ensure_qc_reviewed(result)
+
+
+class LabResultValueListView(generics.ListAPIView):
+    """
+    GET: Normalized analyte values, newest first. Filter with patient_id and
+    analyte for a trend, or analyte with min_value / max_value to search.
+    """
+    serializer_class = LabResultValueSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['flag', 'test']
+    ordering_fields = ['resulted_at', 'numeric_value']
+    ordering = ['-resulted_at', 'id']
+
+    def get_queryset(self):
+        queryset = LabResultValue.objects.select_related('test')
+
+        patient_id = self.request.query_params.get('patient_id', None)
+        if patient_id:
+            queryset = queryset.filter(patient_id=patient_id)
+
+        analyte = self.request.query_params.get('analyte', None)
+        if analyte:
+            queryset = queryset.filter(analyte_code__in=[analyte_code(code) for code in analyte.split(',')])
+
+        for param, lookup in (('min_value', 'numeric_value__gte'), ('max_value', 'numeric_value__lte')):
+            value = self.request.query_params.get(param, None)
+            if value:
+                try:
+                    queryset = queryset.filter(**{lookup: float(value)})
+                except ValueError:
+                    raise ValidationError({'detail': f"{param} must be a number"})
+
+        date_from = _query_date(self.request.query_params, 'date_from')
+        date_to = _query_date(self.request.query_params, 'date_to')
+        if date_from:
+            queryset = queryset.filter(resulted_at__date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(resulted_at__date__lte=date_to)
+
+        return queryset
+
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -352,6 +506,13 @@ def verify_result_view(request, result_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    failures = unreviewed_failures(result)
+    if failures:
+        return Response(
+            {'detail': QC_BLOCKED_DETAIL, 'qc_runs': failures},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
     result.status = 'Final'
     result.verified_by = request.user
     result.verified_at = timezone.now()
@@ -362,40 +523,245 @@ def verify_result_view(request, result_id):
     return Response(serializer.data)
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def ingest_instrument_results_view(request):
+    """
+    POST: Upload analyzer result files (multipart 'file', repeatable) in ASTM
+    E1394 or HL7 v2 format. Samples are matched to lab orders by order ID and
+    saved as Preliminary results; returns one processing report per file,
+    with an error instead for a file that could not be ingested.
+    """
+    uploads = request.FILES.getlist('file')
+    if not uploads:
+        return Response(
+            {'detail': 'Upload at least one result file as "file"'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    reports = []
+    for upload in uploads:
+        try:
+            report = ingest_instrument_file(upload, filename=upload.name, user=request.user)
+        except InstrumentFileError as exc:
+            reports.append({'file': upload.name, 'error': str(exc)})
+            continue
+        except Exception as exc:
+            # Like ingest_lab_results: one bad file must not lose the others' reports;
+            # batches committed before the error stay saved
+            reports.append({'file': upload.name, 'error': f"{type(exc).__name__}: {exc}"})
+            continue
+        log_action(request.user, "create", f"Instrument results imported from {upload.name}", extra=report)
+        reports.append(report)
+    return Response({'reports': reports})
+
+
+def _cumulative_for_request(request, patient_id):
+    """(patient, report) for ?date_from=&date_to=&analyte="""
+    patient = get_object_or_404(Patient, pk=patient_id)
+    today = timezone.localdate()
+    date_from = _query_date(request.query_params, 'date_from', today - timedelta(days=DEFAULT_WINDOW_DAYS))
+    date_to = _query_date(request.query_params, 'date_to', today)
+    analytes = [analyte_code(code) for code in request.query_params.get('analyte', '').split(',') if code.strip()]
+    return patient, cumulative_report(patient.pk, date_from, date_to, analytes)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def cumulative_report_view(request, patient_id):
+    """
+    GET: A patient's results as an analytes x dates matrix over
+    ?date_from=&date_to= (default: the last year), optionally ?analyte=K,HB.
+    Cached per patient until a result of theirs is added, edited or verified.
+    """
+    patient, report = _cumulative_for_request(request, patient_id)
+    return Response({
+        'patient': patient.pk,
+        'patient_name': patient.name,
+        'patient_mrn': patient.mrn,
+        **report,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def cumulative_report_print_view(request, patient_id):
+    """GET: Printable HTML of the cumulative report (same parameters)"""
+    patient, report = _cumulative_for_request(request, patient_id)
+    return HttpResponse(render_cumulative_html(patient, report), content_type='text/html; charset=utf-8')
+
+
+# ============ QUALITY CONTROL ============
+
+class QCLotListView(generics.ListCreateAPIView):
+    """GET: List control lots (active only unless show_inactive=true), POST: Create lot"""
+    serializer_class = QCLotSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [filters.SearchFilter, DjangoFilterBackend, filters.OrderingFilter]
+    search_fields = ['lot_number', 'analyte_code', 'material', 'instrument']
+    filterset_fields = ['analyte_code', 'level', 'instrument', 'test']
+    ordering_fields = ['analyte_code', 'expiry_date', 'created_at']
+    ordering = ['analyte_code', 'level']
+
+    def get_queryset(self):
+        queryset = QCLot.objects.select_related('test')
+        show_inactive = self.request.query_params.get('show_inactive', 'false').lower() == 'true'
+        if not show_inactive:
+            queryset = queryset.filter(is_active=True)
+        return queryset
+
+    def perform_create(self, serializer):
+        instance = serializer.save()
+        log_action(
+            self.request.user,
+            "create",
+            f"QC lot created: {instance}",
+            extra={"qc_lot_id": instance.id}
+        )
+
+
+class QCLotDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """GET/PUT/PATCH/DELETE: Single control lot; new targets re-evaluate its runs"""
+    queryset = QCLot.objects.select_related('test')
+    serializer_class = QCLotSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'id'
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        instance = serializer.save()
+        if {'target_mean', 'target_sd'} & set(serializer.validated_data):
+            evaluate_qc([instance.pk])
+
+    def perform_destroy(self, instance):
+        log_action(
+            self.request.user,
+            "delete",
+            f"QC lot deleted: {instance}",
+            extra={"qc_lot_id": instance.id}
+        )
+        instance.delete()
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def qc_levey_jennings_view(request, id):
+    """GET: Levey-Jennings chart data of a control lot (target lines and every run)"""
+    lot = get_object_or_404(QCLot, pk=id)
+    return Response(levey_jennings(lot))
+
+
+class QCRunListView(generics.ListCreateAPIView):
+    """
+    GET: Control runs, newest first; filter by lot, status, analyte and
+    unreviewed=true. POST: Record a run (lot, value, optional run_at); the
+    lot's history is re-evaluated against the Westgard rules.
+    """
+    serializer_class = QCRunSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['lot', 'status']
+    ordering_fields = ['run_at', 'created_at']
+    ordering = ['-run_at', '-id']
+
+    def get_queryset(self):
+        queryset = QCRun.objects.select_related('lot', 'performed_by', 'reviewed_by')
+
+        analyte = self.request.query_params.get('analyte', None)
+        if analyte:
+            queryset = queryset.filter(lot__analyte_code__in=[analyte_code(code) for code in analyte.split(',')])
+
+        if self.request.query_params.get('unreviewed', 'false').lower() == 'true':
+            queryset = queryset.filter(reviewed_at__isnull=True)
+
+        date_from = _query_date(self.request.query_params, 'date_from')
+        date_to = _query_date(self.request.query_params, 'date_to')
+        if date_from:
+            queryset = queryset.filter(run_at__date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(run_at__date__lte=date_to)
+
+        return queryset
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        instance = serializer.save(performed_by=self.request.user)
+        evaluate_qc([instance.lot_id])
+        instance.refresh_from_db(fields=['z_score', 'violations', 'status'])
+        if instance.status == 'Rejected':
+            log_action(
+                self.request.user,
+                "create",
+                f"QC run rejected for {instance.lot}: {', '.join(instance.violations)}",
+                extra={"qc_run_id": instance.id}
+            )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def review_qc_run_view(request, run_id):
+    """
+    POST: Review a control run (notes: corrective action taken). Reviewing a
+    rejected run releases verification of results for its analyte.
+    """
+    try:
+        run = QCRun.objects.select_related('lot').get(id=run_id)
+    except QCRun.DoesNotExist:
+        return Response(
+            {'detail': 'QC run not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if run.reviewed_at:
+        return Response(
+            {'detail': 'QC run is already reviewed'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    notes = (request.data.get('notes') or '').strip()
+    if run.status == 'Rejected' and not notes:
+        return Response(
+            {'detail': 'Describe the corrective action in notes to review a rejected run'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    run.reviewed_by = request.user
+    run.reviewed_at = timezone.now()
+    run.review_notes = notes
+    run.save(update_fields=['reviewed_by', 'reviewed_at', 'review_notes'])
+    log_action(request.user, "update", f"Reviewed QC run {run_id} ({run.status})", extra={"qc_run_id": run.id})
+
+    serializer = QCRunSerializer(run, context={'request': request})
+    return Response(serializer.data)
+
+
 # ============ LAB STATISTICS ============
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def lab_statistics_view(request):
-    """GET: Retrieve lab statistics for dashboard"""
+    """GET: Retrieve lab statistics for dashboard (one aggregate query)"""
     today = timezone.now().date()
-    
-    # Total orders today
-    orders_today = LabOrder.objects.filter(created_at__date=today).count()
-    
-    # Pending orders
-    pending_count = LabOrder.objects.filter(status='Pending').count()
-    
-    # Sample collected
-    sample_collected_count = LabOrder.objects.filter(status='Sample Collected').count()
-    
-    # In progress
-    in_progress_count = LabOrder.objects.filter(status='In Progress').count()
-    
-    # Completed today
-    completed_today = LabOrder.objects.filter(
-        status='Completed',
-        completed_at__date=today
-    ).count()
-    
-    # Total completed
-    total_completed = LabOrder.objects.filter(status='Completed').count()
-    
-    return Response({
-        'orders_today': orders_today,
-        'pending_count': pending_count,
-        'sample_collected_count': sample_collected_count,
-        'in_progress_count': in_progress_count,
-        'completed_today': completed_today,
-        'total_completed': total_completed,
-    })
+    counts = LabOrder.objects.aggregate(
+        orders_today=Count('id', filter=Q(created_at__date=today)),
+        pending_count=Count('id', filter=Q(status='Pending')),
+        sample_collected_count=Count('id', filter=Q(status='Sample Collected')),
+        in_progress_count=Count('id', filter=Q(status='In Progress')),
+        completed_today=Count('id', filter=Q(status='Completed', completed_at__date=today)),
+        total_completed=Count('id', filter=Q(status='Completed')),
+    )
+    return Response(counts)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def lab_turnaround_view(request):
+    """
+    GET: Turnaround-time percentiles (minutes) per test and per urgency for
+    each stage, over ?date_from=&date_to= (default: the last 30 days), and
+    the open orders currently breaching their urgency's target.
+    """
+    today = timezone.localdate()
+    date_from = _query_date(request.query_params, 'date_from', today - timedelta(days=30))
+    date_to = _query_date(request.query_params, 'date_to', today)
+    return Response(turnaround_report(date_from, date_to))
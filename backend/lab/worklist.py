@@ -0,0 +1,133 @@
+import hashlib
+from datetime import date
+from django.db.models import Case, When, Value, IntegerField, F, Count, Max, Sum, Exists, OuterRef
+from .models import LabOrder, LabOrderTest, LabResult
+
+URGENCY_RANK = {'Emergency': 0, 'Urgent': 1, 'Normal': 2}
+
+# Worklist bucket per open status
+WORKLIST_BUCKETS = {
+    'Pending': 'pending_orders',
+    'Sample Collected': 'sample_collected',
+    'In Progress': 'in_progress',
+}
+
+
+def urgency_rank():
+    return Case(
+        *[When(urgency=urgency, then=Value(rank)) for urgency, rank in URGENCY_RANK.items()],
+        default=Value(len(URGENCY_RANK)),
+        output_field=IntegerField()
+    )
+
+
+def worklist_version():
+    """
+    Token that changes whenever anything shown on the open worklist changes:
+    an order entering, leaving or changing, its tests being added or removed
+    (count and newest ID), its result being created or edited, or its
+    patient or catalog tests being edited. One aggregate over the status
+    index and the orders' joins.
+    """
+    state = LabOrder.objects.filter(status__in=WORKLIST_BUCKETS).aggregate(
+        count=Count('id', distinct=True),
+        id_sum=Sum('id', distinct=True),
+        last_change=Max('updated_at'),
+        test_count=Count('tests', distinct=True),
+        last_test=Max('tests__id'),
+        last_catalog_change=Max('tests__test__updated_at'),
+        result_count=Count('result', distinct=True),
+        last_result_change=Max('result__updated_at'),
+        last_patient_change=Max('patient__updated_at'),
+    )
+    raw = ':'.join(str(state[key]) for key in sorted(state))
+    return f'"{hashlib.sha256(raw.encode()).hexdigest()[:32]}"'
+
+
+def _user_name(first_name, last_name, username):
+    if username is None:
+        return None
+    return f"{first_name or ''} {last_name or ''}".strip() or username
+
+
+def _age(date_of_birth, today):
+    if not date_of_birth:
+        return None
+    return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def open_orders():
+    """
+    Every open order with its queue time in one query ordered by urgency rank
+    (Emergency, Urgent, Normal) then time in queue.
+    """
+    return LabOrder.objects.filter(status__in=WORKLIST_BUCKETS).annotate(
+        urgency_rank=urgency_rank(),
+        queued_at=Case(
+            When(status='Sample Collected', then=F('sample_collected_at')),
+            When(status='In Progress', then=F('started_at')),
+            default=F('created_at'),
+        ),
+        has_result=Exists(LabResult.objects.filter(order=OuterRef('pk'))),
+    ).order_by('urgency_rank', 'queued_at', 'id').values(
+        'id', 'patient', 'patient__first_name', 'patient__last_name', 'patient__mrn',
+        'patient__gender', 'patient__date_of_birth',
+        'ordered_by', 'ordered_by__first_name', 'ordered_by__last_name', 'ordered_by__username',
+        'urgency', 'urgency_rank', 'clinical_indication', 'special_instructions', 'status',
+        'sample_collected_at', 'sample_collected_by', 'sample_collected_by__first_name',
+        'sample_collected_by__last_name', 'sample_collected_by__username',
+        'processed_by', 'processed_by__first_name', 'processed_by__last_name', 'processed_by__username',
+        'started_at', 'completed_at', 'queued_at', 'has_result', 'created_at', 'updated_at',
+    )
+
+
+def build_worklist():
+    """Open orders bucketed by status in memory; two queries in total"""
+    orders = list(open_orders())
+    tests_by_order = {}
+    for test in LabOrderTest.objects.filter(order_id__in=[order['id'] for order in orders]).values(
+        'id', 'order_id', 'test', 'test__name', 'test__code', 'created_at'
+    ).order_by('created_at', 'id'):
+        tests_by_order.setdefault(test['order_id'], []).append({
+            'id': test['id'],
+            'test': test['test'],
+            'test_name': test['test__name'],
+            'test_code': test['test__code'],
+            'created_at': test['created_at'],
+        })
+
+    today = date.today()
+    worklist = {bucket: [] for bucket in WORKLIST_BUCKETS.values()}
+    for order in orders:
+        worklist[WORKLIST_BUCKETS[order['status']]].append({
+            'id': order['id'],
+            'patient': order['patient'],
+            'patient_name': f"{order['patient__first_name'] or ''} {order['patient__last_name'] or ''}".strip(),
+            'patient_mrn': order['patient__mrn'],
+            'patient_gender': order['patient__gender'],
+            'patient_age': _age(order['patient__date_of_birth'], today),
+            'ordered_by': order['ordered_by'],
+            'ordered_by_name': _user_name(order['ordered_by__first_name'], order['ordered_by__last_name'],
+                                          order['ordered_by__username']) or 'Unknown',
+            'urgency': order['urgency'],
+            'urgency_rank': order['urgency_rank'],
+            'clinical_indication': order['clinical_indication'],
+            'special_instructions': order['special_instructions'],
+            'status': order['status'],
+            'sample_collected_at': order['sample_collected_at'],
+            'sample_collected_by': order['sample_collected_by'],
+            'sample_collected_by_name': _user_name(order['sample_collected_by__first_name'],
+                                                   order['sample_collected_by__last_name'],
+                                                   order['sample_collected_by__username']),
+            'processed_by': order['processed_by'],
+            'processed_by_name': _user_name(order['processed_by__first_name'], order['processed_by__last_name'],
+                                            order['processed_by__username']),
+            'started_at': order['started_at'],
+            'completed_at': order['completed_at'],
+            'queued_at': order['queued_at'],
+            'tests': tests_by_order.get(order['id'], []),
+            'has_result': order['has_result'],
+            'created_at': order['created_at'],
+            'updated_at': order['updated_at'],
+        })
+    return worklist
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PermissionsVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='permissions_version', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -1,3 +1,16 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class PermissionsVersion(models.Model):
+    """
+    Replaced with a random token whenever a user is created or their flags,
+    groups or staff profile change. Cached
+    permissions are keyed by it, so a change reaches every worker on its next
+    lookup whatever cache backend is configured.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='permissions_version')
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.user_id}: v{self.version}"
@@ -0,0 +1,70 @@
+import uuid
+from django.core.cache import cache
+from .models import PermissionsVersion
+
+PERMISSIONS_CACHE_TIMEOUT = 60 * 5
+PERMISSIONS_CACHE_SCHEMA = 1  # bump when the shape of the cached dict changes
+
+
+def permissions_cache_key(user_id, version):
+    return f"user-permissions:s{PERMISSIONS_CACHE_SCHEMA}:{user_id}:{version}"
+
+
+def permissions_version(user_id):
+    return PermissionsVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first() or ''
+
+
+def _load_permissions(user):
+    """Read role, groups and staff profile in two queries"""
+    groups = sorted(user.groups.values_list('name', flat=True))
+    profile = user.__class__.objects.filter(pk=user.pk).values(
+        'is_active', 'is_staff', 'is_superuser', 'staff_profile__id', 'staff_profile__role'
+    ).first() or {}
+    return {
+        'user_id': user.pk,
+        'is_active': profile.get('is_active', user.is_active),
+        'is_staff': profile.get('is_staff', user.is_staff),
+        'is_superuser': profile.get('is_superuser', user.is_superuser),
+        'groups': groups,
+        'role': profile.get('staff_profile__role'),
+        'staff_profile_id': profile.get('staff_profile__id'),
+    }
+
+
+def get_user_permissions(user):
+    """
+    Resolved role, groups and staff profile for a user. Cached per user
+    under their permissions version, which users/signals.py replaces in the
+    database when any of them change, so one indexed read per request is
+    enough to never serve revoked permissions from any worker's cache. The
+    result is kept on the user object so a request resolves it at most once.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    resolved = getattr(user, '_resolved_permissions', None)
+    if resolved is None:
+        key = permissions_cache_key(user.pk, permissions_version(user.pk))
+        resolved = cache.get(key)
+        if resolved is None:
+            resolved = _load_permissions(user)
+            cache.set(key, resolved, PERMISSIONS_CACHE_TIMEOUT)
+        user._resolved_permissions = resolved
+    return resolved
+
+
+def invalidate_user_permissions(user_id):
+    """New permissions version for the user; cached entries under the old one are never read again"""
+    PermissionsVersion.objects.update_or_create(user_id=user_id, defaults={'version': uuid.uuid4().hex})
+
+
+def is_admin(user):
+    """Superusers and members of the 'admin' group (any case)"""
+    resolved = get_user_permissions(user)
+    if resolved is None:
+        return False
+    return resolved['is_superuser'] or any(group.lower() == 'admin' for group in resolved['groups'])
+
+
+def user_role(user):
+    resolved = get_user_permissions(user)
+    return resolved['role'] if resolved else None
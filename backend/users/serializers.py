@@ -1,5 +1,6 @@
 # users/serializers.py
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .permissions import is_admin, user_role
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
@@ -25,6 +26,8 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
             "email": user.email,
             "is_staff": user.is_staff,
             "is_superuser": user.is_superuser,
+            "role": user_role(user),
+            "is_admin": is_admin(user),
         })
 
         return data
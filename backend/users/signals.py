@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from staff.models import StaffProfile
+from .permissions import invalidate_user_permissions
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Covers is_active / is_staff / is_superuser changes, and gives a new user
+    # a version no earlier user with the same ID had; logins only touch last_login
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        invalidate_user_permissions(instance.pk)
+
+
+@receiver(post_save, sender=StaffProfile)
+@receiver(post_delete, sender=StaffProfile)
+def staff_profile_changed(sender, instance, origin=None, **kwargs):
+    # Not when the profile goes with its user: the user's version row is deleted too
+    if not isinstance(origin, User):
+        invalidate_user_permissions(instance.user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # group.user_set.clear() does not pass the affected users
+        for user_id in instance.user_set.values_list('pk', flat=True):
+            invalidate_user_permissions(user_id)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            invalidate_user_permissions(instance.pk)
+        else:
+            for user_id in pk_set or ():
+                invalidate_user_permissions(user_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        for user_id in instance.user_set.values_list('pk', flat=True):
+            invalidate_user_permissions(user_id)
@@ -1,3 +1,59 @@
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APITestCase
+from staff.models import StaffProfile
+from .permissions import get_user_permissions, is_admin, permissions_cache_key, permissions_version
 
-# Create your tests here.
+
+class UserPermissionsCacheTestCase(TestCase):
+    """Resolved roles and groups are cached and dropped when they change"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='nurse', password='testpass123')
+        StaffProfile.objects.create(user=self.user, username='nurse', role='Clinician')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_second_lookup_is_served_from_cache(self):
+        get_user_permissions(self.fresh_user())
+        user = self.fresh_user()
+        with self.assertNumQueries(1):  # the permissions version
+            self.assertEqual(get_user_permissions(user)['role'], 'Clinician')
+            self.assertFalse(is_admin(user))
+
+    def test_group_membership_invalidates(self):
+        self.assertFalse(is_admin(self.fresh_user()))
+        version = permissions_version(self.user.pk)
+        admins = Group.objects.create(name='Admin')
+        self.user.groups.add(admins)
+        # The entry under the old version stays in this (or another worker's)
+        # cache but is never read again
+        self.assertFalse(cache.get(permissions_cache_key(self.user.pk, version))['groups'])
+        self.assertTrue(is_admin(self.fresh_user()))
+        admins.user_set.clear()
+        self.assertFalse(is_admin(self.fresh_user()))
+
+    def test_profile_and_active_changes_invalidate(self):
+        get_user_permissions(self.fresh_user())
+        profile = StaffProfile.objects.get(user=self.user)
+        profile.role = 'Lab'
+        profile.save()
+        self.assertEqual(get_user_permissions(self.fresh_user())['role'], 'Lab')
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(get_user_permissions(self.fresh_user())['is_active'])
+
+        self.user.delete()
+        self.assertFalse(User.objects.exists())
+
+
+class LoginClaimsTestCase(APITestCase):
+    def test_login_returns_role(self):
+        user = User.objects.create_user(username='labtech', password='testpass123')
+        StaffProfile.objects.create(user=user, username='labtech', role='Lab')
+        response = self.client.post('/api/auth/login/', {'username': 'labtech', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['role'], 'Lab')
+        self.assertFalse(response.data['is_admin'])
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from django.contrib.auth.models import User  # using Django's default User
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import MyTokenObtainPairSerializer
+from .permissions import get_user_permissions, is_admin, user_role
 from notifications.audit import log_action
 
 # --- Login View (Token generation) ---
@@ -14,12 +15,8 @@ class MyTokenObtainPairView(TokenObtainPairView):
         serializer.is_valid(raise_exception=True)
         user = getattr(serializer, 'user', None)
         username = user.username if user else 'Unknown'
-        # Try to get role from staff profile if it exists
-        role = None
-        if user:
-            staff_profile = getattr(user, 'staff_profile', None)
-            if staff_profile:
-                role = getattr(staff_profile, 'role', None)
+        # Role comes from the cached permissions the serializer already resolved
+        role = user_role(user)
         log_action(user, "login", f"User {username} ({role}) logged in.")
         return Response(serializer.validated_data, status=200)
 
@@ -28,6 +25,7 @@ class MyTokenObtainPairView(TokenObtainPairView):
 @permission_classes([IsAuthenticated])
 def get_current_user(request):
     user = request.user
+    permissions = get_user_permissions(user)
     return Response({
         "id": user.id,
         "username": user.username,
@@ -35,6 +33,9 @@ def get_current_user(request):
         "is_staff": user.is_staff,
         "is_superuser": user.is_superuser,
         "date_joined": user.date_joined,
+        "role": permissions['role'],
+        "groups": permissions['groups'],
+        "is_admin": is_admin(user),
     })
 
 @api_view(["POST"])